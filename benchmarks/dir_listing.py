@@ -0,0 +1,137 @@
+"""Syscall count and wall time of a directory listing, before and after scandir.
+
+"before" replays the previous ``_dir_model`` loop (``os.listdir`` + ``lstat``
++ ``ContentsManager.get`` per child), "after" is the scandir engine behind
+``ContentsManager._dir_model``: one ``lstat`` and one ``access`` per child.
+
+Usage::
+
+    python benchmarks/dir_listing.py [n_files]
+"""
+import os
+import stat
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from zasper_py.services.content.contentsManager import ContentsManager
+
+COUNTED = ("stat", "lstat", "access", "listdir", "scandir", "statvfs")
+
+
+class _CountingEntry:
+    """Proxy for ``os.DirEntry`` that counts the stats that hit the disk."""
+
+    def __init__(self, entry, counter):
+        self._entry = entry
+        self._counter = counter
+        self._stat = {}
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def stat(self, *, follow_symlinks=True):
+        # DirEntry caches each stat; only the first call is a syscall
+        if follow_symlinks not in self._stat:
+            self._counter["DirEntry.stat"] += 1
+            self._stat[follow_symlinks] = self._entry.stat(follow_symlinks=follow_symlinks)
+        return self._stat[follow_symlinks]
+
+    def is_dir(self, *, follow_symlinks=True):
+        if self._entry.is_symlink() and follow_symlinks:
+            return stat.S_ISDIR(self.stat().st_mode)
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+
+@contextmanager
+def count_syscalls():
+    counter = Counter()
+    originals = {name: getattr(os, name) for name in COUNTED}
+
+    def wrap(name):
+        func = originals[name]
+
+        def counted(*args, **kwargs):
+            counter[name] += 1
+            result = func(*args, **kwargs)
+            if name == "scandir":
+                return _CountingScandir(result, counter)
+            return result
+
+        return counted
+
+    for name in COUNTED:
+        setattr(os, name, wrap(name))
+    try:
+        yield counter
+    finally:
+        for name, func in originals.items():
+            setattr(os, name, func)
+
+
+class _CountingScandir:
+    def __init__(self, it, counter):
+        self._it = it
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._it.close()
+
+    def __iter__(self):
+        for entry in self._it:
+            yield _CountingEntry(entry, self._counter)
+
+
+def listing_before(cm, path):
+    os_dir = cm._get_os_path(path)
+    contents = []
+    for name in os.listdir(os_dir):
+        os.lstat(os.path.join(os_dir, name))
+        contents.append(cm.get(path=f"{path}/{name}", content=False))
+    return contents
+
+
+def listing_after(cm, path):
+    return cm._dir_model(path, content=True)["content"]
+
+
+def populate(root, n_files):
+    os.makedirs(os.path.join(root, "data"))
+    for i in range(n_files):
+        if i % 50 == 0:
+            os.mkdir(os.path.join(root, "data", f"dir{i}"))
+        elif i % 10 == 0:
+            name = f"nb{i}.ipynb"
+        else:
+            name = f"file{i}.csv"
+        if i % 50:
+            with open(os.path.join(root, "data", name), "w") as f:
+                f.write("x")
+
+
+def run(n_files):
+    with tempfile.TemporaryDirectory() as root:
+        populate(root, n_files)
+        cm = ContentsManager()
+        cm.root_dir = root
+        for label, func in (("before", listing_before), ("after", listing_after)):
+            with count_syscalls() as counter:
+                start = time.perf_counter()
+                models = func(cm, "data")
+                elapsed = time.perf_counter() - start
+            total = sum(counter.values())
+            print(
+                f"{label:>6}: {len(models)} entries, {total} syscalls "
+                f"({total / len(models):.2f}/entry), {elapsed * 1000:.1f} ms"
+            )
+            for name, count in sorted(counter.items()):
+                print(f"        {name:<14} {count}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,119 @@
+"""Encode and decode time of the stdlib JSON path against ``jsonCodec``.
+
+Payloads are a notebook contents model, as served by GET /api/contents
+(code cells with base64 PNG and plotly outputs, datetimes in the model),
+and iopub messages as built by ``Session``: stream output, a display_data
+with an image, and a status message.
+
+"stdlib" is ``json.dumps(..., default=json_default)`` / ``json.loads``, as
+used before by the handlers and ``Session``; "codec" is ``jsonCodec`` with
+its current backend.
+
+Usage::
+
+    python benchmarks/json_codec.py [n_cells]
+"""
+import base64
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import nbformat
+from nbformat.v4 import new_code_cell, new_markdown_cell, new_notebook, new_output
+
+from zasper_py.services.kernels.session import Session
+from zasper_py.utils import jsonCodec
+from zasper_py.utils.jsonutil import json_default
+
+
+def notebook_model(n_cells):
+    nb = new_notebook()
+    png = base64.b64encode(os.urandom(60 * 1024)).decode("ascii")
+    figure = {
+        "data": [{"type": "scatter", "x": list(range(2000)), "y": [i * 0.5 for i in range(2000)]}],
+        "layout": {"title": {"text": "figure"}},
+    }
+    for i in range(n_cells):
+        if i % 5 == 0:
+            nb.cells.append(new_markdown_cell(f"## Section {i}\n\nSome *text* about the results."))
+            continue
+        outputs = [new_output("stream", name="stdout", text=f"step {i}: loss=0.{i:04d}\n" * 20)]
+        if i % 3 == 0:
+            outputs.append(new_output("display_data", data={"image/png": png, "text/plain": "<Figure>"}))
+        elif i % 3 == 1:
+            outputs.append(
+                new_output(
+                    "display_data",
+                    data={"application/vnd.plotly.v1+json": figure, "text/plain": "Figure()"},
+                )
+            )
+        nb.cells.append(
+            new_code_cell(f"df = load({i})\ndf.describe()", outputs=outputs, execution_count=i)
+        )
+    now = datetime.now(timezone.utc)
+    model = {
+        "name": "analysis.ipynb",
+        "path": "analysis.ipynb",
+        "type": "notebook",
+        "writable": True,
+        "created": now,
+        "last_modified": now,
+        "mimetype": None,
+        "format": "json",
+        "content": nbformat.from_dict(json.loads(nbformat.writes(nb))),
+    }
+    return model
+
+
+def iopub_messages():
+    session = Session()
+    png = base64.b64encode(os.urandom(30 * 1024)).decode("ascii")
+    return {
+        "stream": session.msg("stream", {"name": "stdout", "text": "epoch 1/10 ... 0.93\n" * 5}),
+        "display_data": session.msg(
+            "display_data", {"data": {"image/png": png, "text/plain": "<Figure>"}, "metadata": {}}
+        ),
+        "status": session.msg("status", {"execution_state": "idle"}),
+    }
+
+
+def stdlib_encode(obj):
+    return json.dumps(obj, default=json_default, ensure_ascii=False).encode("utf8")
+
+
+def best_of(func, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(label, payload, repeat):
+    encoded = stdlib_encode(payload)
+    rows = (
+        ("encode", stdlib_encode, jsonCodec.encode, payload),
+        ("decode", json.loads, jsonCodec.decode, encoded),
+    )
+    for op, stdlib, codec, arg in rows:
+        before = best_of(stdlib, arg, repeat)
+        after = best_of(codec, arg, repeat)
+        print(
+            f"{label:>14} {op}: {len(encoded) / 1024:8.1f} KiB  "
+            f"stdlib {before * 1e6:10.1f} us  codec {after * 1e6:10.1f} us  "
+            f"x{before / after:5.1f}"
+        )
+
+
+def run(n_cells):
+    print(f"backend: {jsonCodec.BACKEND}")
+    report("notebook", notebook_model(n_cells), repeat=5)
+    for name, msg in iopub_messages().items():
+        report(name, msg, repeat=2000)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -1,14 +1,25 @@
+import asyncio
 import contextvars
-import json
+import email.utils
 import logging
+from asyncio import Future
+from datetime import datetime
 
 from typing import cast, Any
 
+from tornado.iostream import StreamClosedError
 from tornado.web import RequestHandler, HTTPError
 
+from zasper_backend.api.base.compression import (COMPRESS_MIN_SIZE,
+                                                  COMPRESS_OFFLOAD_SIZE,
+                                                  Compressor, compress_on_pool,
+                                                  is_compressible,
+                                                  negotiate_encoding)
+from zasper_backend.services.content.contentsManager import ContentsManager
 from zasper_backend.services.kernels.multiKernelManager import MultiKernelManager
 from zasper_backend.services.session.sessionManager import SessionManager
 from zasper_backend.services.terminal.terminalManager import TerminalManager
+from zasper_backend.utils import jsonCodec
 
 logger = logging.getLogger(__name__)
 request_id_var = contextvars.ContextVar("request_id")
@@ -19,8 +30,10 @@ class ZasperAPIHandler(RequestHandler):
     # _kernel_manager = None
     # _terminal_manager = None
 
-
-
+    # compressor of a streamed response, set at its first flush
+    _compressor: Compressor | None = None
+    # pending finish() of a body being compressed on a worker thread
+    _compressing: Future | None = None
 
     def set_default_headers(self):
         self.set_header("Access-Control-Allow-Origin", "*")
@@ -52,10 +65,9 @@ class ZasperAPIHandler(RequestHandler):
         """Return the body of the request as JSON data."""
         if not self.request.body:
             return None
-        # Do we need to call body.decode('utf-8') here?
-        body = self.request.body.strip().decode("utf-8")
+        body = self.request.body.strip()
         try:
-            model = json.loads(body)
+            model = jsonCodec.decode(body)
         except Exception as e:
             logger.info("Bad JSON: %r", body)
             logger.info("Couldn't parse JSON")
@@ -63,6 +75,101 @@ class ZasperAPIHandler(RequestHandler):
         return cast("dict[str, Any]", model)
 
 
+    def check_not_modified(self, etag: str, last_modified: datetime | None = None) -> bool:
+        """Set the ETag and Last-Modified headers of the response, and
+        return True if the client's copy is current.
+
+        If-None-Match takes precedence, If-Modified-Since is compared at the
+        one second resolution of HTTP dates.
+        """
+        self.set_header("ETag", etag)
+        if last_modified is not None:
+            self.set_header("Last-Modified", last_modified)
+        if "If-None-Match" in self.request.headers:
+            return self.check_etag_header()
+        since = self.request.headers.get("If-Modified-Since")
+        if not since or last_modified is None:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None or last_modified.tzinfo is None:
+            return False
+        return last_modified.replace(microsecond=0) <= since
+
+    def _response_compressor(self) -> Compressor | None:
+        """A compressor for this response if it should be compressed: a
+        successful text or JSON response, not already encoded, whose client
+        accepts one of our encodings. Sets the response headers for it."""
+        if not 200 <= self._status_code < 300 or self._status_code == 204:
+            return None
+        if "Content-Encoding" in self._headers:
+            return None
+        if not is_compressible(self._headers.get("Content-Type")):
+            return None
+        self.add_header("Vary", "Accept-Encoding")
+        encoding = negotiate_encoding(self.request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return None
+        self.set_header("Content-Encoding", encoding)
+        self.clear_header("Content-Length")
+        return Compressor(encoding, type(self).__name__)
+
+    def flush(self, include_footers: bool = False) -> Future[None]:
+        # a response flushed before finish() is compressed chunk by chunk
+        if not self._headers_written and not include_footers and self._compressor is None:
+            self._compressor = self._response_compressor()
+        if self._compressor is not None:
+            data = b"".join(self._write_buffer)
+            self._write_buffer = [self._compressor.compress(data, finish=include_footers)]
+        return super().flush(include_footers)
+
+    def finish(self, chunk=None) -> Future[None]:
+        """Finish the response, compressing its body if the client accepts
+        it and it is at least ``compress_min_size`` bytes. Bodies of
+        ``compress_offload_size`` bytes or more are compressed on a worker
+        thread, the response finishing when that is done."""
+        if self._compressing is not None:
+            return self._compressing
+        if self._finished or self._headers_written:
+            return super().finish(chunk)
+        if chunk is not None:
+            self.write(chunk)
+        size = sum(len(part) for part in self._write_buffer)
+        if size < self.settings.get("compress_min_size", COMPRESS_MIN_SIZE):
+            return super().finish()
+        compressor = self._response_compressor()
+        if compressor is None:
+            return super().finish()
+        data = b"".join(self._write_buffer)
+        if size < self.settings.get("compress_offload_size", COMPRESS_OFFLOAD_SIZE):
+            self._write_buffer = [compressor.compress(data, finish=True)]
+            return super().finish()
+        self._compressing = asyncio.ensure_future(self._finish_compressed(compressor, data))
+        return self._compressing
+
+    async def _finish_compressed(self, compressor: Compressor, data: bytes) -> None:
+        try:
+            self._write_buffer = [await compress_on_pool(compressor, data)]
+        except Exception:
+            logger.exception("Could not compress the response, sending it as is")
+            self.clear_header("Content-Encoding")
+            self._write_buffer = [data]
+        try:
+            await super().finish()
+        except StreamClosedError:
+            # nobody may be awaiting this finish(), the client left anyway
+            pass
+
+    @property
+    def contents_manager(self) -> ContentsManager:
+        return self.application._contents_manager
+
+    @property
+    def cm(self) -> ContentsManager:
+        return self.application._contents_manager
+
     @property
     def kernel_manager(self) -> MultiKernelManager:
         return self.application._kernel_manager
@@ -0,0 +1,161 @@
+"""Content-Encoding of API responses, negotiated from Accept-Encoding.
+
+gzip is always available, br and zstd when the ``brotli`` and
+``zstandard`` packages are installed. When the client accepts several,
+they are preferred in the order of ``ENCODINGS``.
+"""
+import asyncio
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from zasper_backend.services.metrics import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_RATIO = metrics.HTTP_COMPRESSION_RATIO
+COMPRESSION_CPU_SECONDS = metrics.HTTP_COMPRESSION_CPU_SECONDS
+COMPRESSION_INPUT_BYTES = metrics.HTTP_COMPRESSION_INPUT_BYTES_TOTAL
+COMPRESSION_OUTPUT_BYTES = metrics.HTTP_COMPRESSION_OUTPUT_BYTES_TOTAL
+
+# bodies smaller than this are sent as they are, settings["compress_min_size"]
+# overrides it
+COMPRESS_MIN_SIZE = 1024
+
+# bodies at least this large are compressed on a worker thread,
+# settings["compress_offload_size"] overrides it
+COMPRESS_OFFLOAD_SIZE = 1024 * 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+}
+
+
+def _gzip():
+    c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def _brotli():
+    c = brotli.Compressor(quality=BROTLI_QUALITY)
+    return c.process, c.flush, c.finish
+
+
+def _zstd():
+    c = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return c.compress, lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+
+
+# encoding -> factory of (compress, sync flush, finish), most preferred first
+ENCODINGS: Dict[str, Callable[[], Tuple[Callable, Callable, Callable]]] = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = _zstd
+if brotli is not None:
+    ENCODINGS["br"] = _brotli
+ENCODINGS["gzip"] = _gzip
+
+_pool = None
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The encoding to answer an ``Accept-Encoding`` header with, or None.
+
+    The highest q-value wins, ties go to the encoding we prefer.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    media_type = content_type.partition(";")[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type.endswith("+json")
+        or media_type in COMPRESSIBLE_TYPES
+    )
+
+
+class Compressor:
+    """Compress one response body, whole or as a stream of chunks.
+
+    Sizes and the CPU time spent compressing are recorded per handler and
+    encoding when the body ends.
+    """
+
+    def __init__(self, encoding: str, handler: str):
+        self.encoding = encoding
+        self.handler = handler
+        self._compress, self._flush, self._finish = ENCODINGS[encoding]()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    def compress(self, data: bytes, finish: bool = False) -> bytes:
+        """Compress the next chunk of the body. Unless ``finish``, the
+        output is flushed so the client can decode everything sent so far."""
+        begin = time.thread_time()
+        out = self._compress(data) + (self._finish() if finish else self._flush())
+        self.cpu_seconds += time.thread_time() - begin
+        self.bytes_in += len(data)
+        self.bytes_out += len(out)
+        if finish:
+            self._record()
+        return out
+
+    def _record(self) -> None:
+        labels = (self.handler, self.encoding)
+        COMPRESSION_CPU_SECONDS.labels(*labels).observe(self.cpu_seconds)
+        COMPRESSION_INPUT_BYTES.labels(*labels).inc(self.bytes_in)
+        COMPRESSION_OUTPUT_BYTES.labels(*labels).inc(self.bytes_out)
+        if self.bytes_out:
+            COMPRESSION_RATIO.labels(*labels).observe(self.bytes_in / self.bytes_out)
+
+
+async def compress_on_pool(compressor: Compressor, data: bytes) -> bytes:
+    """Compress a whole body on a worker thread (zlib, brotli and zstandard
+    release the GIL, so large bodies compress in parallel)."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="compress"
+        )
+    return await asyncio.get_running_loop().run_in_executor(
+        _pool, compressor.compress, data, True
+    )
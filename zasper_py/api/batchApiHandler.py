@@ -0,0 +1,131 @@
+import contextvars
+import logging
+import uuid
+
+from tornado import web
+from tornado.websocket import WebSocketClosedError, WebSocketHandler
+
+from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
+from zasper_backend.services.websocketHandler.websocketmixin import WebSocketMixin
+from zasper_backend.utils import jsonCodec, url_path_join
+
+request_id_var = contextvars.ContextVar("request_id")
+
+logger = logging.getLogger(__name__)
+
+# batches of at most this many operations are answered when done,
+# settings["batch_wait_operations"] overrides it
+BATCH_WAIT_OPERATIONS = 50
+
+
+class BatchApiHandler(ZasperAPIHandler):
+    """Copy, move, delete and create directories in one request.
+
+    POST /api/batch
+      with body {"operations": [{"op": "move", "from": ..., "to": ...}, ...]}
+      Short batches are answered when done (200), with the result of each
+      operation. Longer ones are answered at once (202) with the batch id;
+      their progress is streamed by /api/batch/<id>/progress and their
+      results are returned by GET /api/batch/<id>.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def post(self):
+        model = self.get_json_body()
+        if not isinstance(model, dict):
+            raise web.HTTPError(400, "JSON body missing")
+        batch = self.cm.start_batch(model.get("operations"))
+        logger.info("Batch %s: %d operations", batch.id, len(batch.operations))
+        wait_operations = self.settings.get("batch_wait_operations", BATCH_WAIT_OPERATIONS)
+        if len(batch.operations) <= wait_operations:
+            await batch.task
+            self.finish(jsonCodec.encode(batch.model()))
+            return
+        self.set_status(202)
+        self.set_header("Location", url_path_join(self.base_url, "api/batch", batch.id))
+        self.finish(jsonCodec.encode(batch.model(results=False)))
+
+
+class SingleBatchApiHandler(ZasperAPIHandler):
+    """GET /api/batch/<id>: progress and results so far of a batch."""
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    def get(self, batch_id):
+        batch = self.cm.get_batch(batch_id)
+        self.finish(jsonCodec.encode(batch.model()))
+
+
+class BatchProgressWebsocketHandler(ZasperAPIHandler, WebSocketMixin, WebSocketHandler):
+    """Progress of a batch, one message per operation as it completes.
+
+    The results of the operations already done are sent first. Each message
+    is a result with the progress of the batch::
+
+        {"result": {"index": 3, "op": "move", "status": "ok", ...},
+         "completed": 4, "failed": 0, "total": 1200}
+
+    Running copies also send their progress, as results with the status
+    ``running`` and the ``bytes`` copied of ``total``. The last message,
+    after which the socket is closed, is the batch model without its
+    results: ``{"id": ..., "done": true, ...}``.
+    """
+
+    batch = None
+
+    def set_default_headers(self):
+        """Undo the set_default_headers of ZasperAPIHandler
+
+        which doesn't make sense for websockets
+        """
+
+    async def get(self, batch_id):
+        self.batch = self.cm.get_batch(batch_id)
+        await super().get(batch_id)
+
+    def open(self, batch_id):
+        for result in self.batch.results:
+            if result is not None:
+                self._send_result(result)
+        if self.batch.done:
+            self._send_done()
+        else:
+            self.batch.subscribe(self._on_progress)
+
+    def _on_progress(self, result):
+        if result is None:
+            self._send_done()
+        else:
+            self._send_result(result)
+
+    def _send_result(self, result):
+        self._send({
+            "result": result,
+            "completed": self.batch.completed,
+            "failed": self.batch.failed,
+            "total": len(self.batch.operations),
+        })
+
+    def _send_done(self):
+        self._send(self.batch.model(results=False))
+        self.close()
+
+    def _send(self, message):
+        try:
+            self.write_message(jsonCodec.encode_str(message))
+        except WebSocketClosedError:
+            self.batch.unsubscribe(self._on_progress)
+
+    def on_message(self, message):
+        """Nothing is expected from the client."""
+
+    def on_close(self):
+        if self.batch is not None:
+            self.batch.unsubscribe(self._on_progress)
@@ -1,33 +1,90 @@
 from __future__ import annotations
 
 import contextvars
-import json
 import logging
 import uuid
 from typing import Any, Dict, List, cast
 
-from pydantic.json import pydantic_encoder
 from tornado import escape, web
 from tornado.httpclient import HTTPError
-from tornado.web import RequestHandler
 
 from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
 from zasper_backend.models.contentModel import ContentModel
-from zasper_backend.services.content.contentsManager import ContentsManager
-from zasper_backend.utils import ensure_async, url_escape, url_path_join
-from zasper_backend.utils.jsonutil import json_default
+from zasper_backend.utils import ensure_async, jsonCodec, url_escape, url_path_join
 
 request_id_var = contextvars.ContextVar("request_id")
 
 logger = logging.getLogger(__name__)
 
+# entries written between two flushes of a streamed directory listing
+STREAM_FLUSH_ENTRIES = 500
 
-class CheckpointsApiHandler(RequestHandler):
-    pass
+# deepest tree returned by GET /api/tree
+MAX_TREE_DEPTH = 10
 
+# largest body accepted by a raw upload, settings["max_upload_size"] overrides it
+MAX_UPLOAD_SIZE = 100 * 1024 ** 3
 
-class ModifyCheckpointsApiHandler(RequestHandler):
-    pass
+
+class CheckpointsApiHandler(ZasperAPIHandler):
+    """Checkpoints of a file.
+
+    GET /api/contents/path/Name.ipynb/checkpoints
+      List the checkpoints of the file, oldest first.
+    POST /api/contents/path/Name.ipynb/checkpoints
+      Checkpoint the current content of the file.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def get(self, path=""):
+        """get lists checkpoints for a file"""
+        checkpoints = await ensure_async(self.cm.list_checkpoints(path))
+        self.finish(jsonCodec.encode(checkpoints))
+
+    async def post(self, path=""):
+        """post creates a new checkpoint"""
+        checkpoint = await ensure_async(self.cm.create_checkpoint(path))
+        location = url_path_join(
+            self.base_url,
+            "api/contents",
+            url_escape(path),
+            "checkpoints",
+            url_escape(checkpoint["id"]),
+        )
+        self.set_header("Location", location)
+        self.set_status(201)
+        self.finish(jsonCodec.encode(checkpoint))
+
+
+class ModifyCheckpointsApiHandler(ZasperAPIHandler):
+    """A single checkpoint.
+
+    POST /api/contents/path/Name.ipynb/checkpoints/<checkpoint_id>
+      Restore the file to the checkpoint.
+    DELETE /api/contents/path/Name.ipynb/checkpoints/<checkpoint_id>
+      Delete the checkpoint.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def post(self, path, checkpoint_id):
+        """post restores a file from a checkpoint"""
+        await ensure_async(self.cm.restore_checkpoint(path, checkpoint_id))
+        self.set_status(204)
+        await self.finish()
+
+    async def delete(self, path, checkpoint_id):
+        """delete clears a checkpoint for a given file"""
+        await ensure_async(self.cm.delete_checkpoints(path, checkpoint_id))
+        self.set_status(204)
+        await self.finish()
 
 
 def _validate_keys(expect_defined: bool, model: Dict[str, Any], keys: List[str]):
@@ -92,9 +149,6 @@ class ContentApiHandler(ZasperAPIHandler):
     def base_url(self) -> str:
         return cast(str, self.settings.get("base_url", "/"))
 
-    def initialize(self):
-        self.cm = ContentsManager()
-
     def set_default_headers(self):
         self.set_header("Access-Control-Allow-Origin", "*")
         self.set_header("Access-Control-Allow-Headers", "*")
@@ -162,20 +216,120 @@ class ContentApiHandler(ZasperAPIHandler):
             raise web.HTTPError(400, f"Content {hash_str!r} is invalid")
         require_hash = int(hash_str)
 
-        # if not cm.allow_hidden and await ensure_async(cm.is_hidden(path)):
-        #     await self._finish_error(
-        #         HTTPStatus.NOT_FOUND, f"file or directory {path!r} does not exist"
-        #     )
+        outputs = self.get_query_argument("outputs", default=None)
+        if outputs not in {None, "full", "lazy"}:
+            raise web.HTTPError(400, f"Outputs {outputs!r} is invalid")
+
+        if not self.cm.allow_hidden and await ensure_async(self.cm.is_hidden(path)):
+            raise web.HTTPError(404, f"file or directory {path!r} does not exist")
+
+        if content and type in {None, "directory"} and await ensure_async(self.cm.dir_exists(path)):
+            listing = self._listing_arguments()
+            if listing is not None:
+                await self._list_directory(path, **listing)
+                return
+
+        # validators are taken before reading: if the file changes in between,
+        # the client revalidates a newer body and fetches it once more
+        etag, last_modified = await ensure_async(
+            self.cm.get_etag(
+                path=path,
+                type=type,
+                format=format,
+                content=content,
+                require_hash=require_hash,
+                outputs=outputs,
+            )
+        )
+        if self.check_not_modified(etag, last_modified):
+            self.set_status(304)
+            await self.finish()
+            return
 
         # content = await self.cm.get(os.getcwd())
-        content = self.cm.get(
-            path=path,
-            type=type,
-            format=format,
-            content=content,
-            require_hash=require_hash,
+        content = await ensure_async(
+            self.cm.get(
+                path=path,
+                type=type,
+                format=format,
+                content=content,
+                require_hash=require_hash,
+                outputs=outputs,
+            )
+        )
+        self.write(jsonCodec.encode(content))
+
+    def _listing_arguments(self):
+        """Paging and streaming arguments of a directory GET, or None if unset.
+
+        limit : the maximum number of entries to return
+        cursor : the next_cursor returned with the previous page
+        sort : name, last_modified, size or type, '-' prefixed for descending
+        stream : if 1, reply with newline-delimited JSON
+        """
+        limit_str = self.get_query_argument("limit", default=None)
+        cursor = self.get_query_argument("cursor", default=None)
+        sort = self.get_query_argument("sort", default=None)
+        stream_str = self.get_query_argument("stream", default="0")
+        if stream_str not in {"0", "1"}:
+            raise web.HTTPError(400, f"Stream {stream_str!r} is invalid")
+        stream = bool(int(stream_str))
+        if limit_str is None and cursor is None and sort is None and not stream:
+            return None
+
+        limit = None
+        if limit_str is not None:
+            try:
+                limit = int(limit_str)
+            except ValueError:
+                limit = 0
+            if limit <= 0:
+                raise web.HTTPError(400, f"Limit {limit_str!r} is invalid")
+        return {"limit": limit, "cursor": cursor, "sort": sort, "stream": stream}
+
+    async def _list_directory(self, path, limit, cursor, sort, stream):
+        """Reply with one page of a directory listing.
+
+        Without ``stream`` the directory model is returned with ``content``
+        holding the page and ``next_cursor`` set for the following page.
+
+        With ``stream`` the reply is NDJSON: the directory model without
+        content, then one line per entry, then ``{"next_cursor": ...}`` if
+        there are more pages. An unsorted, unlimited stream is read straight
+        off the disk in batches, so memory stays flat whatever the directory
+        size.
+        """
+        model = await ensure_async(self.cm.get(path=path, content=False, type="directory"))
+        if stream and limit is None and cursor is None and sort is None:
+            self.set_header("Content-Type", "application/x-ndjson; charset=UTF-8")
+            self.write(jsonCodec.encode(model) + b"\n")
+            async for batch in self.cm.iter_directory(path, batch_size=STREAM_FLUSH_ENTRIES):
+                for entry in batch:
+                    self.write(jsonCodec.encode(entry) + b"\n")
+                await self.flush()
+            await self.finish()
+            return
+
+        entries, next_cursor = await ensure_async(
+            self.cm.list_directory(path, sort=sort, cursor=cursor, limit=limit)
         )
-        self.write(json.dumps(content, default=pydantic_encoder))
+
+        if not stream:
+            model["content"] = entries
+            model["format"] = "json"
+            model["next_cursor"] = next_cursor
+            self.write(jsonCodec.encode(model))
+            return
+
+        self.set_header("Content-Type", "application/x-ndjson; charset=UTF-8")
+        self.write(jsonCodec.encode(model) + b"\n")
+        for i, entry in enumerate(entries, 1):
+            self.write(jsonCodec.encode(entry) + b"\n")
+            if i % STREAM_FLUSH_ENTRIES == 0:
+                await self.flush()
+        if next_cursor is not None:
+            self.write(jsonCodec.encode({"next_cursor": next_cursor}) + b"\n")
+        await self.finish()
 
     async def _save(self, model, path):
         """Save an existing file."""
@@ -186,6 +340,29 @@ class ContentApiHandler(ZasperAPIHandler):
         validate_model(model)
         self._finish_model(model)
 
+    async def _copy(self, copy_from, copy_to=None):
+        """Copy a file, optionally specifying a target directory.
+
+        The copy runs on the contents pool, as a reflink where the
+        filesystem supports it; to follow the progress of a large copy, POST
+        it to /api/batch instead.
+        """
+        logger.info("Copying %r to %r", copy_from, copy_to or "")
+        model = await ensure_async(self.cm.copy(copy_from, copy_to))
+        self.set_status(201)
+        validate_model(model)
+        self._finish_model(model)
+
+    async def _upload(self, model, path):
+        """Handle upload of a new file to path"""
+        chunk = model.get("chunk", None)
+        if not chunk or chunk == 1:  # Avoid tedious log information
+            logger.info("Uploading file to %s", path)
+        model = await ensure_async(self.cm.new(model, path))
+        self.set_status(201)
+        validate_model(model)
+        self._finish_model(model)
+
     async def _new_untitled(self, path, type="", ext=""):
         """Create a new, empty untitled entity"""
         logger.info("Creating new %s in %s", type or "file", path)
@@ -215,13 +392,11 @@ class ContentApiHandler(ZasperAPIHandler):
         if model:
             copy_from = model.get("copy_from")
             if copy_from:
-                # if not cm.allow_hidden and (
-                #         await ensure_async(cm.is_hidden(path))
-                #         or await ensure_async(cm.is_hidden(copy_from))
-                # ):
-                #     raise web.HTTPError(400, f"Cannot copy file or directory {path!r}")
-                # else:
-                #     await self._copy(copy_from, path)
+                if not self.cm.allow_hidden and (
+                        await ensure_async(self.cm.is_hidden(path))
+                        or await ensure_async(self.cm.is_hidden(copy_from))
+                ):
+                    raise web.HTTPError(400, f"Cannot copy file or directory {path!r}")
                 await self._copy(copy_from, path)
             else:
                 ext = model.get("ext", "")
@@ -233,6 +408,32 @@ class ContentApiHandler(ZasperAPIHandler):
         else:
             await self._new_untitled(path)
 
+    async def put(self, path=""):
+        """Saves the file in the location specified by name and path.
+
+        PUT is very similar to POST, but the requester specifies the name,
+        whereas with POST, the server picks the name.
+
+        PUT /api/contents/path/Name.ipynb
+          Save notebook at ``path/Name.ipynb``. Notebook structure is specified
+          in `content` key of JSON request body. If content is not specified,
+          create a new empty notebook.
+        PUT /api/contents/path/data.csv
+          with body {"chunk": n, "offset": bytes_sent, ...}
+          Append chunk n of a chunked upload, -1 being the last one.
+        """
+        model = self.get_json_body()
+        if model:
+            if model.get("copy_from"):
+                raise web.HTTPError(400, "Cannot copy with PUT, only POST")
+            exists = await ensure_async(self.cm.file_exists(path))
+            if exists:
+                await self._save(model, path)
+            else:
+                await self._upload(model, path)
+        else:
+            await self._new_untitled(path)
+
     def _finish_model(self, model, location=True):
         """Finish a JSON request with a model, setting relevant headers, etc."""
         if location:
@@ -240,13 +441,13 @@ class ContentApiHandler(ZasperAPIHandler):
             self.set_header("Location", location)
         self.set_header("Last-Modified", model["last_modified"])
         self.set_header("Content-Type", "application/json")
-        self.finish(json.dumps(model, default=json_default))
+        self.finish(jsonCodec.encode(model))
 
     async def delete(self, path=""):
         """delete a file in the given path"""
 
-        # if not self.cm.allow_hidden and await ensure_async(cm.is_hidden(path)):
-        #     raise web.HTTPError(400, f"Cannot delete file or directory {path!r}")
+        if not self.cm.allow_hidden and await ensure_async(self.cm.is_hidden(path)):
+            raise web.HTTPError(400, f"Cannot delete file or directory {path!r}")
 
         logger.warning("delete %s", path)
         await ensure_async(self.cm.delete(path))
@@ -260,17 +461,240 @@ class ContentApiHandler(ZasperAPIHandler):
             raise web.HTTPError(400, "JSON body missing")
 
         old_path = model.get("path")
-        # if (
-        #         old_path
-        #         and not cm.allow_hidden
-        #         and (
-        #         await ensure_async(cm.is_hidden(path)) or await ensure_async(cm.is_hidden(old_path))
-        # )
-        # ):
-        #     raise web.HTTPError(400, f"Cannot rename file or directory {path!r}")
+        if (
+                old_path
+                and not self.cm.allow_hidden
+                and (
+                await ensure_async(self.cm.is_hidden(path))
+                or await ensure_async(self.cm.is_hidden(old_path))
+        )
+        ):
+            raise web.HTTPError(400, f"Cannot rename file or directory {path!r}")
 
         model = await ensure_async(self.cm.update(model, path))
         validate_model(model)
         self._finish_model(model)
 
 
+@web.stream_request_body
+class UploadApiHandler(ZasperAPIHandler):
+    """Raw binary uploads, written to disk as the request body arrives.
+
+    GET /api/upload/path/data.parquet
+      {"path": ..., "offset": n}, the number of bytes received so far by an
+      interrupted upload.
+    PUT /api/upload/path/data.parquet?offset=n&final=1
+      Append the request body from byte ``offset`` (default 0, which
+      restarts the upload). With ``final=1`` (the default) the file is moved
+      into place once the body is received; ``final=0`` keeps it pending so
+      the next request can continue from the returned offset.
+    """
+
+    upload = None
+
+    async def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+        if self.request.method != "PUT":
+            return
+        offset_str = self.get_query_argument("offset", default="0")
+        try:
+            offset = int(offset_str)
+        except ValueError:
+            offset = -1
+        if offset < 0:
+            raise web.HTTPError(400, f"Offset {offset_str!r} is invalid")
+        self.request.connection.set_max_body_size(
+            self.settings.get("max_upload_size", MAX_UPLOAD_SIZE)
+        )
+        self.upload = await ensure_async(self.cm.open_upload(self.path_kwargs["path"], offset))
+
+    async def data_received(self, chunk):
+        # the body is not read further until the chunk is on disk
+        await self.cm.write_upload(self.upload, chunk)
+
+    def on_connection_close(self):
+        # keep what was received so the client can resume
+        if self.upload is not None:
+            self.upload.close()
+
+    async def get(self, path=""):
+        offset = await ensure_async(self.cm.get_upload_offset(path))
+        self.finish(jsonCodec.encode({"path": path.strip("/"), "offset": offset}))
+
+    async def put(self, path=""):
+        final_str = self.get_query_argument("final", default="1")
+        if final_str not in {"0", "1"}:
+            raise web.HTTPError(400, f"Final {final_str!r} is invalid")
+        if final_str == "0":
+            offset = self.upload.offset
+            self.upload.close()
+            self.set_status(202)
+            self.finish(jsonCodec.encode({"path": path.strip("/"), "offset": offset}))
+            return
+        logger.info("Uploading file to %s", path)
+        model = await ensure_async(self.cm.finish_upload(path, self.upload))
+        self.set_status(201)
+        validate_model(model)
+        location = url_path_join(self.base_url, "api", "contents", url_escape(model["path"]))
+        self.set_header("Location", location)
+        self.finish(jsonCodec.encode(model))
+
+
+class TreeApiHandler(ZasperAPIHandler):
+    """Nested directory listings.
+
+    GET /api/tree/path?depth=n
+      The directory model of ``path`` with the listings of its
+      subdirectories nested down to ``depth`` levels (default 1). Every
+      directory carries the ``etag`` of its subtree, which only changes
+      when entries are created, deleted or renamed below it: a client
+      revalidates a branch with ``If-None-Match`` and its etag (and the
+      same remaining depth), and gets 304 if nothing changed.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def get(self, path=""):
+        depth_str = self.get_query_argument("depth", default="1")
+        try:
+            depth = int(depth_str)
+        except ValueError:
+            depth = -1
+        if not 0 <= depth <= MAX_TREE_DEPTH:
+            raise web.HTTPError(400, f"Depth {depth_str!r} is invalid")
+
+        if_none_match = self.request.headers.get("If-None-Match")
+        if if_none_match:
+            etag = await ensure_async(self.cm.get_tree_etag(path, depth))
+            if if_none_match.strip() == "*" or etag in (
+                    tag.strip() for tag in if_none_match.split(",")
+            ):
+                self.set_header("ETag", etag)
+                self.set_status(304)
+                self.finish()
+                return
+
+        model = await ensure_async(self.cm.get_tree(path, depth))
+        self.set_header("ETag", model["etag"])
+        self.finish(jsonCodec.encode(model))
+
+
+class NotebookOutputsApiHandler(ZasperAPIHandler):
+    """Outputs of some cells of a notebook, read with outputs=lazy.
+
+    GET /api/outputs/path/Name.ipynb?ids=<id>,<id>[&hash=...]
+      Reply {"path": ..., "outputs": {id: {"outputs": [...],
+      "execution_count": n}}}. Notebooks without cell ids are addressed with
+      ``indices=<i>,<j>`` instead. With ``hash``, replies 409 if the notebook
+      changed since that version.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def get(self, path=""):
+        ids = [cell_id for cell_id in self.get_query_argument("ids", "").split(",") if cell_id]
+        try:
+            indices = [
+                int(index) for index in self.get_query_argument("indices", "").split(",") if index
+            ]
+        except ValueError:
+            raise web.HTTPError(400, "Indices must be integers") from None
+        if not ids and not indices:
+            raise web.HTTPError(400, "No cell ids or indices given")
+        model = await ensure_async(
+            self.cm.get_cell_outputs(
+                path,
+                ids=ids,
+                indices=indices,
+                hash=self.get_query_argument("hash", default=None),
+                hash_algorithm=self.get_query_argument("hash_algorithm", default=None),
+            )
+        )
+        self.set_header("Content-Type", "application/json")
+        self.finish(jsonCodec.encode(model))
+
+
+class TextWindowApiHandler(ZasperAPIHandler):
+    """Part of a large text file, for paging through it.
+
+    GET /api/window/path/data.csv?offset=<line>&lines=<n>
+      Reply the file model with ``n`` lines starting at line ``offset``
+      as ``content``, with ``start_line`` and, once known, ``total_lines``.
+    GET /api/window/path/data.csv?offset=<byte>&length=<n>
+      Same with ``n`` bytes starting at byte ``offset``.
+    With ``from_end=1``, ``offset`` counts from the end of the file:
+    ``?lines=100&from_end=1`` are its last 100 lines. Windows are at most
+    4 MiB, ``truncated`` is set on the ones cut short, ``eof`` on the ones
+    reaching the end of the file.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    def _int_argument(self, name, default=None):
+        value = self.get_query_argument(name, default=None)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise web.HTTPError(400, f"{name} must be an integer") from None
+
+    async def get(self, path=""):
+        from_end = self.get_query_argument("from_end", default="0")
+        if from_end not in {"0", "1"}:
+            raise web.HTTPError(400, f"from_end {from_end!r} is invalid")
+        model = await ensure_async(
+            self.cm.get_text_window(
+                path,
+                offset=self._int_argument("offset", 0),
+                lines=self._int_argument("lines"),
+                length=self._int_argument("length"),
+                from_end=from_end == "1",
+            )
+        )
+        self.set_header("Content-Type", "application/json")
+        self.finish(jsonCodec.encode(model))
+
+
+class NotebookCellsApiHandler(ZasperAPIHandler):
+    """Cell-level saves of a notebook.
+
+    PATCH /api/cells/path/Name.ipynb
+      with body {"hash": base_hash, "ops": [...]}
+      Apply cell operations (insert, delete, replace_source,
+      replace_outputs, move) to the notebook as of ``base_hash`` and save
+      it. Replies 409 if the notebook changed since ``base_hash``.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def patch(self, path=""):
+        body = self.get_json_body()
+        if body is None:
+            raise web.HTTPError(400, "JSON body missing")
+        model = await ensure_async(
+            self.cm.save_cell_ops(
+                path,
+                body.get("ops"),
+                body.get("hash"),
+                hash_algorithm=body.get("hash_algorithm"),
+            )
+        )
+        validate_model(model, expect_hash=True)
+        self.set_header("Content-Type", "application/json")
+        self.finish(jsonCodec.encode(model))
@@ -1,10 +1,8 @@
 import contextvars
-import json
 import uuid
 
 from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
-from zasper_backend.utils import ensure_async, url_path_join, url_escape
-from zasper_backend.utils.jsonutil import json_default
+from zasper_backend.utils import ensure_async, jsonCodec, url_path_join, url_escape
 
 request_id_var = contextvars.ContextVar("request_id")
 
@@ -33,7 +31,7 @@ class RootKernelApiHandler(ZasperAPIHandler):
         """Get the list of running kernels."""
         km = self.kernel_manager
         kernels = await ensure_async(km.list_kernels())
-        await self.finish(json.dumps(kernels, default=json_default))
+        await self.finish(jsonCodec.encode(kernels))
 
     async def post(self):
         """Start a kernel."""
@@ -53,7 +51,7 @@ class RootKernelApiHandler(ZasperAPIHandler):
         location = url_path_join(self.base_url, "api", "kernels", url_escape(kernel_id))
         self.set_header("Location", location)
         self.set_status(201)
-        await self.finish(json.dumps(model, default=json_default))
+        await self.finish(jsonCodec.encode(model))
 
 
 class KernelApiHandler(ZasperAPIHandler):
@@ -61,7 +59,7 @@ class KernelApiHandler(ZasperAPIHandler):
         """Get a kernel model."""
         km = self.kernel_manager
         model = await ensure_async(km.kernel_model(kernel_id))
-        await self.finish(json.dumps(model, default=json_default))
+        await self.finish(jsonCodec.encode(model))
 
     async def delete(self, kernel_id):
         """Remove a kernel."""
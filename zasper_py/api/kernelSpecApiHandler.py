@@ -1,5 +1,4 @@
 import contextvars
-import json
 import uuid
 import glob
 import os
@@ -10,7 +9,7 @@ from typing import Any
 from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
 from zasper_backend.services.kernelspec.kernelSpecManager import \
     KernelSpecManager
-from zasper_backend.utils import url_path_join
+from zasper_backend.utils import jsonCodec, url_path_join
 
 request_id_var = contextvars.ContextVar("request_id")
 
@@ -66,6 +65,11 @@ class KernelSpecApiHandler(ZasperAPIHandler):
         request_id_var.set(request_id)
 
     def get(self, *args):
+        etag, last_modified = self.ksm.get_specs_etag()
+        if self.check_not_modified(etag, last_modified):
+            self.set_status(304)
+            self.finish()
+            return
         # ksm = KernelSpecModel(name="yolo", KernelSpecFile="string", resources="string")
         model: dict[str, Any] = {}
         model["default"] = "python3" #self.km.default_kernel_name
@@ -87,7 +91,7 @@ class KernelSpecApiHandler(ZasperAPIHandler):
                 continue
             specs[kernel_name] = d
         self.set_header("Content-Type", "application/json")
-        self.finish(json.dumps(model))
+        self.finish(jsonCodec.encode(model))
 
     def post(self):
         pass
@@ -0,0 +1,10 @@
+import prometheus_client
+from tornado.web import RequestHandler
+
+
+class MetricsApiHandler(RequestHandler):
+    """Return Prometheus metrics for this server"""
+
+    def get(self):
+        self.set_header("Content-Type", prometheus_client.CONTENT_TYPE_LATEST)
+        self.write(prometheus_client.generate_latest(prometheus_client.REGISTRY))
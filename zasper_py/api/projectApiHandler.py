@@ -5,12 +5,12 @@ import sys
 import traceback
 import uuid
 
-from pydantic.json import pydantic_encoder
 from tornado import escape
 from tornado.web import RequestHandler
 
 from zasper_backend.models.projectModel import ProjectModel
 from zasper_backend.services.project.projectManager import ProjectsManager
+from zasper_backend.utils import jsonCodec
 
 request_id_var = contextvars.ContextVar("request_id")
 
@@ -55,7 +55,7 @@ class ProjectApiHandler(RequestHandler):
     async def get(self):
         self.cm = ProjectsManager()
         content = await self.cm.get(os.getcwd())
-        self.write(json.dumps(content, default=pydantic_encoder))
+        self.write(jsonCodec.encode(content))
 
     async def post(self):
         self.cm = ProjectsManager()
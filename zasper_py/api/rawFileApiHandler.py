@@ -0,0 +1,99 @@
+import contextvars
+import os
+import uuid
+from typing import Optional
+from urllib.parse import quote
+
+from tornado import httputil, web
+
+request_id_var = contextvars.ContextVar("request_id")
+
+
+def stat_etag(st: os.stat_result) -> str:
+    """Strong ETag of a file from its inode, size and mtime."""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+class RawFileApiHandler(web.StaticFileHandler):
+    """Serve files under the contents root as raw bytes.
+
+    GET /api/raw/path/model.parquet[?download=1]
+
+    Unlike GET /api/contents, nothing is base64 encoded or wrapped in JSON:
+    the file is streamed in fixed-size chunks with its ``mimetypes`` type.
+    ``Range`` requests return 206, honoring ``If-Range``. The ETag is taken
+    from the stat result rather than a hash of the whole file. Notebooks
+    whose outputs are in the output blob store are sent with them inlined.
+    """
+
+    def initialize(self):
+        cm = self.application._contents_manager
+        self.cm = cm
+        super().initialize(path=cm.root_dir)
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def get(self, path, include_body=True):
+        if path.endswith(".ipynb"):
+            self._check_visible(self.parse_url_path(path))
+            # notebooks with outputs in the blob store are served standalone
+            data = await self.cm.export_notebook(self.parse_url_path(path))
+            if data is not None:
+                self.set_header("Content-Type", "application/x-ipynb+json")
+                self.set_extra_headers(path)
+                if include_body:
+                    self.write(data)
+                else:
+                    self.set_header("Content-Length", len(data))
+                await self.finish()
+                return
+        if_range = self.request.headers.get("If-Range")
+        if (
+                if_range
+                and "Range" in self.request.headers
+                and not self._if_range_matches(path, if_range)
+        ):
+            # the client's partial copy is stale: send the whole file
+            del self.request.headers["Range"]
+        await super().get(path, include_body=include_body)
+
+    def _if_range_matches(self, path, if_range):
+        try:
+            st = os.stat(self.cm._get_os_path(self.parse_url_path(path)))
+        except OSError:
+            return False
+        if if_range.startswith(('"', "W/")):
+            # an entity tag, weak ones never match
+            return if_range == stat_etag(st)
+        return if_range == httputil.format_timestamp(int(st.st_mtime))
+
+    def parse_url_path(self, url_path):
+        return url_path.strip("/")
+
+    def get_absolute_path(self, root, path):
+        # 404s on paths outside the root before tornado resolves symlinks
+        return self._check_visible(path)
+
+    def _check_visible(self, path):
+        """The OS path of ``path``, 404 if it is hidden (as with GET
+        /api/contents) or outside the root."""
+        os_path = self.cm._get_os_path(path)
+        if not self.cm.allow_hidden and self.cm.manager.is_hidden(path):
+            raise web.HTTPError(404)
+        return os_path
+
+    def compute_etag(self) -> Optional[str]:
+        if getattr(self, "absolute_path", None) is None:
+            # an exported notebook, not a file on disk
+            return None
+        return stat_etag(self._stat())
+
+    def set_extra_headers(self, path):
+        # files change in place, clients must revalidate with the ETag
+        self.set_header("Cache-Control", "no-cache")
+        if self.get_query_argument("download", default="0") == "1":
+            name = quote(os.path.basename(path))
+            self.set_header("Content-Disposition", f"attachment; filename*=utf-8''{name}")
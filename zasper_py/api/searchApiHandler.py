@@ -0,0 +1,48 @@
+import contextvars
+import uuid
+
+from tornado import web
+
+from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
+from zasper_backend.utils import ensure_async, jsonCodec
+
+request_id_var = contextvars.ContextVar("request_id")
+
+SEARCH_KINDS = {"source", "output", "text"}
+
+# most documents a single query returns
+MAX_SEARCH_LIMIT = 1000
+
+
+class SearchApiHandler(ZasperAPIHandler):
+    """Full-text search of the workspace.
+
+    GET /api/search?q=read_csv[&path=dir][&kind=source,output][&limit=50]
+      {"query": ..., "results": [{"path", "cell", "kind", "matches"}]},
+      best matches first. ``cell`` is the index of the notebook cell (None
+      for other files), ``kind`` is source, output or text and each match
+      has the line, column and text of the hit.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def get(self):
+        query = self.get_query_argument("q", default="")
+        path = self.get_query_argument("path", default="")
+        kind_str = self.get_query_argument("kind", default="")
+        kinds = [kind for kind in kind_str.split(",") if kind]
+        if set(kinds) - SEARCH_KINDS:
+            raise web.HTTPError(400, f"Kind {kind_str!r} is invalid")
+        limit_str = self.get_query_argument("limit", default="50")
+        try:
+            limit = int(limit_str)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MAX_SEARCH_LIMIT:
+            raise web.HTTPError(400, f"Limit {limit_str!r} is invalid")
+
+        results = await ensure_async(self.cm.search(query, path=path, kinds=kinds, limit=limit))
+        self.finish(jsonCodec.encode({"query": query, "results": results}))
@@ -5,11 +5,11 @@ import sys
 import traceback
 import uuid
 
-from pydantic.json import pydantic_encoder
 from tornado import escape
 from tornado.web import RequestHandler
 
 from zasper_backend.services.secret.secretsManager import SecretsManager
+from zasper_backend.utils import jsonCodec
 
 request_id_var = contextvars.ContextVar("request_id")
 
@@ -53,7 +53,7 @@ class SecretApiHandler(RequestHandler):
     async def get(self):
         self.sm = SecretsManager()
         content = await self.sm.get(os.getcwd())
-        self.write(json.dumps(content, default=pydantic_encoder))
+        self.write(jsonCodec.encode(content))
 
     async def post(self):
         self.sm = SecretsManager()
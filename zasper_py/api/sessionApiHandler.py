@@ -9,13 +9,12 @@ from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
 from zasper_backend.models.sessionModel import SessionModel
 from zasper_backend.services.kernelspec.kernelSpecManager import NoSuchKernel
 from zasper_backend.services.session.sessionManager import SessionManager
-from zasper_backend.utils.jsonutil import json_default
 
 request_id_var = contextvars.ContextVar("request_id")
 import json
 import logging
 
-from zasper_backend.utils import ensure_async, url_path_join
+from zasper_backend.utils import ensure_async, jsonCodec, url_path_join
 
 logger = logging.getLogger(__name__)
 
@@ -120,10 +119,9 @@ class SessionRootApiHandler(ZasperAPIHandler):
         """Return the body of the request as JSON data."""
         if not self.request.body:
             return None
-        # Do we need to call body.decode('utf-8') here?
-        body = self.request.body.strip().decode("utf-8")
+        body = self.request.body.strip()
         try:
-            model = json.loads(body)
+            model = jsonCodec.decode(body)
         except Exception as e:
             logger.info("Bad JSON: %r", body)
             logger.info("Couldn't parse JSON")
@@ -142,7 +140,7 @@ class SessionRootApiHandler(ZasperAPIHandler):
         sessions = await self.sm.list_sessions()
         print(type(sessions))
         print(sessions)
-        self.write(json.dumps(sessions))
+        self.write(jsonCodec.encode(sessions))
 
     async def post(self):
         model = self.get_json_body()
@@ -187,7 +185,7 @@ class SessionRootApiHandler(ZasperAPIHandler):
                 status_msg = "%s not found" % kernel_name
                 logger.warning("Kernel not found: %s" % kernel_name)
                 self.set_status(501)
-                await self.finish(json.dumps({"message": msg, "short_message": status_msg}))
+                await self.finish(jsonCodec.encode({"message": msg, "short_message": status_msg}))
                 return
             except Exception as e:
                 raise web.HTTPError(500, str(e)) from e
@@ -195,4 +193,4 @@ class SessionRootApiHandler(ZasperAPIHandler):
         location = url_path_join(self.base_url, "api", "sessions", s_model["id"])
         self.set_header("Location", location)
         self.set_status(201)
-        await self.finish(json.dumps(s_model, default=json_default))
+        await self.finish(jsonCodec.encode(s_model))
@@ -4,12 +4,12 @@ import shlex
 import sys
 from shutil import which
 
-import json
 import logging
 from pathlib import Path
 
 from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
 from zasper_backend.services.terminal.base import TerminalsMixin
+from zasper_backend.utils import jsonCodec
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +22,7 @@ class TerminalRootApiHandler(ZasperAPIHandler):
     def get(self) -> None:
         """Get the list of terminals."""
         models = self.terminal_manager.list()
-        self.finish(json.dumps(models))
+        self.finish(jsonCodec.encode(models))
 
     def post(self) -> None:
         """POST /terminals creates a new terminal and redirects to it"""
@@ -53,7 +53,7 @@ class TerminalRootApiHandler(ZasperAPIHandler):
                 data["cwd"] = str(cwd.resolve())
 
         model = self.terminal_manager.create(**data)
-        self.finish(json.dumps(model))
+        self.finish(jsonCodec.encode(model))
 
 
 class TerminalApiHandler(ZasperAPIHandler):
@@ -65,7 +65,7 @@ class TerminalApiHandler(ZasperAPIHandler):
         print(name)
         """Get a terminal by name."""
         model = self.terminal_manager.get(name)
-        self.finish(json.dumps(model))
+        self.finish(jsonCodec.encode(model))
 
     async def delete(self, name: str) -> None:
         """Remove a terminal by name."""
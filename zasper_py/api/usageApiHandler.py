@@ -0,0 +1,40 @@
+import contextvars
+import uuid
+
+from tornado import web
+
+from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
+from zasper_backend.services.content.diskUsage import MAX_USAGE_DEPTH
+from zasper_backend.utils import ensure_async, jsonCodec
+
+request_id_var = contextvars.ContextVar("request_id")
+
+
+class UsageApiHandler(ZasperAPIHandler):
+    """Disk usage of the workspace.
+
+    GET /api/usage[?path=dir][&depth=1]
+      {"path", "size", "allocated", "files", "directories", "complete",
+       "children": [{"name", "size", ...}]}: the totals of everything below
+      the directory, and of its subdirectories (largest first) ``depth``
+      levels down. ``allocated`` is the space used on disk, ``complete`` is
+      False while the workspace is walked for the first time.
+    """
+
+    def prepare(self):
+        # If the request headers do not include a request ID, let's generate one.
+        request_id = self.request.headers.get("request-id") or str(uuid.uuid4())
+        request_id_var.set(request_id)
+
+    async def get(self):
+        path = self.get_query_argument("path", default="")
+        depth_str = self.get_query_argument("depth", default="1")
+        try:
+            depth = int(depth_str)
+        except ValueError:
+            depth = -1
+        if not 0 <= depth <= MAX_USAGE_DEPTH:
+            raise web.HTTPError(400, f"Depth {depth_str!r} is invalid")
+
+        model = await ensure_async(self.cm.usage(path, depth=depth))
+        self.finish(jsonCodec.encode(model))
@@ -0,0 +1,85 @@
+import logging
+
+from tornado import web
+from tornado.websocket import WebSocketClosedError, WebSocketHandler
+
+from zasper_backend.api.base.BaseApiHandler import ZasperAPIHandler
+from zasper_backend.services.websocketHandler.websocketmixin import WebSocketMixin
+from zasper_backend.utils import jsonCodec
+
+logger = logging.getLogger(__name__)
+
+
+class WatchWebsocketHandler(ZasperAPIHandler, WebSocketMixin, WebSocketHandler):
+    """Changes to the entries of directories, instead of polling /api/contents.
+
+    GET /api/watch?path=<dir>&path=<dir>...
+      subscribes to the given directories, and more can be subscribed to or
+      unsubscribed from by sending::
+
+        {"subscribe": ["data", "notebooks/out"]}
+        {"unsubscribe": ["data"]}
+
+      Each subscription is acknowledged by ``{"subscribed": <path>}``, or by
+      ``{"error": <message>, "path": <path>}`` if the path is not a
+      directory. Changes are sent, coalesced, as::
+
+        {"events": [{"type": "created", "path": "data/out.csv", "kind": "file"}, ...]}
+
+      with the types ``created``, ``modified``, ``deleted``, ``renamed``
+      (with ``old_path``) and ``rescan``: too much changed in that
+      directory, it should be listed again.
+    """
+
+    notifier = None
+
+    def set_default_headers(self):
+        """Undo the set_default_headers of ZasperAPIHandler
+
+        which doesn't make sense for websockets
+        """
+
+    def open(self):
+        self.notifier = self.cm.change_notifier
+        for path in self.get_query_arguments("path"):
+            self._subscribe(path)
+
+    def _subscribe(self, path):
+        try:
+            path = self.notifier.subscribe(path, self._on_events)
+        except web.HTTPError as e:
+            self._send({"error": e.log_message, "path": path})
+            return
+        self._send({"subscribed": path})
+
+    def _on_events(self, events):
+        self._send({"events": events})
+
+    def _send(self, message):
+        try:
+            self.write_message(jsonCodec.encode_str(message))
+        except WebSocketClosedError:
+            self.notifier.unsubscribe_all(self._on_events)
+
+    def on_message(self, message):
+        try:
+            msg = jsonCodec.decode(message)
+        except ValueError:
+            logger.warning("Invalid watch message: %.100r", message)
+            return
+        if not isinstance(msg, dict):
+            return
+        for key, action in (("subscribe", self._subscribe), ("unsubscribe", self._unsubscribe)):
+            paths = msg.get(key, [])
+            if isinstance(paths, str):
+                paths = [paths]
+            for path in paths:
+                if isinstance(path, str):
+                    action(path)
+
+    def _unsubscribe(self, path):
+        self.notifier.unsubscribe(path, self._on_events)
+
+    def on_close(self):
+        if self.notifier is not None:
+            self.notifier.unsubscribe_all(self._on_events)
@@ -10,15 +10,26 @@ from shutil import which
 from tornado import ioloop, web, websocket
 from tornado.web import RequestHandler
 
+from zasper_py.api.batchApiHandler import (BatchApiHandler,
+                                           BatchProgressWebsocketHandler,
+                                           SingleBatchApiHandler)
 from zasper_py.api.contentApiHandler import (CheckpointsApiHandler,
                                                   ContentApiHandler,
-                                                  ModifyCheckpointsApiHandler)
+                                                  ModifyCheckpointsApiHandler,
+                                                  NotebookCellsApiHandler,
+                                                  NotebookOutputsApiHandler,
+                                                  TextWindowApiHandler,
+                                                  TreeApiHandler,
+                                                  UploadApiHandler)
 from zasper_py.api.identityApiHandler import IdentityApiHandler
 from zasper_py.api.infoApiHandler import InfoApiHandler
 from zasper_py.api.kernelActionApiHandler import KernelActionApiHandler
 from zasper_py.api.kernelApiHandler import KernelApiHandler, RootKernelApiHandler
 from zasper_py.api.kernelSpecApiHandler import KernelSpecApiHandler
+from zasper_py.api.metricsApiHandler import MetricsApiHandler
+from zasper_py.api.searchApiHandler import SearchApiHandler
 from zasper_py.api.projectApiHandler import ProjectApiHandler
+from zasper_py.api.rawFileApiHandler import RawFileApiHandler
 from zasper_py.api.secretApiHandler import SecretApiHandler
 from zasper_py.api.sessionApiHandler import (SessionApiHandler,
                                                   SessionRootApiHandler)
@@ -27,7 +38,11 @@ from zasper_py.api.singleKernelSpecApiHandler import \
 from zasper_py.api.singleProjectApiHandler import SingleProjectApiHandler
 from zasper_py.api.statusApiHandler import StatusApiHandler
 from zasper_py.api.terminalApiHandler import TerminalApiHandler, TerminalRootApiHandler
+from zasper_py.api.usageApiHandler import UsageApiHandler
+from zasper_py.api.watchApiHandler import WatchWebsocketHandler
 from zasper_py.api.userApiHandler import UserApiHandler
+from zasper_py.services.content.asyncContentsManager import AsyncContentsManager
+from zasper_py.services.content.contentsManager import ContentsManager
 from zasper_py.services.kernels.multiKernelManager import MultiKernelManager
 from zasper_py.services.session.sessionManager import SessionManager
 from zasper_py.services.terminal.terminalManager import TerminalManager
@@ -61,6 +76,8 @@ _session_id_regex = r"(?P<session_id>\w+-\w+-\w+-\w+-\w+)"
 _kernel_id_regex = r"(?P<kernel_id>\w+-\w+-\w+-\w+-\w+)"
 _kernel_action_regex = r"(?P<action>restart|interrupt)"
 
+_batch_id_regex = r"(?P<batch_id>\w+-\w+-\w+-\w+-\w+)"
+
 app = web.Application(
     [
         (r"/", IndexHandler),
@@ -74,6 +91,15 @@ app = web.Application(
         ),
         # (r"/api/contents%s/trust" % path_regex, TrustNotebooksHandler),
         (r"/api/contents%s" % path_regex, ContentApiHandler),
+        (r"/api/upload%s" % path_regex, UploadApiHandler),
+        (r"/api/tree%s" % path_regex, TreeApiHandler),
+        (r"/api/cells%s" % path_regex, NotebookCellsApiHandler),
+        (r"/api/outputs%s" % path_regex, NotebookOutputsApiHandler),
+        (r"/api/window%s" % path_regex, TextWindowApiHandler),
+        (r"/api/raw%s" % path_regex, RawFileApiHandler),
+        (r"/api/batch", BatchApiHandler),
+        (r"/api/batch/%s" % _batch_id_regex, SingleBatchApiHandler),
+        (r"/api/batch/%s/progress" % _batch_id_regex, BatchProgressWebsocketHandler),
         # (r"/api/notebooks/?(.*)", NotebooksRedirectHandler),
         (r"/api/kernelspecs", KernelSpecApiHandler),
         (r"/api/kernelspecs/%s" % kernel_name_regex, SingleKernelSpecApiHandler),
@@ -97,6 +123,10 @@ app = web.Application(
 
         (r"/api/secrets", SecretApiHandler),
         (r"/api/status", StatusApiHandler),
+        (r"/api/search", SearchApiHandler),
+        (r"/api/usage", UsageApiHandler),
+        (r"/api/watch", WatchWebsocketHandler),
+        (r"/metrics", MetricsApiHandler),
         (r"/(script.js)", web.StaticFileHandler, {"path": "./"}),
         (r"/(rest_api_example.png)", web.StaticFileHandler, {"path": "./"}),
     ]
@@ -136,6 +166,7 @@ def initialize_tm() -> TerminalManager:
     # self.terminal_manager.log = self.serverapp.log
 
 
+app._contents_manager = AsyncContentsManager(ContentsManager())
 app._session_manager = SessionManager()
 app._kernel_manager = MultiKernelManager()
 app._terminal_manager = initialize_tm()
@@ -155,6 +186,10 @@ def main():
     for handler in logging.getLogger().handlers:
         handler.addFilter(my_filter)
 
+    if app._contents_manager.search_index_at_startup:
+        app._contents_manager.start_search_index()
+    if app._contents_manager.disk_usage_at_startup:
+        app._contents_manager.start_disk_usage()
     app.listen(8888)
 
     logger.info("Listening at http://localhost:%d", 8888)
@@ -1,3 +1,4 @@
+import errno
 import logging
 import os
 import site
@@ -16,6 +17,8 @@ logger = logging.getLogger(__name__)
 
 APPNAME = "zasper"
 
+UF_HIDDEN = getattr(stat, "UF_HIDDEN", 32768)
+
 
 def envset(name: str, default: Optional[bool] = False) -> Optional[bool]:
     """Return the boolean value of a given environment variable.
@@ -0,0 +1,256 @@
+"""Awaitable front of ContentsManager for the request handlers.
+
+Every filesystem operation of the wrapped manager runs on a bounded
+``ContentsExecutor`` pool, so a large read, save or delete never blocks the
+IOLoop. Writes to the same path are serialized, reads are not.
+"""
+import asyncio
+import functools
+import itertools
+import os
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List
+
+from tornado import web
+
+from zasper_py.services.content.batchOps import Batch
+from zasper_py.services.content.changeNotifier import ChangeNotifier
+from zasper_py.services.content.contentsManager import ContentsManager
+from zasper_py.services.content.executor import ContentsExecutor
+from zasper_py.services.content.saveCoalescer import SaveCoalescer
+from zasper_py.utils import run_sync
+
+# finished batches kept for GET /api/batch/<id>
+KEEP_FINISHED_BATCHES = 100
+
+
+class AsyncContentsManager:
+    """Run the methods of a ``ContentsManager`` on worker threads.
+
+    Attributes not wrapped here (``root_dir``, ``_get_os_path``, ...) are
+    those of the wrapped manager.
+    """
+
+    def __init__(self, manager: ContentsManager = None, max_workers: int = None):
+        self.manager = manager if manager is not None else ContentsManager()
+        if max_workers is None:
+            max_workers = self.manager.executor_max_workers
+        self.executor = ContentsExecutor(max_workers=max_workers)
+        self.coalescer = None
+        if self.manager.save_coalesce_window > 0:
+            self.coalescer = SaveCoalescer(
+                self._save_batch,
+                window=self.manager.save_coalesce_window,
+                max_batch=self.manager.save_batch_size,
+            )
+        self._batches: "OrderedDict[str, Batch]" = OrderedDict()
+        self._change_notifier = None
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    # reads
+
+    async def get(
+            self, path, content=True, type=None, format=None, require_hash=False, outputs=None
+    ):
+        return await self.executor.run(
+            "get", self.manager.get, path, content=content, type=type, format=format,
+            require_hash=require_hash, outputs=outputs,
+        )
+
+    async def get_etag(
+            self, path, content=True, type=None, format=None, require_hash=False, outputs=None
+    ):
+        return await self.executor.run(
+            "get", self.manager.get_etag, path, content=content, type=type, format=format,
+            require_hash=require_hash, outputs=outputs,
+        )
+
+    async def get_cell_outputs(self, path, ids=None, indices=None, hash=None, hash_algorithm=None):
+        return await self.executor.run(
+            "get", self.manager.get_cell_outputs, path, ids=ids, indices=indices, hash=hash,
+            hash_algorithm=hash_algorithm,
+        )
+
+    async def get_text_window(self, path, offset=0, lines=None, length=None, from_end=False):
+        return await self.executor.run(
+            "get", self.manager.get_text_window, path, offset=offset, lines=lines,
+            length=length, from_end=from_end,
+        )
+
+    async def export_notebook(self, path):
+        return await self.executor.run("get", self.manager.export_notebook, path)
+
+    async def exists(self, path):
+        return await self.executor.run("exists", self.manager.exists, path)
+
+    async def file_exists(self, path):
+        return await self.executor.run("exists", self.manager.file_exists, path)
+
+    async def dir_exists(self, path):
+        return await self.executor.run("exists", self.manager.dir_exists, path)
+
+    async def is_hidden(self, path):
+        return await self.executor.run("exists", self.manager.is_hidden, path)
+
+    async def list_directory(self, path, sort=None, cursor=None, limit=None):
+        return await self.executor.run(
+            "list", self.manager.list_directory, path, sort=sort, cursor=cursor, limit=limit
+        )
+
+    async def iter_directory(self, path, batch_size: int = 500) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the entries of ``path`` in batches read on the pool."""
+        entries = await self.executor.run("list", self.manager.iter_directory, path)
+        while True:
+            batch = await self.executor.run("list", list, itertools.islice(entries, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    async def get_tree(self, path="", depth=1):
+        return await self.executor.run("tree", self.manager.get_tree, path, depth)
+
+    async def get_tree_etag(self, path="", depth=1):
+        return await self.executor.run("tree", self.manager.get_tree_etag, path, depth)
+
+    async def search(self, query, path="", kinds=None, limit=50):
+        return await self.executor.run(
+            "search", self.manager.search, query, path=path, kinds=kinds, limit=limit
+        )
+
+    async def usage(self, path="", depth=1):
+        return await self.executor.run("usage", self.manager.usage, path, depth)
+
+    async def get_upload_offset(self, path):
+        return await self.executor.run("upload", self.manager.get_upload_offset, path)
+
+    async def get_kernel_path(self, path, model=None):
+        return await self.manager.get_kernel_path(path, model=model)
+
+    # writes
+
+    async def save(self, model, path=""):
+        if (
+                self.coalescer is not None
+                and model.get("chunk") is None
+                and model.get("type") in {"file", "notebook"}
+        ):
+            return await self.coalescer.save(model, path)
+        async with self.executor.serialize(path):
+            return await self.executor.run("save", self.manager.save, model, path)
+
+    async def _save_batch(self, saves):
+        async with self.executor.serialize(*[path for _, path in saves]):
+            return await self.executor.run("save", self.manager.save_batch, saves)
+
+    async def save_cell_ops(self, path, ops, base_hash, hash_algorithm=None):
+        async with self.executor.serialize(path):
+            return await self.executor.run(
+                "save", self.manager.save_cell_ops, path, ops, base_hash,
+                hash_algorithm=hash_algorithm,
+            )
+
+    async def new(self, model=None, path=""):
+        async with self.executor.serialize(path):
+            return await self.executor.run("new", self.manager.new, model, path)
+
+    async def new_untitled(self, path="", type="", ext=""):
+        # the name is picked from the directory listing: one at a time per directory
+        async with self.executor.serialize(path):
+            return await self.executor.run(
+                "new", self.manager.new_untitled, path=path, type=type, ext=ext
+            )
+
+    async def update(self, model, path):
+        new_path = model.get("path", path)
+        async with self.executor.serialize(path, new_path):
+            return await self.executor.run("rename", self.manager.update, model, path)
+
+    async def rename(self, old_path, new_path):
+        async with self.executor.serialize(old_path, new_path):
+            return await self.executor.run("rename", self.manager.rename, old_path, new_path)
+
+    async def copy(self, from_path, to_path=None, progress=None):
+        """Copy on the pool; ``progress(copied, total)`` is called on the
+        IOLoop as the copy advances."""
+        if progress is not None:
+            loop = asyncio.get_running_loop()
+            progress = functools.partial(loop.call_soon_threadsafe, progress)
+        # the name of the copy may be picked from the listing of to_path
+        async with self.executor.serialize(from_path, to_path or ""):
+            return await self.executor.run(
+                "copy", self.manager.copy, from_path, to_path, progress=progress
+            )
+
+    async def delete(self, path):
+        async with self.executor.serialize(path):
+            return await self.executor.run("delete", run_sync(self.manager.delete), path)
+
+    async def open_upload(self, path, offset=0):
+        return await self.executor.run("upload", self.manager.open_upload, path, offset)
+
+    async def write_upload(self, upload, chunk):
+        return await self.executor.run("upload", upload.write, chunk)
+
+    async def finish_upload(self, path, upload):
+        async with self.executor.serialize(path):
+            return await self.executor.run("upload", self.manager.finish_upload, path, upload)
+
+    async def create_checkpoint(self, path):
+        async with self.executor.serialize(path):
+            return await self.executor.run("checkpoint", self.manager.create_checkpoint, path)
+
+    async def list_checkpoints(self, path):
+        return await self.executor.run("checkpoint", self.manager.list_checkpoints, path)
+
+    async def restore_checkpoint(self, path, checkpoint_id):
+        async with self.executor.serialize(path):
+            return await self.executor.run(
+                "checkpoint", self.manager.restore_checkpoint, path, checkpoint_id
+            )
+
+    async def delete_checkpoints(self, path, checkpoint_id):
+        async with self.executor.serialize(path):
+            return await self.executor.run(
+                "checkpoint", self.manager.delete_checkpoints, path, checkpoint_id
+            )
+
+    # batches
+
+    def start_batch(self, operations) -> Batch:
+        """Validate a list of operations and start running them."""
+        batch = Batch(operations)
+        self._batches[batch.id] = batch
+        finished = [key for key, old in self._batches.items() if old.done]
+        for key in finished[:max(0, len(finished) - KEEP_FINISHED_BATCHES)]:
+            del self._batches[key]
+        batch.start(self, self.manager.batch_max_parallel)
+        return batch
+
+    def get_batch(self, batch_id) -> Batch:
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            raise web.HTTPError(404, "No such batch: %s" % batch_id)
+        return batch
+
+    # changes
+
+    @property
+    def change_notifier(self) -> ChangeNotifier:
+        """The ChangeNotifier of root_dir, created on first use on the IOLoop."""
+        notifier = self._change_notifier
+        if notifier is None or notifier.root_dir != os.path.abspath(self.manager.root_dir):
+            if notifier is not None:
+                notifier.close()
+            notifier = self._change_notifier = ChangeNotifier(
+                self.manager.root_dir,
+                allow_hidden=self.manager.allow_hidden,
+                watcher=self.manager.workspace_watcher,
+            )
+        return notifier
+
+    def shutdown(self):
+        self.executor.shutdown()
+        if self._change_notifier is not None:
+            self._change_notifier.close()
@@ -0,0 +1,254 @@
+"""Batches of copy, move, delete and mkdir operations.
+
+A batch is a list of operations on API paths::
+
+    {"op": "mkdir", "path": "reports"}
+    {"op": "move", "from": "a.ipynb", "to": "reports/a.ipynb"}
+    {"op": "copy", "from": "data", "to": "backup"}
+    {"op": "delete", "path": "old"}
+
+run on the contents pool, at most ``max_parallel`` at a time. A move
+renames ``from`` to ``to``; a copy into an existing directory ``to`` picks
+the name of the copy, as POST /api/contents with ``copy_from`` does.
+
+Operations whose paths overlap (the same path, or one inside the other)
+run one after the other, in the order given, except that an operation
+creating a path runs before those creating paths inside it: the directory
+is made before anything is moved or copied into it, wherever it is in the
+list. Operations that do not overlap run concurrently. When an operation
+fails, those that had to wait for it are skipped.
+
+Each operation gets a result::
+
+    {"index": 1, "op": "move", "status": "ok", "path": "reports/a.ipynb"}
+    {"index": 3, "op": "delete", "status": "error", "code": 404, "error": "..."}
+    {"index": 4, "op": "move", "status": "skipped", "error": "operation 3 failed"}
+
+and, while a copy runs, its subscribers are also sent its progress::
+
+    {"index": 2, "op": "copy", "status": "running", "bytes": 4194304, "total": 5368709120}
+"""
+import asyncio
+import logging
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from tornado import web
+
+from zasper_py.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_OPERATIONS_TOTAL = metrics.CONTENTS_BATCH_OPERATIONS_TOTAL
+
+# keys of the paths of each operation
+OPERATIONS = {
+    "copy": ("from", "to"),
+    "move": ("from", "to"),
+    "delete": ("path",),
+    "mkdir": ("path",),
+}
+
+# most operations in one batch
+MAX_BATCH_OPERATIONS = 10000
+
+
+def _ancestors(path: str):
+    """``path`` and the directories above it, up to (not including) the root."""
+    while path:
+        yield path
+        path = path.rpartition("/")[0]
+
+
+def _created(operation: Dict[str, str]) -> Optional[str]:
+    """The path an operation creates, if any."""
+    if operation["op"] == "mkdir":
+        return operation["path"]
+    return operation.get("to") or None
+
+
+def _inside(path: Optional[str], directory: Optional[str]) -> bool:
+    return path is not None and directory is not None and path.startswith(directory + "/")
+
+
+def parse_operations(operations: Any) -> List[Dict[str, str]]:
+    """Validate the operations of a batch, with their paths stripped."""
+    if not isinstance(operations, list) or not operations:
+        raise web.HTTPError(400, "operations must be a non-empty list")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise web.HTTPError(400, "At most %d operations per batch" % MAX_BATCH_OPERATIONS)
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise web.HTTPError(
+                400, "Operation %d: op must be one of %s" % (index, ", ".join(OPERATIONS))
+            )
+        op = operation["op"]
+        parsed_op = {"op": op}
+        for key in OPERATIONS[op]:
+            path = operation.get(key)
+            if not isinstance(path, str) or not path.strip("/"):
+                if key == "to" and op == "copy" and isinstance(path, str):
+                    # copy into the root directory
+                    parsed_op[key] = ""
+                    continue
+                raise web.HTTPError(400, "Operation %d: %s needs a %r path" % (index, op, key))
+            parsed_op[key] = path.strip("/")
+        parsed.append(parsed_op)
+    return parsed
+
+
+def plan(operations: List[Dict[str, str]]) -> List[Set[int]]:
+    """The indices of the operations each operation waits for.
+
+    Raises 400 when operations wait for each other.
+    """
+    touched: Dict[str, List[int]] = {}
+    for index, operation in enumerate(operations):
+        for key in OPERATIONS[operation["op"]]:
+            touched.setdefault(operation[key], []).append(index)
+
+    depends_on: List[Set[int]] = [set() for _ in operations]
+    for j, operation in enumerate(operations):
+        for key in OPERATIONS[operation["op"]]:
+            for ancestor in _ancestors(operation[key]):
+                for i in touched.get(ancestor, ()):
+                    if i == j:
+                        continue
+                    # i and j overlap: list order, unless one creates a
+                    # path the other creates something in
+                    created_i, created_j = _created(operations[i]), _created(operations[j])
+                    if _inside(created_i, created_j):
+                        depends_on[i].add(j)
+                    elif _inside(created_j, created_i):
+                        depends_on[j].add(i)
+                    else:
+                        depends_on[max(i, j)].add(min(i, j))
+
+    # Kahn's algorithm, to refuse cycles before running anything
+    waiting = [len(deps) for deps in depends_on]
+    dependents: List[List[int]] = [[] for _ in operations]
+    for index, deps in enumerate(depends_on):
+        for dep in deps:
+            dependents[dep].append(index)
+    ready = [index for index, count in enumerate(waiting) if count == 0]
+    ordered = 0
+    while ready:
+        index = ready.pop()
+        ordered += 1
+        for dependent in dependents[index]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                ready.append(dependent)
+    if ordered < len(operations):
+        cycle = [index for index, count in enumerate(waiting) if count]
+        raise web.HTTPError(
+            400, "Operations %s depend on each other" % ", ".join(map(str, cycle[:10]))
+        )
+    return depends_on
+
+
+class Batch:
+    """A running or finished batch of operations.
+
+    ``subscribe`` registers a callback called with each result as the
+    operation completes (and with the progress of copies), and with None
+    when the whole batch is done.
+    """
+
+    def __init__(self, operations: Any):
+        self.id = str(uuid.uuid4())
+        self.operations = parse_operations(operations)
+        self.depends_on = plan(self.operations)
+        self.results: List[Optional[Dict[str, Any]]] = [None] * len(self.operations)
+        self.completed = 0
+        self.failed = 0
+        self.task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[Optional[Dict[str, Any]]], None]] = []
+
+    @property
+    def done(self) -> bool:
+        return self.completed == len(self.operations)
+
+    def model(self, results: bool = True) -> Dict[str, Any]:
+        model = {
+            "id": self.id,
+            "total": len(self.operations),
+            "completed": self.completed,
+            "failed": self.failed,
+            "done": self.done,
+        }
+        if results:
+            model["results"] = [result for result in self.results if result is not None]
+        return model
+
+    def subscribe(self, callback: Callable[[Optional[Dict[str, Any]]], None]) -> None:
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Optional[Dict[str, Any]]], None]) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def start(self, cm, max_parallel: int) -> asyncio.Task:
+        """Run the batch on ``cm``, an AsyncContentsManager."""
+        self.task = asyncio.ensure_future(self._run(cm, max_parallel))
+        return self.task
+
+    async def _run(self, cm, max_parallel: int) -> None:
+        semaphore = asyncio.Semaphore(max_parallel)
+        tasks: List[asyncio.Task] = []
+        for index in range(len(self.operations)):
+            tasks.append(asyncio.ensure_future(self._run_one(cm, index, semaphore, tasks)))
+        await asyncio.gather(*tasks)
+        for callback in list(self._listeners):
+            callback(None)
+        self._listeners.clear()
+
+    async def _run_one(self, cm, index: int, semaphore: asyncio.Semaphore, tasks) -> bool:
+        operation = self.operations[index]
+        result = {"index": index, "op": operation["op"]}
+        for dep in sorted(self.depends_on[index]):
+            if not await tasks[dep]:
+                result.update(status="skipped", error="operation %d failed" % dep)
+                return self._complete(result)
+        async with semaphore:
+            try:
+                model = await self._apply(cm, index, operation)
+            except web.HTTPError as e:
+                result.update(status="error", code=e.status_code, error=e.log_message or e.reason)
+            except Exception as e:
+                logger.exception("Batch %s operation %d failed", self.id, index)
+                result.update(status="error", code=500, error=str(e))
+            else:
+                result["status"] = "ok"
+                if model is not None:
+                    result["path"] = model["path"]
+        return self._complete(result)
+
+    async def _apply(self, cm, index: int, operation: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        op = operation["op"]
+        if op == "copy":
+            def progress(copied, total):
+                running = {"index": index, "op": op, "status": "running"}
+                running.update(bytes=copied, total=total)
+                for callback in list(self._listeners):
+                    callback(running)
+
+            return await cm.copy(operation["from"], operation["to"], progress=progress)
+        if op == "move":
+            await cm.rename(operation["from"], operation["to"])
+            return {"path": operation["to"]}
+        if op == "mkdir":
+            return await cm.new({"type": "directory"}, operation["path"])
+        await cm.delete(operation["path"])
+        return None
+
+    def _complete(self, result: Dict[str, Any]) -> bool:
+        self.results[result["index"]] = result
+        self.completed += 1
+        if result["status"] != "ok":
+            self.failed += 1
+        BATCH_OPERATIONS_TOTAL.labels(result["op"], result["status"]).inc()
+        for callback in list(self._listeners):
+            callback(result)
+        return result["status"] == "ok"
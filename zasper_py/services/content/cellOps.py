@@ -0,0 +1,94 @@
+"""Cell-level edit operations applied to an in-memory notebook.
+
+Each operation is a dict with an ``op`` and addresses an existing cell by
+its ``id`` (or, for notebooks without cell ids, by ``index``):
+
+- ``{"op": "insert", "index": i, "cell": {...}}``
+- ``{"op": "delete", "id": ...}``
+- ``{"op": "replace_source", "id": ..., "source": "..."}``
+- ``{"op": "replace_outputs", "id": ..., "outputs": [...], "execution_count": n}``
+- ``{"op": "move", "id": ..., "to": i}``
+"""
+from typing import Any, Dict, List
+
+import nbformat
+from nbformat.corpus.words import generate_corpus_id
+from tornado import web
+
+from zasper_py.services.content.lazyOutputs import has_stubs
+
+OPS = ("insert", "delete", "replace_source", "replace_outputs", "move")
+
+
+def _find_cell(nb, op: Dict[str, Any]) -> int:
+    if "id" in op:
+        for i, cell in enumerate(nb.cells):
+            if cell.get("id") == op["id"]:
+                return i
+        raise web.HTTPError(409, "No cell with id %r" % op["id"])
+    index = op.get("index")
+    if not isinstance(index, int) or not 0 <= index < len(nb.cells):
+        raise web.HTTPError(400, "Operation %r needs a cell id or a valid index" % op.get("op"))
+    return index
+
+
+def _target_index(nb, op: Dict[str, Any], key: str = "index") -> int:
+    index = op.get(key)
+    if not isinstance(index, int) or not 0 <= index <= len(nb.cells):
+        raise web.HTTPError(400, "Invalid %s for %r: %r" % (key, op["op"], index))
+    return index
+
+
+def _new_cell(nb, cell: Any):
+    if not isinstance(cell, dict) or "cell_type" not in cell:
+        raise web.HTTPError(400, "insert needs a cell with a cell_type")
+    cell = nbformat.from_dict(cell)
+    cell.setdefault("metadata", {})
+    cell.setdefault("source", "")
+    if cell.cell_type == "code":
+        if has_stubs(cell.get("outputs") or []):
+            raise web.HTTPError(400, "insert needs the cell's outputs, not their stubs")
+        cell.setdefault("outputs", [])
+        cell.setdefault("execution_count", None)
+    if nb.nbformat_minor >= 5 and "id" not in cell:
+        cell["id"] = generate_corpus_id()
+    return cell
+
+
+def apply_cell_ops(nb, ops: List[Dict[str, Any]]):
+    """Apply ``ops`` in order to ``nb``, in place.
+
+    Raises 400 for malformed operations and 409 for ones that address a
+    cell that does not exist.
+    """
+    if not isinstance(ops, list):
+        raise web.HTTPError(400, "ops must be a list")
+    for op in ops:
+        kind = op.get("op") if isinstance(op, dict) else None
+        if kind not in OPS:
+            raise web.HTTPError(400, "Unknown cell operation: %r" % (kind,))
+
+        if kind == "insert":
+            cell = _new_cell(nb, op.get("cell"))
+            nb.cells.insert(_target_index(nb, op), cell)
+        elif kind == "delete":
+            del nb.cells[_find_cell(nb, op)]
+        elif kind == "replace_source":
+            source = op.get("source")
+            if not isinstance(source, (str, list)):
+                raise web.HTTPError(400, "replace_source needs a source")
+            nb.cells[_find_cell(nb, op)].source = source
+        elif kind == "replace_outputs":
+            cell = nb.cells[_find_cell(nb, op)]
+            if cell.cell_type != "code":
+                raise web.HTTPError(400, "Only code cells have outputs")
+            outputs = op.get("outputs", [])
+            if not isinstance(outputs, list) or has_stubs(outputs):
+                raise web.HTTPError(400, "replace_outputs needs a list of full outputs")
+            cell.outputs = [nbformat.from_dict(output) for output in outputs]
+            if "execution_count" in op:
+                cell.execution_count = op["execution_count"]
+        elif kind == "move":
+            cell = nb.cells.pop(_find_cell(nb, op))
+            nb.cells.insert(_target_index(nb, op, key="to"), cell)
+    return nb
@@ -0,0 +1,378 @@
+"""Changes to the entries of watched directories, pushed to subscribers.
+
+Subscribers (the /api/watch websockets) subscribe to directories. Each
+subscribed directory has one inotify watch, shared by all its subscribers,
+on the SharedWatcher of ContentsManager; its events are handed over to the
+IOLoop. The events of a window of
+``COALESCE_WINDOW`` seconds are coalesced per path and then sent, as one
+list, to every subscriber of the directories they happened in::
+
+    {"type": "created", "path": "data/out.csv", "kind": "file"}
+    {"type": "modified", "path": "data/out.csv", "kind": "file"}
+    {"type": "deleted", "path": "data/tmp", "kind": "directory"}
+    {"type": "renamed", "path": "data/b.csv", "old_path": "data/a.csv", "kind": "file"}
+
+A file created then written in a window is one ``created``, created then
+deleted is nothing, and so on. When more than ``MAX_DIR_CHANGES`` paths of
+one directory change in a window (``pip install``, ``git checkout``...),
+its subscribers get a single ``{"type": "rescan", "path": ...}`` instead:
+the directory should be listed again. The same is sent for every directory
+if the kernel queue overflows.
+
+Where inotify is not available, subscribed directories are listed every
+``POLL_INTERVAL`` seconds on a worker thread and compared to their last
+listing; renames are then seen as a deletion and a creation.
+"""
+import logging
+import os
+import stat
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from tornado import web
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from zasper_py.services.content.fileWatcher import (IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE,
+                                                     IN_DELETE, IN_DELETE_SELF, IN_ISDIR,
+                                                     IN_MODIFY, IN_MOVE_SELF, IN_MOVED_FROM,
+                                                     IN_MOVED_TO, IN_Q_OVERFLOW, SharedWatcher)
+
+logger = logging.getLogger(__name__)
+
+# seconds during which the events of a path are coalesced
+COALESCE_WINDOW = 0.2
+
+# changed paths of one directory in a window beyond which a rescan is sent
+MAX_DIR_CHANGES = 200
+
+# seconds between two listings of the subscribed directories without inotify
+POLL_INTERVAL = 2.0
+
+Subscriber = Callable[[List[Dict[str, str]]], None]
+
+# coalesced type of a path, from its previous type and a new event
+_MERGE = {
+    ("created", "modified"): "created",
+    ("created", "deleted"): None,
+    ("modified", "deleted"): "deleted",
+    ("deleted", "created"): "modified",
+    ("deleted", "modified"): "modified",
+    ("renamed", "created"): "renamed",
+    ("renamed", "modified"): "renamed",
+}
+
+
+class _Change:
+    __slots__ = ("type", "path", "old_path", "kind")
+
+    def __init__(self, type: str, path: str, kind: str, old_path: Optional[str] = None):
+        self.type = type
+        self.path = path
+        self.kind = kind
+        self.old_path = old_path
+
+    def model(self) -> Dict[str, str]:
+        model = {"type": self.type, "path": self.path, "kind": self.kind}
+        if self.old_path is not None:
+            model["old_path"] = self.old_path
+        return model
+
+
+class ChangeNotifier:
+    """Watch the directories under ``root_dir`` that have subscribers, and
+    send them the coalesced changes of their entries.
+
+    Must be used from the IOLoop thread.
+    """
+
+    def __init__(
+            self,
+            root_dir: str,
+            allow_hidden: bool = False,
+            window: float = COALESCE_WINDOW,
+            use_inotify: bool = True,
+            watcher: Optional[SharedWatcher] = None,
+    ):
+        self.root_dir = os.path.abspath(root_dir)
+        self.allow_hidden = allow_hidden
+        self.window = window
+        # the watcher may be shared with other services, it is only closed
+        # by close() if it was created here
+        self._owns_watcher = watcher is None
+        if watcher is None and use_inotify:
+            watcher = SharedWatcher()
+        self.watcher = watcher
+        self._loop = IOLoop.current()
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        # os_dir -> name -> change, for the current window
+        self._pending: Dict[str, Dict[str, _Change]] = {}
+        # changes of the current window seen by the source directory of a rename
+        self._moved_out: Dict[str, List[_Change]] = {}
+        # directories to rescan at the end of the current window
+        self._rescan: Set[str] = set()
+        # cookie -> (os_dir, name, kind) of a move whose destination is not known yet
+        self._moves: Dict[int, Tuple[str, str, str]] = {}
+        self._flush_handle = None
+        self._poller: Optional[PeriodicCallback] = None
+        self._listings: Dict[str, Dict[str, Tuple[bool, int, int]]] = {}
+
+    @property
+    def watching(self) -> bool:
+        return self.watcher is not None and self.watcher.available
+
+    def _os_dir(self, path: str) -> str:
+        # "data", "data/" and "data/." are one subscription
+        path = path.strip("/")
+        if not path:
+            return self.root_dir
+        return os.path.normpath(os.path.join(self.root_dir, *path.split("/")))
+
+    def _api_path(self, os_path: str) -> str:
+        relpath = os.path.relpath(os_path, self.root_dir)
+        return "" if relpath == os.curdir else relpath.replace(os.sep, "/")
+
+    # subscriptions
+
+    def subscribe(self, path: str, subscriber: Subscriber) -> str:
+        """Send the changes of the directory ``path`` to ``subscriber``.
+        Returns the normalized API path."""
+        os_dir = self._os_dir(path)
+        if not os.path.isdir(os_dir) or self._api_path(os_dir).startswith(os.pardir):
+            raise web.HTTPError(404, "directory does not exist: %r" % path)
+        if not self.allow_hidden and any(
+                name.startswith(".") for name in self._api_path(os_dir).split("/")
+        ):
+            raise web.HTTPError(404, "directory does not exist: %r" % path)
+        subscribers = self._subscribers.setdefault(os_dir, set())
+        if not subscribers:
+            self._watch(os_dir)
+        subscribers.add(subscriber)
+        return self._api_path(os_dir)
+
+    def unsubscribe(self, path: str, subscriber: Subscriber) -> None:
+        os_dir = self._os_dir(path)
+        subscribers = self._subscribers.get(os_dir)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[os_dir]
+            self._unwatch(os_dir)
+
+    def unsubscribe_all(self, subscriber: Subscriber) -> None:
+        for os_dir in [d for d, subscribers in self._subscribers.items() if subscriber in subscribers]:
+            self.unsubscribe(self._api_path(os_dir), subscriber)
+
+    def _watch(self, os_dir: str) -> None:
+        if self.watching and self.watcher.add_watch(os_dir, self._on_watcher_events):
+            self.watcher.subscribe(self._on_watcher_events)
+            return
+        # no inotify, or no watch left: poll
+        self._listings.pop(os_dir, None)
+        if self._poller is None:
+            self._poller = PeriodicCallback(self._poll, POLL_INTERVAL * 1000)
+            self._poller.start()
+
+    def _unwatch(self, os_dir: str) -> None:
+        if self.watcher is not None:
+            self.watcher.rm_watch(os_dir, self._on_watcher_events)
+        self._listings.pop(os_dir, None)
+
+    def close(self) -> None:
+        if self.watcher is not None:
+            self.watcher.unsubscribe(self._on_watcher_events)
+            if self._owns_watcher:
+                self.watcher.close()
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
+        if self._flush_handle is not None:
+            IOLoop.current().remove_timeout(self._flush_handle)
+            self._flush_handle = None
+        self._subscribers.clear()
+
+    # events
+
+    def _hidden(self, name: str) -> bool:
+        return not self.allow_hidden and name.startswith(".")
+
+    def _on_watcher_events(self, events) -> None:
+        # called on the thread of the watcher
+        self._loop.add_callback(self._on_events, events)
+
+    def _on_events(self, events) -> None:
+        for event in events:
+            if event.mask & IN_Q_OVERFLOW:
+                self._rescan.update(self._subscribers)
+                self._pending.clear()
+                self._moved_out.clear()
+                continue
+            kind = "directory" if event.mask & IN_ISDIR else "file"
+            if event.mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._record_self(event.os_dir)
+            elif self._hidden(event.name):
+                continue
+            elif event.mask & IN_MOVED_FROM:
+                self._moves[event.cookie] = (event.os_dir, event.name, kind)
+            elif event.mask & IN_MOVED_TO:
+                source = self._moves.pop(event.cookie, None)
+                if source is None:
+                    self._record(event.os_dir, event.name, "created", kind)
+                else:
+                    self._record_rename(source[0], source[1], event.os_dir, event.name, kind)
+            elif event.mask & IN_CREATE:
+                self._record(event.os_dir, event.name, "created", kind)
+            elif event.mask & IN_DELETE:
+                self._record(event.os_dir, event.name, "deleted", kind)
+            elif event.mask & (IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB):
+                self._record(event.os_dir, event.name, "modified", kind)
+        self._schedule_flush()
+
+    def _record_self(self, os_dir: str) -> None:
+        """The subscribed directory itself was deleted or moved away."""
+        change = _Change("deleted", self._api_path(os_dir), "directory")
+        self._moved_out.setdefault(os_dir, []).append(change)
+
+    def _changes(self, os_dir: str) -> Optional[Dict[str, _Change]]:
+        """The pending changes of ``os_dir``, None if it is to be rescanned."""
+        if os_dir in self._rescan:
+            return None
+        changes = self._pending.setdefault(os_dir, {})
+        if len(changes) >= MAX_DIR_CHANGES:
+            logger.debug("More than %d changes in %s, sending a rescan", MAX_DIR_CHANGES, os_dir)
+            self._rescan.add(os_dir)
+            del self._pending[os_dir]
+            self._moved_out.pop(os_dir, None)
+            return None
+        return changes
+
+    def _record(self, os_dir: str, name: str, type: str, kind: str) -> None:
+        changes = self._changes(os_dir)
+        if changes is None:
+            return
+        previous = changes.get(name)
+        if previous is None:
+            changes[name] = _Change(type, self._api_path(os.path.join(os_dir, name)), kind)
+            return
+        merged = _MERGE.get((previous.type, type), type)
+        if merged is None:
+            del changes[name]
+        elif previous.type == "renamed" and merged == "deleted":
+            # renamed then deleted: the original path is gone
+            previous.type, previous.path, previous.old_path = "deleted", previous.old_path, None
+        else:
+            previous.type = merged
+            previous.kind = kind
+
+    def _record_rename(
+            self, from_dir: str, from_name: str, to_dir: str, to_name: str, kind: str
+    ) -> None:
+        path = self._api_path(os.path.join(to_dir, to_name))
+        old_path = self._api_path(os.path.join(from_dir, from_name))
+        from_changes = self._changes(from_dir)
+        previous = from_changes.pop(from_name, None) if from_changes is not None else None
+        if previous is not None and previous.type == "created":
+            # created and moved in the window: created where it is now
+            self._record(to_dir, to_name, "created", kind)
+            return
+        if previous is not None and previous.type == "renamed":
+            old_path = previous.old_path
+        to_changes = self._changes(to_dir)
+        change = _Change("renamed", path, kind, old_path=old_path)
+        if to_changes is not None:
+            to_changes[to_name] = change
+        if from_dir != to_dir and from_changes is not None:
+            self._moved_out.setdefault(from_dir, []).append(change)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is not None:
+            return
+        if not (self._pending or self._moved_out or self._rescan or self._moves):
+            return
+        self._flush_handle = IOLoop.current().call_later(self.window, self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        # moves out of the watched directories are deletions
+        for os_dir, name, kind in self._moves.values():
+            self._record(os_dir, name, "deleted", kind)
+        self._moves.clear()
+
+        batches: Dict[Subscriber, List[Dict[str, str]]] = {}
+        sent: Dict[Subscriber, Set[int]] = {}
+        for os_dir in self._rescan:
+            for subscriber in self._subscribers.get(os_dir, ()):
+                batches.setdefault(subscriber, []).append(
+                    {"type": "rescan", "path": self._api_path(os_dir)}
+                )
+        for os_dir in set(self._pending) | set(self._moved_out):
+            changes = list(self._pending.get(os_dir, {}).values()) + self._moved_out.get(os_dir, [])
+            for subscriber in self._subscribers.get(os_dir, ()):
+                seen = sent.setdefault(subscriber, set())
+                batch = batches.setdefault(subscriber, [])
+                for change in changes:
+                    # a move between two subscribed directories is sent once
+                    if id(change) not in seen:
+                        seen.add(id(change))
+                        batch.append(change.model())
+        self._pending.clear()
+        self._moved_out.clear()
+        self._rescan.clear()
+
+        for subscriber, events in batches.items():
+            if not events:
+                continue
+            try:
+                subscriber(events)
+            except Exception:
+                logger.exception("Failed to send contents events")
+
+    # polling
+
+    @staticmethod
+    def _list(os_dir: str) -> Optional[Dict[str, Tuple[bool, int, int]]]:
+        try:
+            with os.scandir(os_dir) as entries:
+                listing = {}
+                for entry in entries:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    listing[entry.name] = (stat.S_ISDIR(st.st_mode), st.st_mtime_ns, st.st_size)
+                return listing
+        except OSError:
+            return None
+
+    async def _poll(self) -> None:
+        loop = IOLoop.current()
+        start = time.monotonic()
+        for os_dir in list(self._subscribers):
+            if self.watching and self.watcher.is_watched(os_dir, self._on_watcher_events):
+                continue
+            listing = await loop.run_in_executor(None, self._list, os_dir)
+            previous = self._listings.get(os_dir)
+            if listing is None:
+                if previous is not None:
+                    self._record_self(os_dir)
+                self._listings.pop(os_dir, None)
+                continue
+            self._listings[os_dir] = listing
+            if previous is None:
+                # first listing, nothing to compare it to
+                continue
+            for name in listing.keys() | previous.keys():
+                if self._hidden(name):
+                    continue
+                now, before = listing.get(name), previous.get(name)
+                if now == before:
+                    continue
+                kind = "directory" if (now or before)[0] else "file"
+                if before is None:
+                    self._record(os_dir, name, "created", kind)
+                elif now is None:
+                    self._record(os_dir, name, "deleted", kind)
+                else:
+                    self._record(os_dir, name, "modified", kind)
+        logger.debug("Polled %d directories in %.1fms", len(self._subscribers), (time.monotonic() - start) * 1000)
+        self._schedule_flush()
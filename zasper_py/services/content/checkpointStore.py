@@ -0,0 +1,274 @@
+"""Checkpoints kept as compressed, content-addressed chunks.
+
+A checkpoint is a manifest: the list of the digests of the chunks making
+up the file. Chunks are cut at content-defined line boundaries, so an edit
+only changes the chunks around it and the rest are shared with the previous
+checkpoints of the file. Each chunk is stored once, zlib compressed, under
+``chunks/<digest[:2]>/<digest[2:]>`` and reference counted in the index.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+from tornado import web
+
+logger = logging.getLogger(__name__)
+
+# chunk size bounds, in bytes
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+
+# a line ends a chunk when the low bits of its crc32 are all zero: about one
+# line in 1024, i.e. ~64KiB chunks for notebook JSON
+BOUNDARY_MASK = 0x3FF
+
+COMPRESSION_LEVEL = 6
+
+
+def iter_chunks(data: bytes) -> Iterator[bytes]:
+    """Split ``data`` at content-defined line boundaries.
+
+    Boundaries depend only on the line they end, so inserting or removing
+    bytes shifts the boundaries of the chunk that changed and no other.
+    Lines longer than ``MAX_CHUNK_SIZE`` (e.g. base64 images) are cut at
+    fixed offsets.
+    """
+    view = memoryview(data)
+    size = len(data)
+    start = pos = 0
+    while pos < size:
+        end = data.find(b"\n", pos)
+        end = size if end < 0 else end + 1
+        if end - start >= MAX_CHUNK_SIZE:
+            pos = start + MAX_CHUNK_SIZE
+            yield data[start:pos]
+            start = pos
+            continue
+        if end - start >= MIN_CHUNK_SIZE and zlib.crc32(view[pos:end]) & BOUNDARY_MASK == 0:
+            yield data[start:end]
+            start = end
+        pos = end
+    if start < size:
+        yield data[start:]
+
+
+class CheckpointStore:
+    """Deduplicating checkpoint store under ``root``, keyed by OS path.
+
+    The index (SQLite) maps a file path to its checkpoints and each
+    checkpoint to its manifest, so listing and restoring are keyed lookups.
+    Creating a checkpoint reads and hashes the file once, and only
+    compresses and writes the chunks the store does not hold yet.
+    """
+
+    def __init__(self, root: str, max_checkpoints: int = 20):
+        self.root = root
+        self.max_checkpoints = max_checkpoints
+        self._lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        """Start a database connection and create the index tables"""
+        if self._connection is None:
+            os.makedirs(self.root, exist_ok=True)
+            # Set isolation level to None to autocommit all changes to the database.
+            self._connection = sqlite3.connect(
+                os.path.join(self.root, "index.db"), isolation_level=None, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS checkpoint
+                (id TEXT PRIMARY KEY, path TEXT, created REAL, size INTEGER, manifest TEXT)"""
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS checkpoint_path ON checkpoint (path, created)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunk (digest TEXT PRIMARY KEY, refs INTEGER)"
+            )
+        return self._connection
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.root, "chunks", digest[:2], digest[2:])
+
+    def _write_chunk(self, digest: str, chunk: bytes) -> None:
+        chunk_path = self._chunk_path(digest)
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(chunk_path), prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(chunk, COMPRESSION_LEVEL))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, chunk_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _read_chunk(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    @staticmethod
+    def _model(checkpoint_id: str, created: float) -> Dict:
+        return {
+            "id": checkpoint_id,
+            "last_modified": datetime.fromtimestamp(created, tz=timezone.utc),
+        }
+
+    def create(self, path: str, data: bytes) -> Dict:
+        """Checkpoint ``data`` as the content of ``path``."""
+        manifest = []
+        new_chunks = {}
+        for chunk in iter_chunks(data):
+            digest = hashlib.sha256(chunk).hexdigest()
+            manifest.append(digest)
+            new_chunks.setdefault(digest, chunk)
+
+        checkpoint_id = uuid.uuid4().hex
+        created = time.time()
+        with self._lock:
+            known = self._known_chunks(list(new_chunks))
+            # chunks are on disk before the index refers to them
+            for digest, chunk in new_chunks.items():
+                if digest not in known:
+                    self._write_chunk(digest, chunk)
+            db = self.connection
+            db.execute("BEGIN")
+            try:
+                db.executemany(
+                    "INSERT INTO chunk VALUES (?, 1) ON CONFLICT(digest) DO UPDATE SET refs=refs+1",
+                    [(digest,) for digest in manifest],
+                )
+                db.execute(
+                    "INSERT INTO checkpoint VALUES (?, ?, ?, ?, ?)",
+                    (checkpoint_id, path, created, len(data), json.dumps(manifest)),
+                )
+                expired = db.execute(
+                    "SELECT id FROM checkpoint WHERE path=? ORDER BY created DESC LIMIT -1 OFFSET ?",
+                    (path, self.max_checkpoints),
+                ).fetchall()
+                garbage = self._drop(db, [row[0] for row in expired])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self._collect(garbage)
+        return self._model(checkpoint_id, created)
+
+    def _known_chunks(self, digests: List[str]) -> set:
+        known = set()
+        for i in range(0, len(digests), 500):
+            batch = digests[i : i + 500]
+            rows = self.connection.execute(
+                "SELECT digest FROM chunk WHERE digest IN (%s)" % ",".join("?" * len(batch)), batch
+            ).fetchall()
+            known.update(row[0] for row in rows)
+        return known
+
+    def list(self, path: str) -> List[Dict]:
+        """The checkpoints of ``path``, oldest first."""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT id, created FROM checkpoint WHERE path=? ORDER BY created", (path,)
+            ).fetchall()
+        return [self._model(*row) for row in rows]
+
+    def restore(self, path: str, checkpoint_id: str) -> bytes:
+        """The content of ``path`` as of ``checkpoint_id``."""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT manifest FROM checkpoint WHERE id=? AND path=?", (checkpoint_id, path)
+            ).fetchone()
+            if row is None:
+                raise web.HTTPError(404, f"Checkpoint does not exist: {checkpoint_id}")
+            return b"".join(self._read_chunk(digest) for digest in json.loads(row[0]))
+
+    def delete(self, path: str, checkpoint_id: Optional[str] = None) -> None:
+        """Delete one checkpoint of ``path``, or all of them."""
+        with self._lock:
+            db = self.connection
+            if checkpoint_id is None:
+                rows = db.execute("SELECT id FROM checkpoint WHERE path=?", (path,)).fetchall()
+            else:
+                rows = db.execute(
+                    "SELECT id FROM checkpoint WHERE id=? AND path=?", (checkpoint_id, path)
+                ).fetchall()
+                if not rows:
+                    raise web.HTTPError(404, f"Checkpoint does not exist: {checkpoint_id}")
+            db.execute("BEGIN")
+            try:
+                garbage = self._drop(db, [row[0] for row in rows])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self._collect(garbage)
+
+    def delete_all(self, path: str) -> None:
+        """Delete the checkpoints of ``path`` and of every file below it."""
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT path FROM checkpoint WHERE path=? OR substr(path, 1, ?)=?",
+                (path, len(prefix), prefix),
+            ).fetchall()
+        for (checkpoint_path,) in rows:
+            self.delete(checkpoint_path)
+
+    def rename_all(self, old_path: str, new_path: str) -> None:
+        """Move the checkpoints of ``old_path`` (and below it) to ``new_path``."""
+        prefix = old_path.rstrip(os.sep) + os.sep
+        with self._lock:
+            self.connection.execute(
+                """UPDATE checkpoint SET path = ? || substr(path, ?)
+                WHERE path=? OR substr(path, 1, ?)=?""",
+                (new_path, len(old_path) + 1, old_path, len(prefix), prefix),
+            )
+
+    def _drop(self, db, checkpoint_ids: List[str]) -> List[str]:
+        """Delete checkpoints and release their chunks, inside a transaction.
+        Returns the digests no checkpoint refers to any more."""
+        released = set()
+        for checkpoint_id in checkpoint_ids:
+            (manifest,) = db.execute(
+                "SELECT manifest FROM checkpoint WHERE id=?", (checkpoint_id,)
+            ).fetchone()
+            db.execute("DELETE FROM checkpoint WHERE id=?", (checkpoint_id,))
+            manifest = json.loads(manifest)
+            db.executemany(
+                "UPDATE chunk SET refs=refs-1 WHERE digest=?", [(digest,) for digest in manifest]
+            )
+            released.update(manifest)
+        garbage = [
+            digest
+            for digest in released
+            if db.execute("SELECT refs FROM chunk WHERE digest=?", (digest,)).fetchone()[0] <= 0
+        ]
+        db.executemany("DELETE FROM chunk WHERE digest=?", [(digest,) for digest in garbage])
+        return garbage
+
+    def _collect(self, digests: List[str]) -> None:
+        # under the lock: a concurrent create could be writing these again
+        for digest in digests:
+            try:
+                os.unlink(self._chunk_path(digest))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not remove checkpoint chunk %s: %r", digest, e)
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -1,4 +1,6 @@
+import copy
 import errno
+import hashlib
 import itertools
 import json
 import logging
@@ -7,9 +9,13 @@ import os
 import shutil
 import stat
 import sys
-from contextlib import contextmanager
+import tempfile
+import threading
+import time
+from base64 import decodebytes, encodebytes
+from contextlib import contextmanager, suppress
 import typing as t
-from datetime import datetime
+from datetime import datetime, timezone
 from nbformat import ValidationError, sign
 from nbformat.v4 import new_notebook
 from nbformat import validate as validate_nb
@@ -21,10 +27,30 @@ from tornado import web
 from tornado.web import HTTPError
 
 from zasper_py.models.contentModel import ContentModel
-from zasper_py.utils import ApiPath, to_os_path, run_sync
+from zasper_py.core.paths import jupyter_data_dir
+from zasper_py.services.content.cellOps import apply_cell_ops
+from zasper_py.services.content.checkpointStore import CheckpointStore
+from zasper_py.services.content.dirModelCache import DirModelCache
+from zasper_py.services.content.diskUsage import DiskUsage
+from zasper_py.services.content.fileCopy import copy_file, copy_tree
+from zasper_py.services.content.fileWatcher import SharedWatcher
+from zasper_py.services.content.hashIndex import HashIndex
+from zasper_py.services.content.lazyOutputs import cell_outputs, check_no_stubs, lazy_notebook
+from zasper_py.services.content.notebookCache import NotebookCache
+from zasper_py.services.content.outputBlobStore import BLOBS_KEY, OutputBlobStore
+from zasper_py.services.content.pagination import paginate
+from zasper_py.services.content.pathResolver import PathResolver
+from zasper_py.services.content.textWindow import MAX_WINDOW_LINES, LineIndexCache, read_window
+from zasper_py.services.content.upload import ChunkedUpload
+from zasper_py.services.metrics import metrics
+from zasper_py.services.search.searchIndex import SearchIndex
+from zasper_py.utils import to_api_path, run_sync
 
 logger = logging.getLogger(__name__)
 
+FSYNC_SECONDS = metrics.CONTENTS_FSYNC_SECONDS
+GROUP_COMMIT_SIZE = metrics.CONTENTS_GROUP_COMMIT_SIZE
+
 
 class ContentsManager:
     def __init__(self):
@@ -38,11 +64,223 @@ class ContentsManager:
         self.pre_save_hook = None
         self._post_save_hooks = None
         self.use_atomic_writing = True
+        # "replace": write a sibling temp file and rename it over the target.
+        # "copy": back the target up, then rewrite it in place, which keeps
+        # its inode (hard links, ownership) at twice the I/O.
+        self.atomic_writing_mode = "replace"
         self.always_delete_dir = False
         self.delete_to_trash = True
-        self.notary = sign.NotebookNotary()
+        self._notaries = threading.local()
+        # number of directory listings kept in memory
+        self.dir_cache_size = 128
+        self._dir_cache = DirModelCache(max_size=self.dir_cache_size)
+        # parsed notebooks kept in memory, bounded in count and on-disk size
+        self.notebook_cache_size = 32
+        self.notebook_cache_max_bytes = 512 * 1024 ** 2
+        self._notebook_cache = NotebookCache(
+            max_entries=self.notebook_cache_size, max_bytes=self.notebook_cache_max_bytes
+        )
+        # outputs up to this many characters stay inline in lazy notebook models
+        self.lazy_output_inline_size = 1024
+        # store output values of at least output_blob_threshold bytes once, in
+        # output_blobs_dir (default <root_dir>/.zasper/blobs), instead of in
+        # the notebooks
+        self.output_blobs = False
+        self.output_blob_threshold = 64 * 1024
+        self.output_blobs_dir = None
+        self._output_blob_store = None
+        self.hash_algorithm = "sha256"
+        self.hash_index_file = os.path.join(jupyter_data_dir(), "zasper", "file_hashes.db")
+        self._hash_index = HashIndex(self.hash_index_file)
+        # checkpoints of every file, deduplicated across checkpoints and files
+        self.checkpoints_dir = os.path.join(jupyter_data_dir(), "zasper", "checkpoints")
+        self.max_checkpoints = 20
+        self.checkpoints = CheckpointStore(self.checkpoints_dir, max_checkpoints=self.max_checkpoints)
+        # worker threads running blocking operations for AsyncContentsManager
+        self.executor_max_workers = 8
+        # saves of a path within this many seconds are collapsed to the last
+        # one, and saves of different paths are synced in one group commit
+        # (AsyncContentsManager only, 0 disables)
+        self.save_coalesce_window = 0.05
+        self.save_batch_size = 64
+        # operations of a batch (POST /api/batch) running at the same time
+        self.batch_max_parallel = 4
+        self._writing = threading.local()
+        # full-text index of the files under root_dir, one database per root,
+        # built from the first search unless started with the server
+        self.search_index_dir = os.path.join(jupyter_data_dir(), "zasper", "search")
+        self.search_index_at_startup = False
+        self._search_index = None
+        # sizes of the directories under root_dir, walked in the background
+        # with this many threads from the first usage request unless started
+        # with the server
+        self.disk_usage_max_workers = 4
+        self.disk_usage_at_startup = False
+        self._disk_usage = None
+        # inotify watches of the search index and the disk usage tree, one
+        # per directory
+        self._workspace_watcher = None
+        # API paths resolved to OS paths, and whether directories are hidden,
+        # kept in memory
+        self.path_cache_size = 4096
+        self._path_resolver = None
+        # line indexes of the files read by get_text_window
+        self.line_index_cache_size = 16
+        self._line_indexes = LineIndexCache(max_entries=self.line_index_cache_size)
         print("Content Manager is initialized")
 
+    @property
+    def notary(self):
+        """The NotebookNotary of the calling thread: its signature store is a
+        SQLite connection, which can only be used by the thread that opened it."""
+        notary = getattr(self._notaries, "notary", None)
+        if notary is None:
+            notary = self._notaries.notary = sign.NotebookNotary()
+        return notary
+
+    def _invalidate_caches(self, os_path, recursive=False):
+        """Drop everything cached about ``os_path`` after it was written,
+        renamed or deleted; ``recursive`` for directories."""
+        self._dir_cache.invalidate(os_path, recursive=recursive)
+        self._notebook_cache.invalidate(os_path, recursive=recursive)
+        self._line_indexes.invalidate(os_path, recursive=recursive)
+        self._hash_index.invalidate(os_path, recursive=recursive)
+        if self._search_index is not None:
+            self._search_index.invalidate(os_path, recursive=recursive)
+        if self._disk_usage is not None:
+            self._disk_usage.invalidate(os_path, recursive=recursive)
+        if self._path_resolver is not None:
+            self._path_resolver.invalidate(os_path, recursive=recursive)
+
+    @property
+    def path_resolver(self):
+        """The PathResolver of root_dir, created on first use."""
+        if self._path_resolver is None or self._path_resolver.root_dir != self.root_dir:
+            self._path_resolver = PathResolver(self.root_dir, max_size=self.path_cache_size)
+        return self._path_resolver
+
+    @property
+    def workspace_watcher(self):
+        """The SharedWatcher of the services watching all of root_dir."""
+        if self._workspace_watcher is None:
+            self._workspace_watcher = SharedWatcher()
+        return self._workspace_watcher
+
+    @property
+    def search_index(self):
+        """The SearchIndex of root_dir, created on first use. Its indexer
+        thread is started by the first search, or ``start_search_index``."""
+        if self._search_index is None or self._search_index.root_dir != os.path.abspath(self.root_dir):
+            if self._search_index is not None:
+                self._search_index.close()
+            root = os.path.abspath(self.root_dir)
+            name = hashlib.sha1(root.encode("utf8")).hexdigest() + ".db"
+            self._search_index = SearchIndex(
+                root, os.path.join(self.search_index_dir, name), watcher=self.workspace_watcher
+            )
+        return self._search_index
+
+    @property
+    def output_blob_store(self):
+        """The OutputBlobStore notebook outputs are externalized to."""
+        root = self.output_blobs_dir or os.path.join(self.root_dir, ".zasper", "blobs")
+        root = os.path.abspath(root)
+        if self._output_blob_store is None or self._output_blob_store.root != root:
+            self._output_blob_store = OutputBlobStore(root, threshold=self.output_blob_threshold)
+        return self._output_blob_store
+
+    def export_notebook(self, path):
+        """The notebook at ``path`` as a standalone .ipynb, with the outputs
+        stored as blobs put back, or None if it refers to no blob."""
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isfile(os_path):
+            return None
+        with self.perm_to_403(os_path), open(os_path, "rb") as f:
+            bcontent = f.read()
+        if BLOBS_KEY.encode() not in bcontent:
+            return None
+        nb = nbformat.reads(bcontent.decode("utf8"), as_version=nbformat.NO_CONVERT)
+        self.output_blob_store.inline(nb)
+        return nbformat.writes(nb, version=nbformat.NO_CONVERT).encode("utf8")
+
+    @property
+    def disk_usage(self):
+        """The DiskUsage tree of root_dir, created on first use. Its walker
+        thread is started by the first ``usage``, or ``start_disk_usage``."""
+        if self._disk_usage is None or self._disk_usage.root_dir != os.path.abspath(self.root_dir):
+            if self._disk_usage is not None:
+                self._disk_usage.close()
+            self._disk_usage = DiskUsage(
+                self.root_dir, max_workers=self.disk_usage_max_workers, watcher=self.workspace_watcher
+            )
+        return self._disk_usage
+
+    def start_disk_usage(self):
+        """Walk root_dir in the background and keep directory sizes current."""
+        self.disk_usage.start()
+
+    def usage(self, path="", depth=1):
+        """Disk usage of the directory ``path``, and of its subdirectories
+        ``depth`` levels down.
+
+        The walk of root_dir is started if it was not. Until it is
+        ``complete``, the sizes are those of what was walked so far.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isdir(os_path):
+            raise web.HTTPError(404, "directory does not exist: %r" % path)
+        disk_usage = self.disk_usage
+        disk_usage.start()
+        model = disk_usage.usage(os_path, depth)
+        if model is None:
+            # not walked yet
+            model = {"size": 0, "allocated": 0, "files": 0, "directories": 0, "children": []}
+        if not self.allow_hidden:
+            self._drop_hidden_children(model)
+        model["path"] = path
+        model["complete"] = disk_usage.complete
+        return model
+
+    def _drop_hidden_children(self, model):
+        """Leave the hidden directories out of a usage model. Their sizes
+        still count in the totals of their parents."""
+        if "children" in model:
+            model["children"] = [c for c in model["children"] if not c["name"].startswith(".")]
+            for child in model["children"]:
+                self._drop_hidden_children(child)
+
+    def _with_dir_sizes(self, model, os_path):
+        """Fill in the size of a directory model, and of the directories it
+        lists, from the disk usage tree once it is complete."""
+        disk_usage = self._disk_usage
+        if disk_usage is None or not disk_usage.complete:
+            return model
+        model["size"] = disk_usage.size(os_path)
+        if model.get("content") is not None:
+            model["content"] = [
+                dict(entry, size=disk_usage.size(os.path.join(os_path, entry["name"])))
+                if entry["type"] == "directory"
+                else entry
+                for entry in model["content"]
+            ]
+        return model
+
+    def start_search_index(self):
+        """Index root_dir in the background and keep the index current."""
+        self.search_index.start()
+
+    def search(self, query, path="", kinds=None, limit=50):
+        """Full-text search of the files under ``path``, see SearchIndex.search.
+
+        The indexing of root_dir is started if it was not: until it has
+        gone over the whole tree, results are those of what was indexed.
+        """
+        search_index = self.search_index
+        search_index.start()
+        return search_index.search(query, path=path, kinds=kinds, limit=limit)
+
     def _default_root_dir(self):
         return os.getcwd()
         # if not self.parent:
@@ -82,7 +320,15 @@ class ContentsManager:
         """
         path = path.strip("/")
         os_path = self._get_os_path(path=path)
-        return is_hidden(os_path, self.root_dir)
+        return self.path_resolver.is_hidden(os_path)
+
+    def _get_visible_os_path(self, path):
+        """``_get_os_path``, raising 404 for hidden paths unless
+        allow_hidden, as for paths that do not exist."""
+        os_path = self._get_os_path(path)
+        if not self.allow_hidden and self.path_resolver.is_hidden(os_path):
+            raise web.HTTPError(404, "file or directory does not exist: %r" % path)
+        return os_path
 
     def is_writable(self, path):
         """Does the API style path correspond to a writable directory or file?
@@ -145,7 +391,7 @@ class ContentsManager:
         os_path = self._get_os_path(path=path)
         return os.path.isdir(os_path)
 
-    def get(self, path, content=True, type=None, format=None, require_hash=False):
+    def get(self, path, content=True, type=None, format=None, require_hash=False, outputs=None):
         """Takes a path for an entity and returns its model
 
         Parameters
@@ -162,6 +408,9 @@ class ContentsManager:
             Ignored if this returns a notebook or directory model.
         require_hash: bool, optional
             Whether to include the hash of the file contents.
+        outputs : str, optional
+            'lazy' to replace the large outputs of a notebook with stubs,
+            see ``get_cell_outputs``. Ignored for other models.
 
         Returns
         -------
@@ -176,9 +425,9 @@ class ContentsManager:
         if not self.exists(path):
             raise web.HTTPError(404, four_o_four)
 
-        # if not self.allow_hidden and is_hidden(os_path, self.root_dir):
-        #     self.log.info("Refusing to serve hidden file or directory %r, via 404 Error", os_path)
-        #     raise web.HTTPError(404, four_o_four)
+        if not self.allow_hidden and self.path_resolver.is_hidden(os_path):
+            logger.info("Refusing to serve hidden file or directory %r, via 404 Error", os_path)
+            raise web.HTTPError(404, four_o_four)
 
         if os.path.isdir(os_path):
             if type not in (None, "directory"):
@@ -190,7 +439,7 @@ class ContentsManager:
             model = self._dir_model(path, content=content)
         elif type == "notebook" or (type is None and path.endswith(".ipynb")):
             model = self._notebook_model(
-                path, content=content, require_hash=require_hash
+                path, content=content, require_hash=require_hash, outputs=outputs
             )
         else:
             if type == "directory":
@@ -219,7 +468,7 @@ class ContentsManager:
         os_path = self._get_os_path(path)
         rm = os.unlink
 
-        if not self.allow_hidden and is_hidden(os_path, self.root_dir):
+        if not self.allow_hidden and self.path_resolver.is_hidden(os_path):
             raise web.HTTPError(400, f"Cannot delete file or directory {os_path!r}")
 
         four_o_four = "file or directory does not exist: %r" % path
@@ -244,24 +493,26 @@ class ContentsManager:
             # send2trash now supports deleting directories. see #1290
             if not self.is_writable(path):
                 raise web.HTTPError(403, "Permission denied: %s" % path) from None
-            self.log.debug("Sending %s to trash", os_path)
+            logger.debug("Sending %s to trash", os_path)
             try:
                 send2trash(os_path)
             except OSError as e:
                 raise web.HTTPError(400, "send2trash failed: %s" % e) from e
+            self._invalidate_caches(os_path, recursive=True)
             return
 
         if os.path.isdir(os_path):
             # Don't permanently delete non-empty directories.
             if not self.always_delete_dir and is_non_empty_dir(os_path):
                 raise web.HTTPError(400, "Directory %s not empty" % os_path)
-            self.log.debug("Removing directory %s", os_path)
+            logger.debug("Removing directory %s", os_path)
             with self.perm_to_403():
                 shutil.rmtree(os_path)
         else:
-            self.log.debug("Unlinking file %s", os_path)
+            logger.debug("Unlinking file %s", os_path)
             with self.perm_to_403():
                 rm(os_path)
+        self._invalidate_caches(os_path, recursive=True)
 
     async def delete_file(self, path):
         """Delete file at path."""
@@ -269,8 +520,8 @@ class ContentsManager:
         os_path = self._get_os_path(path)
         rm = os.unlink
 
-        # if not self.allow_hidden and is_hidden(os_path, self.root_dir):
-        #     raise web.HTTPError(400, f"Cannot delete file or directory {os_path!r}")
+        if not self.allow_hidden and self.path_resolver.is_hidden(os_path):
+            raise web.HTTPError(400, f"Cannot delete file or directory {os_path!r}")
 
         if not os.path.exists(os_path):
             raise web.HTTPError(404, "File or directory does not exist: %s" % os_path)
@@ -280,7 +531,7 @@ class ContentsManager:
                 # A directory containing only leftover checkpoints is
                 # considered empty.
                 cp_dir = getattr(self.checkpoints, "checkpoint_dir", None)
-                dir_contents = set(await run_sync(os.listdir, os_path))
+                dir_contents = set(os.listdir(os_path))
                 if dir_contents - {cp_dir}:
                     return True
 
@@ -303,19 +554,21 @@ class ContentsManager:
                 send2trash(os_path)
             except OSError as e:
                 raise web.HTTPError(400, "send2trash failed: %s" % e) from e
+            self._invalidate_caches(os_path, recursive=True)
             return
 
         if os.path.isdir(os_path):
             # Don't permanently delete non-empty directories.
             if not self.always_delete_dir and await is_non_empty_dir(os_path):
                 raise web.HTTPError(400, "Directory %s not empty" % os_path)
-            self.log.debug("Removing directory %s", os_path)
+            logger.debug("Removing directory %s", os_path)
             with self.perm_to_403():
-                await run_sync(shutil.rmtree, os_path)
+                shutil.rmtree(os_path)
         else:
-            self.log.debug("Unlinking file %s", os_path)
+            logger.debug("Unlinking file %s", os_path)
             with self.perm_to_403():
-                await run_sync(rm, os_path)
+                rm(os_path)
+        self._invalidate_caches(os_path, recursive=True)
 
     def rename_file(self, old_path, new_path):
         """Rename a file."""
@@ -327,10 +580,10 @@ class ContentsManager:
         new_os_path = self._get_os_path(new_path)
         old_os_path = self._get_os_path(old_path)
 
-        # if not self.allow_hidden and (
-        #     is_hidden(old_os_path, self.root_dir) or is_hidden(new_os_path, self.root_dir)
-        # ):
-        #     raise web.HTTPError(400, f"Cannot rename file or directory {old_os_path!r}")
+        if not self.allow_hidden and (
+            self.path_resolver.is_hidden(old_os_path) or self.path_resolver.is_hidden(new_os_path)
+        ):
+            raise web.HTTPError(400, f"Cannot rename file or directory {old_os_path!r}")
 
         # Should we proceed with the move?
         if os.path.exists(new_os_path) and not samefile(old_os_path, new_os_path):
@@ -344,6 +597,9 @@ class ContentsManager:
             raise
         except Exception as e:
             raise web.HTTPError(500, f"Unknown error renaming file: {old_path} {e}") from e
+        finally:
+            self._invalidate_caches(old_os_path, recursive=True)
+            self._invalidate_caches(new_os_path, recursive=True)
 
     def dir_exists(self, path):
         """Does the API-style path refer to an extant directory?
@@ -398,27 +654,7 @@ class ContentsManager:
         ------
         404: if path is outside root
         """
-        # This statement can cause excessive logging, uncomment if necessary when troubleshooting.
-        # self.log.debug("Reading path from disk: %s", path)
-        root = os.path.abspath(self.root_dir)  # type:ignore[attr-defined]
-        # to_os_path is not safe if path starts with a drive, since os.path.join discards first part
-        if os.path.splitdrive(path)[0]:
-            raise HTTPError(404, "%s is not a relative API path" % path)
-        os_path = to_os_path(ApiPath(path), root)
-        # validate os path
-        # e.g. "foo\0" raises ValueError: embedded null byte
-        try:
-            os.lstat(os_path)
-        except OSError:
-            # OSError could be FileNotFound, PermissionError, etc.
-            # those should raise (or not) elsewhere
-            pass
-        except ValueError:
-            raise HTTPError(404, f"{path} is not a valid path") from None
-
-        if not (os.path.abspath(os_path) + os.path.sep).startswith(root):
-            raise HTTPError(404, "%s is outside root contents directory" % path)
-        return os_path
+        return self.path_resolver.os_path(path)
 
     @contextmanager
     def perm_to_403(self, os_path=""):
@@ -452,7 +688,11 @@ class ContentsManager:
         simply writes the file (whatever an old exists or not)"""
         with self.perm_to_403(os_path):
             # kwargs["log"] = self.log
-            if self.use_atomic_writing:
+            if self.use_atomic_writing and self.atomic_writing_mode == "replace":
+                kwargs.setdefault("group", getattr(self._writing, "group", None))
+                with replace_writing(os_path, *args, **kwargs) as f:
+                    yield f
+            elif self.use_atomic_writing:
                 with atomic_writing(os_path, *args, **kwargs) as f:
                     yield f
             else:
@@ -548,7 +788,7 @@ class ContentsManager:
 
     def _save_directory(self, os_path, model, path=""):
         """create a directory"""
-        if not self.allow_hidden and is_hidden(os_path, self.root_dir):
+        if not self.allow_hidden and self.path_resolver.is_hidden(os_path):
             raise web.HTTPError(400, "Cannot create directory %r" % os_path)
         if not os.path.exists(os_path):
             with self.perm_to_403():
@@ -558,8 +798,8 @@ class ContentsManager:
         else:
             logger.debug("Directory %r already exists", os_path)
 
-    def _save_file(self, os_path, content, format):
-        """Save content of a generic file."""
+    def _decode_content(self, os_path, content, format):
+        """Decode the content of a file model to bytes."""
         if format not in {"text", "base64"}:
             raise HTTPError(
                 400,
@@ -573,7 +813,11 @@ class ContentsManager:
                 bcontent = decodebytes(b64_bytes)
         except Exception as e:
             raise HTTPError(400, f"Encoding error saving {os_path}: {e}") from e
+        return bcontent
 
+    def _save_file(self, os_path, content, format):
+        """Save content of a generic file."""
+        bcontent = self._decode_content(os_path, content, format)
         with self.atomic_writing(os_path, text=False) as f:
             f.write(bcontent)
 
@@ -583,7 +827,7 @@ class ContentsManager:
         pre_save_hooks += self._pre_save_hooks
         for pre_save_hook in pre_save_hooks:
             try:
-                self.log.debug("Running pre-save hook on %s", path)
+                logger.debug("Running pre-save hook on %s", path)
                 pre_save_hook(model=model, path=path, contents_manager=self, **kwargs)
             except HTTPError:
                 # allow custom HTTPErrors to raise,
@@ -592,7 +836,7 @@ class ContentsManager:
             except Exception:
                 # unhandled errors don't prevent saving,
                 # which could cause frustrating data loss
-                self.log.error(
+                logger.error(
                     "Pre-save hook %s failed on %s",
                     pre_save_hook.__name__,
                     path,
@@ -613,13 +857,19 @@ class ContentsManager:
         if self.notary.check_cells(nb):
             self.notary.sign(nb)
         else:
-            self.log.warning("Notebook %s is not trusted", path)
+            logger.warning("Notebook %s is not trusted", path)
 
     def save(self, model, path=""):
-        """Save the file model and return the model with no content."""
+        """Save the file model and return the model with no content.
+
+        File models carrying a ``chunk`` number are part of a chunked
+        upload, see ``_save_chunk``.
+        """
         path = path.strip("/")
 
-        self.run_pre_save_hooks(model=model, path=path)
+        chunk = model.get("chunk", None)
+        if chunk is None or chunk == 1:
+            self.run_pre_save_hooks(model=model, path=path)
 
         if "type" not in model:
             raise web.HTTPError(400, "No file type provided")
@@ -627,15 +877,28 @@ class ContentsManager:
             raise web.HTTPError(400, "No file content provided")
         os_path = self._get_os_path(path)
 
-        # if not self.allow_hidden and is_hidden(os_path, self.root_dir):
-        #     raise web.HTTPError(400, f"Cannot create file or directory {os_path!r}")
+        if chunk is not None:
+            return self._save_chunk(model, path, os_path, chunk)
+
+        validation_message = self._write_model(model, path, os_path)
+        return self._saved_model(path, validation_message)
+
+    def _check_write(self, model, path, os_path):
+        """Checks made before anything of ``model`` is written to ``os_path``."""
+        self.check_hash(model, path, os_path)
+        if not self.allow_hidden and self.path_resolver.is_hidden(os_path):
+            raise web.HTTPError(400, f"Cannot create file or directory {os_path!r}")
+
+    def _write_model(self, model, path, os_path):
+        """Write a model to disk, returning its validation message if any."""
+        self._check_write(model, path, os_path)
 
         logger.debug("Saving %s", os_path)
 
         validation_error: dict[str, t.Any] = {}
-        print("model is => ", model['content'])
         try:
             if model["type"] == "notebook":
+                check_no_stubs(model["content"])
                 nb = nbformat.from_dict(model["content"])
                 self.check_and_sign(nb, path)
                 self._save_notebook(
@@ -658,12 +921,15 @@ class ContentsManager:
             raise web.HTTPError(
                 500, f"Unexpected error while saving file: {path} {e}"
             ) from e
+        finally:
+            self._invalidate_caches(os_path)
 
-        validation_message = None
         if model["type"] == "notebook":
             self.validate_notebook_model(model, validation_error=validation_error)
-            validation_message = model.get("message", None)
+            return model.get("message", None)
+        return None
 
+    def _saved_model(self, path, validation_message=None):
         model = self.get(path, content=False)
         if validation_message:
             model["message"] = validation_message
@@ -672,6 +938,223 @@ class ContentsManager:
         # self.emit(data={"action": "save", "path": path})
         return model
 
+    def save_batch(self, saves):
+        """Save several ``(model, path)`` pairs in one group commit.
+
+        Every file is written to its temp file first; their data is then
+        synced to disk together before they are renamed into place, so
+        the whole batch pays for about one journal commit instead of one
+        per file. Returns, in order, the saved model or the exception of
+        each save.
+        """
+        group = GroupCommit()
+        written = []
+        self._writing.group = group
+        try:
+            for model, path in saves:
+                path = path.strip("/")
+                try:
+                    self.run_pre_save_hooks(model=model, path=path)
+                    if "type" not in model:
+                        raise web.HTTPError(400, "No file type provided")
+                    if "content" not in model and model["type"] != "directory":
+                        raise web.HTTPError(400, "No file content provided")
+                    os_path = self._get_os_path(path)
+                    written.append((path, os_path, self._write_model(model, path, os_path)))
+                except Exception as e:
+                    written.append((path, None, e))
+        finally:
+            self._writing.group = None
+
+        failed = group.commit()
+        results = []
+        for path, os_path, outcome in written:
+            if isinstance(outcome, Exception):
+                results.append(outcome)
+                continue
+            self._invalidate_caches(os_path)
+            if os_path in failed:
+                e = failed[os_path]
+                results.append(
+                    web.HTTPError(500, f"Unexpected error while saving file: {path} {e}")
+                )
+                continue
+            try:
+                results.append(self._saved_model(path, outcome))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+    def _save_chunk(self, model, path, os_path, chunk):
+        """Append one chunk of a file upload.
+
+        Chunks are numbered from 1; chunk 1 (re)starts the upload and -1 is
+        the last chunk. They are appended to a temp file next to the target,
+        which replaces the target only once the last chunk is written, so
+        memory is bounded by the chunk size and an interrupted upload can be
+        resumed. An ``offset`` in the model is checked against the bytes
+        received so far (409 on mismatch).
+
+        Returns the model of the target once complete, otherwise a model of
+        the partial upload with the ``offset`` to send the next chunk from.
+        """
+        if model["type"] != "file":
+            raise web.HTTPError(400, "Only files can be uploaded in chunks")
+        self._check_write(model, path, os_path)
+        bcontent = self._decode_content(os_path, model["content"], model.get("format"))
+
+        upload = ChunkedUpload(os_path)
+        offset = 0 if chunk == 1 else model.get("offset", upload.offset)
+        with self.perm_to_403(os_path):
+            upload.open(offset)
+            try:
+                upload.write(bcontent)
+                if chunk == -1:
+                    upload.commit()
+            finally:
+                upload.close()
+
+        if chunk == -1:
+            self._invalidate_caches(os_path)
+            return self.get(path, content=False)
+        model = self._base_model(path, info=os.lstat(upload.tmp_path), writable=True)
+        model.update(type="file", chunk=chunk, offset=upload.offset)
+        return model
+
+    def open_upload(self, path, offset=0):
+        """Open a streamed upload to ``path`` appending from ``offset``.
+
+        The returned ``ChunkedUpload`` is written to as the request body
+        arrives and committed once the last part has been received.
+        """
+        path = path.strip("/")
+        os_path = self._get_os_path(path)
+        if not os.path.isdir(os.path.dirname(os_path)):
+            raise HTTPError(404, "No such directory: %s" % path.rsplit("/", 1)[0])
+        if os.path.isdir(os_path):
+            raise HTTPError(400, "%s is a directory" % path)
+        self._check_write({}, path, os_path)
+        with self.perm_to_403(os_path):
+            return ChunkedUpload(os_path).open(offset)
+
+    def get_upload_offset(self, path):
+        """Number of bytes received so far by an interrupted upload to ``path``."""
+        path = path.strip("/")
+        return ChunkedUpload(self._get_visible_os_path(path)).offset
+
+    def finish_upload(self, path, upload):
+        """Move a fully received upload into place and return its model."""
+        with self.perm_to_403(upload.os_path):
+            upload.commit()
+        self._invalidate_caches(upload.os_path)
+        return self.get(path, content=False)
+
+    def get_cell_outputs(self, path, ids=None, indices=None, hash=None, hash_algorithm=None):
+        """The outputs of some cells of a notebook, for a lazy notebook model.
+
+        Cells are given by ``ids``, or by ``indices`` for notebooks without
+        cell ids. If ``hash`` (of the version the lazy model was read from)
+        is given and the file changed since, 409 is raised.
+
+        Returns ``{"path": ..., "outputs": {id or index: {"outputs": [...],
+        "execution_count": n}}}``.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isfile(os_path):
+            raise web.HTTPError(404, "file does not exist: %r" % path)
+        if not path.endswith(".ipynb"):
+            raise web.HTTPError(400, "%s is not a notebook" % path)
+        self.check_hash({"hash": hash, "hash_algorithm": hash_algorithm}, path, os_path)
+        nb, _, _ = self._load_notebook(path, os_path, readonly=True)
+        return {"path": path, "outputs": cell_outputs(nb, ids=ids, indices=indices)}
+
+    def get_text_window(self, path, offset=0, lines=None, length=None, from_end=False):
+        """A window of a text file, read without reading the whole file.
+
+        With ``lines``, ``lines`` lines starting at line ``offset``,
+        otherwise ``length`` bytes starting at byte ``offset``; with
+        ``from_end`` the window ends ``offset`` lines or bytes before the
+        end of the file. See ``textWindow.read_window``.
+
+        Returns the base model of the file with the window: ``content``,
+        ``offset`` and ``length`` in bytes, ``lines``, ``start_line`` and,
+        once the file was indexed to its end, ``total_lines``.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isfile(os_path):
+            raise web.HTTPError(404, "file does not exist: %r" % path)
+        if offset < 0 or (lines is not None and lines < 0) or (length is not None and length < 0):
+            raise web.HTTPError(400, "Negative offset, lines or length")
+        if lines is not None and lines > MAX_WINDOW_LINES:
+            raise web.HTTPError(400, "At most %d lines can be read at once" % MAX_WINDOW_LINES)
+        model = self._base_model(path)
+        model["type"] = "file"
+        model["mimetype"] = mimetypes.guess_type(os_path)[0]
+        with self.perm_to_403(os_path):
+            model.update(read_window(
+                os_path, self._line_indexes, offset=offset, lines=lines, length=length,
+                from_end=from_end,
+            ))
+        return model
+
+    def save_cell_ops(self, path, ops, base_hash, hash_algorithm=None):
+        """Apply cell-level operations to a notebook and save it.
+
+        Only the operations cross the network: they are applied to the
+        server's copy of the notebook (usually from the notebook cache),
+        which is then signed and written back. ``base_hash`` is the hash of
+        the version the operations were made against; if the file has
+        changed since, 409 is raised and the client must refetch.
+
+        Returns the model with no content and the hash of the new version,
+        to send as ``base_hash`` with the next operations.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isfile(os_path):
+            raise web.HTTPError(404, "file does not exist: %r" % path)
+        if not path.endswith(".ipynb"):
+            raise web.HTTPError(400, "%s is not a notebook" % path)
+        if not base_hash:
+            raise web.HTTPError(400, "Missing the hash the operations are based on")
+        self.check_hash(
+            {"hash": base_hash, "hash_algorithm": hash_algorithm}, path, os_path
+        )
+
+        nb, _, _ = self._load_notebook(path, os_path)
+        apply_cell_ops(nb, ops)
+
+        self.check_and_sign(nb, path)
+        validation_error: dict[str, t.Any] = {}
+        try:
+            bcontent = nbformat.writes(
+                self.output_blob_store.externalize(nb) if self.output_blobs else nb,
+                version=nbformat.NO_CONVERT,
+                capture_validation_error=validation_error,
+            ).encode("utf8")
+            with self.atomic_writing(os_path, text=False) as f:
+                f.write(bcontent)
+        except web.HTTPError:
+            raise
+        except Exception as e:
+            logger.error("Error while saving file: %s %s", path, e, exc_info=True)
+            raise web.HTTPError(
+                500, f"Unexpected error while saving file: {path} {e}"
+            ) from e
+        finally:
+            self._invalidate_caches(os_path)
+
+        model = self.get(path, content=False)
+        self.validate_notebook_model(model, validation_error=validation_error)
+        model.update(self._get_hash(bcontent))
+
+        # serve the next read from memory rather than re-parsing what was just written
+        self.mark_trusted_cells(nb, path)
+        self._notebook_cache.put(os_path, os.stat(os_path), nb, model.get("message"))
+        return model
 
     def validate_notebook_model(self, model, validation_error=None):
         """Add failed-validation message to model"""
@@ -768,16 +1251,58 @@ class ContentsManager:
     def rename(self, old_path, new_path):
         """Rename a file and any checkpoints associated with that file."""
         self.rename_file(old_path, new_path)
-        # self.checkpoints.rename_all_checkpoints(old_path, new_path)
+        old_os_path = self._get_os_path(old_path.strip("/"))
+        new_os_path = self._get_os_path(new_path.strip("/"))
+        self.checkpoints.rename_all(old_os_path, new_os_path)
+        if self._search_index is not None:
+            self._search_index.rename(old_os_path, new_os_path)
         # self.emit(data={"action": "rename", "path": new_path, "source_path": old_path})
 
+    def copy(self, from_path, to_path=None, progress=None):
+        """Copy an existing file or directory and return its new model.
+
+        If to_path is an existing directory (or not specified), the copy is
+        put in it with a name like `original-Copy1.ext`; otherwise to_path
+        is the path of the copy, which must not exist yet.
+
+        Files are copied by the kernel, as reflinks where the filesystem
+        supports them (see fileCopy). ``progress(copied, total)`` is called
+        with the bytes copied so far.
+        """
+        from_path = from_path.strip("/")
+        if to_path is None:
+            to_path = from_path.rpartition("/")[0]
+        to_path = to_path.strip("/")
+
+        from_os_path = self._get_visible_os_path(from_path)
+        if not os.path.exists(from_os_path):
+            raise web.HTTPError(404, "No such file or directory: %s" % from_path)
+        if self.dir_exists(to_path):
+            name = self.increment_filename(from_path.rpartition("/")[2], to_path, insert="-Copy")
+            to_path = f"{to_path}/{name}".strip("/")
+        to_os_path = self._get_os_path(to_path)
+        if not self.allow_hidden and self.path_resolver.is_hidden(to_os_path):
+            raise web.HTTPError(400, "Cannot copy to hidden file or directory %r" % to_path)
+        if os.path.lexists(to_os_path):
+            raise web.HTTPError(409, "File already exists: %s" % to_path)
+        if os.path.isdir(from_os_path) and (to_os_path + os.sep).startswith(from_os_path + os.sep):
+            raise web.HTTPError(400, "Cannot copy %s into itself" % from_path)
+
+        with self.perm_to_403():
+            if os.path.isdir(from_os_path):
+                copy_tree(from_os_path, to_os_path, progress)
+            else:
+                copy_file(from_os_path, to_os_path, progress)
+        self._invalidate_caches(to_os_path, recursive=True)
+        return self.get(to_path, content=False)
+
     async def delete(self, path):
         """Delete a file/directory and any associated checkpoints."""
         path = path.strip("/")
         if not path:
             raise HTTPError(400, "Can't delete root")
         await self.delete_file(path)
-        # self.checkpoints.delete_all_checkpoints(path)
+        self.checkpoints.delete_all(self._get_os_path(path))
         # self.emit(data={"action": "delete", "path": path})
 
     def update(self, model, path):
@@ -794,14 +1319,28 @@ class ContentsManager:
         return model
 
     def create_checkpoint(self, path):
-        pass
+        """Create a checkpoint of the current state of a file
 
-    def _base_model(self, path):
-        """Build the common base of a contents model"""
-        os_path = self._get_os_path(path)
-        info = os.lstat(os_path)
+        Returns a checkpoint model for the new checkpoint.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isfile(os_path):
+            raise web.HTTPError(404, "File does not exist: %s" % path)
+        with self.open(os_path, "rb") as f:
+            data = f.read()
+        return self.checkpoints.create(os_path, data)
 
-        four_o_four = "file or directory does not exist: %r" % path
+    def _base_model(self, path, info=None, writable=None):
+        """Build the common base of a contents model
+
+        ``info`` (an ``lstat`` result) and ``writable`` may be passed in by
+        callers that already have them, e.g. the scandir listing engine, to
+        avoid stat-ing the path again.
+        """
+        if info is None:
+            os_path = self._get_os_path(path)
+            info = os.lstat(os_path)
 
         # if not self.allow_hidden and is_hidden(os_path, self.root_dir):
         #     self.log.info("Refusing to serve hidden file or directory %r, via 404 Error", os_path)
@@ -814,33 +1353,36 @@ class ContentsManager:
             logger.warning("Unable to get size.")
             size = None
 
-        # try:
-        #     last_modified = tz.utcfromtimestamp(info.st_mtime)
-        # except (ValueError, OSError):
-        #     # Files can rarely have an invalid timestamp
-        #     # https://github.com/jupyter/notebook/issues/2539
-        #     # https://github.com/jupyter/notebook/issues/2757
-        #     # Use the Unix epoch as a fallback so we don't crash.
-        #     logger.warning("Invalid mtime %s for %s", info.st_mtime, os_path)
-        #     last_modified = datetime(1970, 1, 1, 0, 0, tzinfo=tz.UTC)
-
-        # try:
-        #     created = tz.utcfromtimestamp(info.st_ctime)
-        # except (ValueError, OSError):  # See above
-        #     logger.warning("Invalid ctime %s for %s", info.st_ctime, os_path)
-        #     # created = datetime(1970, 1, 1, 0, 0, tzinfo=tz.UTC)
+        try:
+            last_modified = datetime.fromtimestamp(info.st_mtime, tz=timezone.utc)
+        except (ValueError, OSError, OverflowError):
+            # Files can rarely have an invalid timestamp
+            # https://github.com/jupyter/notebook/issues/2539
+            # https://github.com/jupyter/notebook/issues/2757
+            # Use the Unix epoch as a fallback so we don't crash.
+            logger.warning("Invalid mtime %s for %s", info.st_mtime, path)
+            last_modified = datetime(1970, 1, 1, 0, 0, tzinfo=timezone.utc)
+
+        try:
+            created = datetime.fromtimestamp(info.st_ctime, tz=timezone.utc)
+        except (ValueError, OSError, OverflowError):  # See above
+            logger.warning("Invalid ctime %s for %s", info.st_ctime, path)
+            created = datetime(1970, 1, 1, 0, 0, tzinfo=timezone.utc)
+
+        if writable is None:
+            writable = self.is_writable(path)
 
         # Create the base model.
         model = {}
         model["name"] = path.rsplit("/", 1)[-1]
         model["path"] = path
-        model["last_modified"] = ""  # last_modified
-        model["created"] = ""  # created
+        model["last_modified"] = last_modified
+        model["created"] = created
         model["content"] = None
         model["format"] = None
         model["mimetype"] = None
         model["size"] = size
-        model["writable"] = self.is_writable(path)
+        model["writable"] = writable
         model["hash"] = None
         model["hash_algorithm"] = None
 
@@ -857,60 +1399,233 @@ class ContentsManager:
 
         if not os.path.isdir(os_path):
             raise web.HTTPError(404, four_o_four)
-        # elif not self.allow_hidden and is_hidden(os_path, self.root_dir):
-        #     self.log.info("Refusing to serve hidden directory %r, via 404 Error", os_path)
-        #     raise web.HTTPError(404, four_o_four)
+        elif not self.allow_hidden and self.path_resolver.is_hidden(os_path):
+            logger.info("Refusing to serve hidden directory %r, via 404 Error", os_path)
+            raise web.HTTPError(404, four_o_four)
+
+        if content:
+            model = self._dir_cache.get(
+                os_path, lambda: self._build_dir_model(path, os_path, content=True)
+            )
+        else:
+            model = self._build_dir_model(path, os_path, content=False)
+        return self._with_dir_sizes(model, os_path)
 
+    def _build_dir_model(self, path, os_path, content):
         model = self._base_model(path)
         model["type"] = "directory"
         model["size"] = None
         if content:
-            model["content"] = contents = []
-            os_dir = self._get_os_path(path)
-            print(os_dir)
-            for name in os.listdir(os_dir):
+            model["content"] = list(self._scandir_models(path, os_path))
+            model["format"] = "json"
+
+        return model
+
+    def list_directory(self, path, sort=None, cursor=None, limit=None):
+        """Return one page of a directory listing and the cursor of the next one.
+
+        Parameters
+        ----------
+        path : str
+            The API path of the directory.
+        sort : str, optional
+            'name', 'last_modified', 'size' or 'type', prefixed with '-'
+            for descending order. Defaults to 'name'.
+        cursor : str, optional
+            The cursor returned with the previous page.
+        limit : int, optional
+            The maximum number of entries to return.
+
+        Returns
+        -------
+        (entries, next_cursor) : tuple
+            next_cursor is None on the last page.
+        """
+        path = path.strip("/")
+        model = self._dir_model(path, content=True)
+        return paginate(model["content"], sort=sort, cursor=cursor, limit=limit)
+
+    def iter_directory(self, path):
+        """Lazily yield the content-less models of a directory, in disk order.
+
+        Unlike ``list_directory`` nothing is held in memory, which is what
+        streamed listings of very large directories use.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isdir(os_path):
+            raise web.HTTPError(404, "directory does not exist: %r" % path)
+        return self._scandir_models(path, os_path)
+
+    def get_etag(
+            self, path, content=True, type=None, format=None, require_hash=False, outputs=None
+    ):
+        """Validators of the model ``get`` would return with these arguments.
+
+        Returns ``(etag, last_modified)``. The strong ETag of a file is
+        derived from its inode, size and mtime (and its content hash when
+        ``require_hash``), that of a directory listing from the name, type,
+        size and mtime of every entry, served from the listing cache. Each
+        is suffixed with the representation (``content``, ``type``,
+        ``format``, ``require_hash``, ``outputs``) it applies to.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        try:
+            st = os.stat(os_path)
+        except OSError:
+            raise web.HTTPError(404, f"No such file or directory: {path}") from None
+        validator = "%x-%x-%x" % (st.st_ino, st.st_size, st.st_mtime_ns)
+        last_modified = datetime.fromtimestamp(st.st_mtime, tz=timezone.utc)
+        if stat.S_ISDIR(st.st_mode) and content:
+            model = self._dir_model(path, content=True)
+            h = hashlib.sha1(f"{validator}:{model['size']}".encode())
+            for entry in model["content"]:
+                h.update(
+                    f"/{entry['name']}:{entry['type']}:{entry['size']}:{entry['last_modified']}".encode(
+                        "utf8", "surrogateescape"
+                    )
+                )
+                last_modified = max(last_modified, entry["last_modified"])
+            validator = h.hexdigest()[:32]
+        elif stat.S_ISDIR(st.st_mode) and self._disk_usage is not None:
+            validator += "-%x" % (self._disk_usage.size(os_path) or 0)
+        elif require_hash and not stat.S_ISDIR(st.st_mode):
+            validator += "-" + self._get_file_hash(os_path)["hash"][:32]
+        representation = (
+            f"{int(bool(content))}{type or ''}:{format or ''}:{int(bool(require_hash))}"
+            f"{':lazy' if outputs == 'lazy' else ''}"
+        )
+        return f'"{validator}-{representation}"', last_modified
+
+    def get_tree(self, path="", depth=1):
+        """Return the directory model of ``path`` with nested listings.
+
+        Directories are listed down to ``depth`` levels (1 is a plain
+        listing); the ones below have ``content`` None. Children are sorted
+        by name. Every directory model carries an ``etag`` for its subtree,
+        see ``get_tree_etag``.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isdir(os_path):
+            raise web.HTTPError(404, "directory does not exist: %r" % path)
+        model = self._base_model(path)
+        model["type"] = "directory"
+        model["size"] = None
+        self._walk_tree(path, os_path, depth, model)
+        return model
+
+    def get_tree_etag(self, path="", depth=1):
+        """ETag of the tree of ``path`` to ``depth``, without building it.
+
+        It is derived from the inode and mtime of every directory of the
+        subtree, so it changes when an entry is created, deleted or renamed
+        anywhere in it, and computing it only costs a scandir and a stat per
+        directory. Changes to the content of a file keep it.
+        """
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        if not os.path.isdir(os_path):
+            raise web.HTTPError(404, "directory does not exist: %r" % path)
+        return self._walk_tree(path, os_path, depth)
+
+    def _walk_tree(self, path, os_dir, depth, model=None):
+        """Compute the subtree ETag of ``os_dir``, and fill in the nested
+        listing of ``model`` when one is given."""
+        st = os.stat(os_dir)
+        h = hashlib.sha1(b"%d:%d:%d" % (depth, st.st_ino, st.st_mtime_ns))
+        if depth > 0:
+            subdirs = []
+            try:
+                if model is not None:
+                    children = sorted(self._scandir_models(path, os_dir), key=lambda m: m["name"])
+                    model["content"] = children
+                    model["format"] = "json"
+                    subdirs = [(c["name"], c) for c in children if c["type"] == "directory"]
+                else:
+                    with os.scandir(os_dir) as it:
+                        subdirs = sorted(
+                            (e.name, None) for e in it
+                            if _is_dir(e) and (
+                                self.allow_hidden or not self.path_resolver.is_entry_hidden(
+                                    e.path, e.stat(follow_symlinks=False)
+                                )
+                            )
+                        )
+            except (OSError, web.HTTPError):
+                # unreadable directory: listed without content
+                pass
+            for name, child in subdirs:
+                child_path = f"{path}/{name}" if path else name
                 try:
-                    os_path = os.path.join(os_dir, name)
-                except UnicodeDecodeError as e:
-                    logger.warning("failed to decode filename '%s': %r", name, e)
+                    etag = self._walk_tree(child_path, os.path.join(os_dir, name), depth - 1, child)
+                except OSError:
                     continue
-
+                h.update(os.fsencode(name) + b"\0" + etag.encode())
+        etag = '"%s"' % h.hexdigest()
+        if model is not None:
+            model["etag"] = etag
+        return etag
+
+    def _scandir_models(self, path, os_dir):
+        """Yield a content-less model for every listable entry of a directory.
+
+        Every child model is built from a single ``DirEntry``: the file type
+        comes from the cached ``d_type`` and everything else from one
+        ``lstat`` and one ``access``, instead of going through ``get`` once
+        per child.
+        """
+        try:
+            it = os.scandir(os_dir)
+        except OSError as e:
+            raise web.HTTPError(404, "directory does not exist: %r" % path) from e
+        with it:
+            for entry in it:
                 try:
-                    st = os.lstat(os_path)
+                    model = self._entry_model(path, entry)
                 except OSError as e:
                     # skip over broken symlinks in listing
                     if e.errno == errno.ENOENT:
-                        logger.warning("%s doesn't exist", os_path)
-                    elif (
-                            e.errno != errno.EACCES
-                    ):  # Don't provide clues about protected files
-                        logger.warning("Error stat-ing %s: %r", os_path, e)
-                    continue
-
-                if (
-                        not stat.S_ISLNK(st.st_mode)
-                        and not stat.S_ISREG(st.st_mode)
-                        and not stat.S_ISDIR(st.st_mode)
-                ):
-                    logger.debug("%s not a regular file", os_path)
+                        logger.warning("%s doesn't exist", entry.path)
+                    elif e.errno != errno.EACCES:  # Don't provide clues about protected files
+                        logger.warning("Error stat-ing %s: %r", entry.path, e)
                     continue
-                contents.append(self.get(path=f"{path}/{name}", content=False))
-                # try:
-                #     if self.should_list(name) and (
-                #             self.allow_hidden or not is_file_hidden(os_path, stat_res=st)
-                #     ):
-                #         contents.append(self.get(path=f"{path}/{name}", content=False))
-                # except OSError as e:
-                #     # ELOOP: recursive symlink, also don't show failure due to permissions
-                #     if e.errno not in [errno.ELOOP, errno.EACCES]:
-                #         self.log.warning(
-                #             "Unknown error checking if file %r is hidden",
-                #             os_path,
-                #             exc_info=True,
-                #         )
+                if model is not None:
+                    yield model
 
-            model["format"] = "json"
+    def _entry_model(self, path, entry):
+        """Build a content-less model for one ``os.DirEntry`` of ``path``.
 
+        Returns None for entries that are not listed (sockets, fifos, hidden
+        entries unless allow_hidden, ...).
+        """
+        st = entry.stat(follow_symlinks=False)
+        if (
+                not stat.S_ISLNK(st.st_mode)
+                and not stat.S_ISREG(st.st_mode)
+                and not stat.S_ISDIR(st.st_mode)
+        ):
+            logger.debug("%s not a regular file", entry.path)
+            return None
+        if stat.S_ISLNK(st.st_mode):
+            # raises ENOENT for broken symlinks, which are skipped
+            entry.stat()
+        if not self.allow_hidden and self.path_resolver.is_entry_hidden(entry.path, st):
+            return None
+
+        child_path = f"{path}/{entry.name}" if path else entry.name
+        model = self._base_model(child_path, info=st, writable=_is_writable(entry.path))
+        # is_dir() follows symlinks like os.path.isdir, but only costs a
+        # syscall for symlinks or when the filesystem has no d_type.
+        if entry.is_dir():
+            model["type"] = "directory"
+            model["size"] = None
+        elif entry.name.endswith(".ipynb"):
+            model["type"] = "notebook"
+        else:
+            model["type"] = "file"
+            model["mimetype"] = mimetypes.guess_type(entry.path)[0]
         return model
 
     def _file_model(self, path, content=True, format=None, require_hash=False):
@@ -947,19 +1662,20 @@ class ContentsManager:
             )
 
         if require_hash:
-            if bytes_content is None:
-                bytes_content, _ = self._read_file(os_path, "byte")  # type: ignore[assignment,misc]
-            model.update(**self._get_hash(bytes_content))  # type: ignore[arg-type]
+            model.update(**self._get_file_hash(os_path, bytes_content))
 
         return model
 
-    def _notebook_model(self, path, content=True, require_hash=False):
+    def _notebook_model(self, path, content=True, require_hash=False, outputs=None):
         """Build a notebook model
 
         if content is requested, the notebook content will be populated
         as a JSON structure (not double-serialized)
 
         if require_hash is true, the model will include 'hash'
+
+        if outputs is 'lazy', outputs over ``lazy_output_inline_size``
+        characters are replaced by stubs and the model has 'outputs': 'lazy'
         """
         model = self._base_model(path)
         model["type"] = "notebook"
@@ -967,25 +1683,91 @@ class ContentsManager:
 
         bytes_content = None
         if content:
-            validation_error: dict[str, t.Any] = {}
-            nb, bytes_content = self._read_notebook(
-                os_path,
-                as_version=4,
-                capture_validation_error=validation_error,
-                raw=True,
-            )
-            self.mark_trusted_cells(nb, path)
+            if outputs == "lazy":
+                # the stubbed copy shares the rest of the cached notebook
+                nb, message, bytes_content = self._load_notebook(path, os_path, readonly=True)
+                nb = lazy_notebook(nb, self.lazy_output_inline_size)
+                model["outputs"] = "lazy"
+            else:
+                nb, message, bytes_content = self._load_notebook(path, os_path)
             model["content"] = nb
             model["format"] = "json"
-            self.validate_notebook_model(model, validation_error)
+            if message:
+                model["message"] = message
 
         if require_hash:
-            if bytes_content is None:
-                bytes_content, _ = self._read_file(os_path, "byte")  # type: ignore[misc]
-            model.update(**self._get_hash(bytes_content))  # type: ignore[arg-type]
+            model.update(**self._get_file_hash(os_path, bytes_content))
 
         return model
 
+    def _load_notebook(self, path, os_path, readonly=False):
+        """Read, validate and trust-check a notebook, through the notebook cache.
+
+        Returns (nb, validation message, raw bytes). The raw bytes are None
+        when the notebook came from the cache. With ``readonly`` the cached
+        notebook itself may be returned: the caller must not modify it.
+        """
+        with self.perm_to_403(os_path):
+            st = os.stat(os_path)
+        entry = self._notebook_cache.get(os_path, st)
+        if entry is not None:
+            if readonly:
+                return entry.nb, entry.message, None
+            # callers may modify the notebook, the cached copy must not change
+            return copy.deepcopy(entry.nb), entry.message, None
+
+        validation_error: dict[str, t.Any] = {}
+        nb, bytes_content = self._read_notebook(
+            os_path,
+            as_version=4,
+            capture_validation_error=validation_error,
+            raw=True,
+        )
+        self.mark_trusted_cells(nb, path)
+        message = self.validate_notebook_model({"content": nb}, validation_error).get("message")
+        self._notebook_cache.put(os_path, st, copy.deepcopy(nb), message)
+        return nb, message, bytes_content
+
+    def _get_hash(self, byte_content: bytes) -> dict[str, str]:
+        """Compute the hash hexdigest for the provided bytes.
+
+        The hash algorithm is provided by the `hash_algorithm` attribute.
+        """
+        algorithm = self.hash_algorithm
+        h = hashlib.new(algorithm)
+        h.update(byte_content)
+        return {"hash": h.hexdigest(), "hash_algorithm": algorithm}
+
+    def _get_file_hash(self, os_path, bytes_content=None):
+        """Hash fields of a model for the file at os_path.
+
+        Bytes already read by the caller are hashed directly; otherwise the
+        hash comes from the persistent hash index, which only reads the file
+        if it changed since it was last hashed.
+        """
+        if bytes_content is not None:
+            return self._get_hash(bytes_content)
+        with self.perm_to_403(os_path):
+            digest = self._hash_index.get_hash(os_path, self.hash_algorithm)
+        return {"hash": digest, "hash_algorithm": self.hash_algorithm}
+
+    def check_hash(self, model, path, os_path):
+        """Refuse to overwrite a file that changed since the client read it.
+
+        If the model being saved carries the ``hash`` of the version the
+        client started from, it must match the file on disk, else 409.
+        """
+        expected = model.get("hash")
+        if not expected or not os.path.isfile(os_path):
+            return
+        algorithm = model.get("hash_algorithm") or self.hash_algorithm
+        if algorithm not in hashlib.algorithms_available:
+            raise web.HTTPError(400, "Unknown hash algorithm: %s" % algorithm)
+        with self.perm_to_403(os_path):
+            current = self._hash_index.get_hash(os_path, algorithm)
+        if current != expected:
+            raise web.HTTPError(409, "File changed on disk since it was read: %s" % path)
+
     def mark_trusted_cells(self, nb, path=""):
         """Mark cells as trusted if the notebook signature matches.
 
@@ -1005,7 +1787,7 @@ class ContentsManager:
 
     def _save_directory(self, os_path, model, path=""):
         """create a directory"""
-        if not self.allow_hidden and is_hidden(os_path, self.root_dir):
+        if not self.allow_hidden and self.path_resolver.is_hidden(os_path):
             raise web.HTTPError(400, "Cannot create directory %r" % os_path)
         if not os.path.exists(os_path):
             with self.perm_to_403():
@@ -1027,17 +1809,23 @@ class ContentsManager:
                 as_version=as_version,
                 capture_validation_error=capture_validation_error,
             )
+            if BLOBS_KEY in answer[0]:
+                self.output_blob_store.inline(nb)
 
             return (nb, answer[2]) if raw else nb  # type:ignore[misc]
         except Exception as e:
             e_orig = e
 
-        # If use_atomic_writing is enabled, we'll guess that it was also
+        # If copy mode atomic writing is enabled, we'll guess that it was also
         # enabled when this notebook was written and look for a valid
-        # atomic intermediate.
+        # atomic intermediate. Replace mode never leaves a partial target.
         tmp_path = path_to_intermediate(os_path)
 
-        if not self.use_atomic_writing or not os.path.exists(tmp_path):
+        if (
+                not self.use_atomic_writing
+                or self.atomic_writing_mode != "copy"
+                or not os.path.exists(tmp_path)
+        ):
             raise HTTPError(
                 400,
                 f"Unreadable Notebook: {os_path} {e_orig!r}",
@@ -1053,6 +1841,8 @@ class ContentsManager:
 
     def _save_notebook(self, os_path, nb, capture_validation_error=None):
         """Save a notebook to an os_path."""
+        if self.output_blobs:
+            nb = self.output_blob_store.externalize(nb)
         with self.atomic_writing(os_path, encoding="utf-8") as f:
             nbformat.write(
                 nb,
@@ -1062,13 +1852,23 @@ class ContentsManager:
             )
 
     def restore_checkpoint(self, path, checkpoint_id):
-        pass
+        """Restore a file to a checkpointed state."""
+        path = path.strip("/")
+        os_path = self._get_visible_os_path(path)
+        data = self.checkpoints.restore(os_path, checkpoint_id)
+        try:
+            with self.atomic_writing(os_path, text=False) as f:
+                f.write(data)
+        finally:
+            self._invalidate_caches(os_path)
 
     def list_checkpoints(self, path):
-        pass
+        """Return a list of checkpoints for a given file, oldest first"""
+        return self.checkpoints.list(self._get_visible_os_path(path.strip("/")))
 
     def delete_checkpoints(self, path, checkpoint_id):
-        pass
+        """Delete a checkpoint for a file"""
+        self.checkpoints.delete(self._get_visible_os_path(path.strip("/")), checkpoint_id)
 
 
 @contextmanager
@@ -1128,6 +1928,149 @@ def atomic_writing(path, text=True, encoding="utf-8", log=None, **kwargs):
         os.remove(tmp_path)
 
 
+@contextmanager
+def replace_writing(path, text=True, encoding="utf-8", log=None, group=None, **kwargs):
+    """Context manager to write to a file only if the entire write is successful.
+
+    The data is written to a temporary file next to the target, synced to
+    disk, and renamed over the target, so a reader (or a crash) sees either
+    the old or the new content, never a partial one. The directory is then
+    synced so that the rename itself is durable. The existing file is never
+    copied.
+
+    Parameters
+    ----------
+    path : str
+        The target file to write to.
+    text : bool, optional
+        Whether to open the file in text mode (i.e. to write unicode). Default is
+        True.
+    encoding : str, optional
+        The encoding to use for files opened in text mode. Default is UTF-8.
+    group : GroupCommit, optional
+        If given, syncing and renaming are left to ``group.commit()``.
+    **kwargs
+        Passed to :func:`io.open`.
+    """
+    target = path
+    # realpath doesn't work on Windows: https://bugs.python.org/issue9949
+    # Luckily, we only need to resolve the file itself being a symlink, not
+    # any of its directories, so this will suffice:
+    if os.path.islink(path):
+        path = os.path.join(os.path.dirname(path), os.readlink(path))
+
+    dirname, basename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".~" + basename + ".")
+    try:
+        # keep the permissions of the file being replaced
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+
+    if text:
+        # Make sure that text files have Unix linefeeds by default
+        kwargs.setdefault("newline", "\n")
+        fileobj = open(fd, "w", encoding=encoding, **kwargs)  # noqa: SIM115
+    else:
+        fileobj = open(fd, "wb", **kwargs)  # noqa: SIM115
+
+    try:
+        yield fileobj
+        if group is not None:
+            fileobj.flush()
+            group.add(target, fileobj, tmp_path, path)
+            return
+        # Flush to disk
+        fileobj.flush()
+        start = time.monotonic()
+        os.fsync(fileobj.fileno())
+        FSYNC_SECONDS.labels("single").observe(time.monotonic() - start)
+        fileobj.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Failed! The target was never touched
+        fileobj.close()
+        with suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+    fsync_directory(dirname)
+
+
+class GroupCommit:
+    """Files written by ``replace_writing`` whose sync and rename are
+    deferred, to be done for all of them at once."""
+
+    def __init__(self):
+        self._files = []
+
+    def add(self, key, fileobj, tmp_path, path):
+        self._files.append((key, fileobj, tmp_path, path))
+
+    def commit(self):
+        """Sync every file, then rename them into place and sync their
+        directories. Returns ``{key: exception}`` for the files that failed;
+        those are left untouched."""
+        failed = {}
+        start = time.monotonic()
+        for key, fileobj, tmp_path, path in self._files:
+            try:
+                os.fsync(fileobj.fileno())
+            except OSError as e:
+                failed[key] = e
+            finally:
+                fileobj.close()
+        FSYNC_SECONDS.labels("group").observe(time.monotonic() - start)
+        GROUP_COMMIT_SIZE.observe(len(self._files))
+
+        dirs = set()
+        for key, fileobj, tmp_path, path in self._files:
+            try:
+                if key not in failed:
+                    os.replace(tmp_path, path)
+                    dirs.add(os.path.dirname(path))
+                    continue
+            except OSError as e:
+                failed[key] = e
+            with suppress(FileNotFoundError):
+                os.remove(tmp_path)
+        for dirname in dirs:
+            fsync_directory(dirname)
+        self._files = []
+        return failed
+
+
+def fsync_directory(dirname):
+    """Sync a directory, making renames and new entries in it durable."""
+    if os.name == "nt":
+        # directories can't be opened, NTFS journals the rename
+        return
+    fd = os.open(dirname or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # some filesystems refuse to sync directories
+        if e.errno not in {errno.EINVAL, errno.ENOTSUP}:
+            raise
+    finally:
+        os.close(fd)
+
+
+def copy2_safe(src, dst, log=None):
+    """copy src to dst
+
+    like shutil.copy2, but log errors in copystat instead of raising
+    """
+    shutil.copyfile(src, dst)
+    try:
+        shutil.copystat(src, dst)
+    except OSError:
+        if log:
+            log.debug("copystat on %s failed", dst, exc_info=True)
+
+
 @contextmanager
 def _simple_writing(path, text=True, encoding="utf-8", log=None, **kwargs):
     """Context manager to write file without doing atomic writing
@@ -1189,3 +2132,20 @@ def replace_file(src, dst):
 async def async_replace_file(src, dst):
     """replace dst with src asynchronously"""
     await run_sync(os.replace, src, dst)
+
+
+def _is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _is_writable(os_path):
+    # os.access, not the mode bits, so that ACLs, read-only mounts and
+    # capabilities are accounted for
+    try:
+        return os.access(os_path, os.W_OK)
+    except OSError:
+        logger.error("Failed to check write permissions on %s", os_path)
+        return False
@@ -0,0 +1,141 @@
+"""In-memory LRU cache of directory listings built by ``ContentsManager``."""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from zasper_py.services.content.fileWatcher import InotifyWatcher
+
+logger = logging.getLogger(__name__)
+
+# seconds a listing is served without a watch on its directory: the
+# directory mtime does not change when a listed file is rewritten in place
+UNWATCHED_TTL = 2.0
+
+
+class _Entry:
+    __slots__ = ("model", "mtime_ns", "watched", "created")
+
+    def __init__(self, model, mtime_ns, watched, created):
+        self.model = model
+        self.mtime_ns = mtime_ns
+        self.watched = watched
+        self.created = created
+
+
+class DirModelCache:
+    """Bounded LRU of directory models keyed on their OS path.
+
+    Entries are invalidated by an inotify watch on the cached directory.
+    Where inotify is not available (or the watch limit is hit) an entry is
+    revalidated by comparing the directory mtime, which catches entries
+    being added, removed or renamed, and expires after ``UNWATCHED_TTL``
+    seconds, which bounds how long the size and mtime of a file rewritten
+    in place are served stale. Writes made through the ContentsManager call
+    ``invalidate`` explicitly.
+    """
+
+    def __init__(self, max_size: int = 128, use_inotify: bool = True):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.watcher = InotifyWatcher() if use_inotify else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, os_dir: str, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Return the cached listing of ``os_dir``, calling ``build`` on a miss."""
+        self._drain_events()
+        with self._lock:
+            entry = self._entries.get(os_dir)
+            if entry is not None and self._is_fresh(os_dir, entry):
+                self._entries.move_to_end(os_dir)
+                return self._copy(entry.model)
+
+        # Watch and stat before listing, so changes made while the listing
+        # is built are not missed.
+        watched = self.watcher is not None and self.watcher.add_watch(os_dir)
+        created = time.monotonic()
+        try:
+            mtime_ns = os.stat(os_dir).st_mtime_ns
+        except OSError:
+            return build()
+        model = build()
+        if self._drain_events(os_dir):
+            # changed underneath us, serve the listing but don't keep it
+            return model
+
+        with self._lock:
+            self._entries[os_dir] = _Entry(self._copy(model), mtime_ns, watched, created)
+            self._entries.move_to_end(os_dir)
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._unwatch(evicted)
+        return model
+
+    def invalidate(self, os_path: str, recursive: bool = False) -> None:
+        """Drop ``os_path`` and the listing of its parent directory.
+
+        With ``recursive``, every cached directory below ``os_path`` is
+        dropped as well (for renames and deletes of directories).
+        """
+        with self._lock:
+            self._pop(os_path)
+            self._pop(os.path.dirname(os_path))
+            if recursive:
+                prefix = os_path.rstrip(os.sep) + os.sep
+                for os_dir in [d for d in self._entries if d.startswith(prefix)]:
+                    self._pop(os_dir)
+
+    def clear(self) -> None:
+        with self._lock:
+            for os_dir in list(self._entries):
+                self._pop(os_dir)
+
+    def _is_fresh(self, os_dir: str, entry: _Entry) -> bool:
+        if entry.watched and self.watcher.is_watched(os_dir):
+            return True
+        if time.monotonic() - entry.created > UNWATCHED_TTL:
+            return False
+        try:
+            return os.stat(os_dir).st_mtime_ns == entry.mtime_ns
+        except OSError:
+            return False
+
+    def _drain_events(self, os_dir: Optional[str] = None) -> bool:
+        """Apply pending inotify events; return whether ``os_dir`` changed."""
+        if self.watcher is None:
+            return False
+        events = self.watcher.read_events()
+        changed = False
+        with self._lock:
+            for event in events:
+                if event.os_dir is None:
+                    # queue overflow: we no longer know what changed
+                    self.clear()
+                    changed = True
+                    continue
+                # the parent listing carries this directory's own entry
+                self._pop(event.os_dir)
+                self._pop(os.path.dirname(event.os_dir))
+                changed = changed or event.os_dir == os_dir
+        return changed
+
+    def _pop(self, os_dir: str) -> None:
+        if self._entries.pop(os_dir, None) is not None:
+            self._unwatch(os_dir)
+
+    def _unwatch(self, os_dir: str) -> None:
+        if self.watcher is not None:
+            self.watcher.rm_watch(os_dir)
+
+    @staticmethod
+    def _copy(model: Dict[str, Any]) -> Dict[str, Any]:
+        # child models are never mutated, the top-level model and list are
+        model = dict(model)
+        if model.get("content") is not None:
+            model["content"] = list(model["content"])
+        return model
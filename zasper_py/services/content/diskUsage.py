@@ -0,0 +1,345 @@
+"""Sizes of the directories under the root directory, kept current.
+
+The tree is built by a walk of ``root_dir`` in which each directory is
+listed (``os.scandir``) by one task on a thread pool, so a large workspace,
+or one on a network filesystem, is walked in parallel. Each directory of the
+tree holds the size of its own files and the totals of everything below it.
+
+It is then kept current incrementally: a directory reported as changed,
+by ContentsManager (``invalidate``) or by an inotify watch, is listed again
+alone. Its totals change by the difference and so do those of its
+ancestors; only directories that appeared are walked. Hidden directories
+(``.git``, ``.venv``...) are not watched, to leave ``max_user_watches`` to
+the directories users see: they, and the directories whose watch failed
+or every directory where inotify is not available, are listed again every
+``RESCAN_INTERVAL`` seconds.
+
+Symlinks are counted as such, not followed. ``allocated`` is the space used
+on disk (``st_blocks``), which is what quotas count, ``size`` the apparent
+size of the files.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from zasper_py.services.content.fileWatcher import IN_Q_OVERFLOW, SharedWatcher
+
+logger = logging.getLogger(__name__)
+
+# seconds between two passes over the directories reported as changed
+POLL_INTERVAL = 0.5
+
+# seconds between two listings of the directories that are not watched
+RESCAN_INTERVAL = 300
+
+# deepest subtree returned by ``usage``
+MAX_USAGE_DEPTH = 10
+
+
+class _Dir:
+    """A directory of the tree. ``own`` are the totals of its files, the
+    other totals include every directory below it."""
+
+    __slots__ = (
+        "parent", "children", "own_size", "own_allocated", "own_files",
+        "size", "allocated", "files", "directories",
+    )
+
+    def __init__(self, parent: Optional["_Dir"]):
+        self.parent = parent
+        self.children: Dict[str, "_Dir"] = {}
+        self.own_size = self.own_allocated = self.own_files = 0
+        self.size = self.allocated = self.files = self.directories = 0
+
+
+def _scan(os_dir: str) -> Tuple[int, int, int, Set[str]]:
+    """Total size, allocated size and number of the files of ``os_dir``,
+    and the names of its subdirectories."""
+    size = allocated = files = 0
+    subdirs = set()
+    with os.scandir(os_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.add(entry.name)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            size += st.st_size
+            allocated += getattr(st, "st_blocks", (st.st_size + 511) // 512) * 512
+            files += 1
+    return size, allocated, files, subdirs
+
+
+class DiskUsage:
+    """Tree of the sizes of the directories under ``root_dir``.
+
+    ``start`` runs the walker thread: it walks the whole tree once, then
+    lists again the directories reported as changed. Sizes can be read
+    during the first walk; they are those of what was walked so far and
+    ``complete`` is False.
+    """
+
+    def __init__(
+            self,
+            root_dir: str,
+            max_workers: int = 4,
+            use_inotify: bool = True,
+            watcher: Optional[SharedWatcher] = None,
+    ):
+        self.root_dir = os.path.abspath(root_dir)
+        self.max_workers = max_workers
+        self.complete = False
+        self._root = _Dir(None)
+        self._lock = threading.RLock()
+        self._dirty: Dict[str, bool] = {}
+        self._dirty_lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._thread = None
+        self._stopped = threading.Event()
+        # directories listed again every RESCAN_INTERVAL
+        self._unwatched: Set[str] = set()
+        # the watcher may be shared with other services, it is only closed
+        # by close() if it was created here
+        self._owns_watcher = watcher is None
+        if watcher is None and use_inotify:
+            watcher = SharedWatcher()
+        self.watcher = watcher
+
+    def start(self) -> None:
+        """Walk root_dir in the background and keep the tree current."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="disk-usage"
+        )
+        self._thread = threading.Thread(target=self._run, name="disk-usage", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        if self.watcher is not None:
+            self.watcher.unsubscribe(self._on_events)
+        with self._dirty_lock:
+            self._unwatched.clear()
+
+    def close(self) -> None:
+        self.stop()
+        if self.watcher is not None and self._owns_watcher:
+            self.watcher.close()
+
+    def invalidate(self, os_path: str, recursive: bool = False) -> None:
+        """List the directory of ``os_path`` again soon, and with
+        ``recursive`` walk ``os_path`` again if it is a directory."""
+        self._mark(os.path.dirname(os_path), False)
+        if recursive:
+            self._mark(os_path, True)
+
+    def _mark(self, os_dir: str, recursive: bool) -> None:
+        if self._relparts(os_dir) is None:
+            return
+        with self._dirty_lock:
+            self._dirty[os_dir] = self._dirty.get(os_dir, False) or recursive
+
+    # reading
+
+    def _relparts(self, os_path: str) -> Optional[List[str]]:
+        relpath = os.path.relpath(os_path, self.root_dir)
+        if relpath == os.curdir:
+            return []
+        if relpath.startswith(os.pardir):
+            return None
+        return relpath.split(os.sep)
+
+    def _find(self, os_dir: str) -> Optional[_Dir]:
+        parts = self._relparts(os_dir)
+        if parts is None:
+            return None
+        node = self._root
+        for name in parts:
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def size(self, os_dir: str) -> Optional[int]:
+        """Size of everything below ``os_dir``, None until the first walk
+        is complete or if ``os_dir`` is not a walked directory."""
+        if not self.complete:
+            return None
+        with self._lock:
+            node = self._find(os_dir)
+            return None if node is None else node.size
+
+    def usage(self, os_dir: str, depth: int = 1) -> Optional[Dict[str, Any]]:
+        """Totals of ``os_dir`` and, ``depth`` levels down, of its
+        subdirectories (largest first), or None if it was not walked."""
+        with self._lock:
+            node = self._find(os_dir)
+            if node is None:
+                return None
+            return self._usage_model(node, min(depth, MAX_USAGE_DEPTH))
+
+    def _usage_model(self, node: _Dir, depth: int) -> Dict[str, Any]:
+        model = {
+            "size": node.size,
+            "allocated": node.allocated,
+            "files": node.files,
+            "directories": node.directories,
+        }
+        if depth > 0:
+            children = []
+            for name, child in node.children.items():
+                child_model = self._usage_model(child, depth - 1)
+                child_model["name"] = name
+                children.append(child_model)
+            children.sort(key=lambda child: child["size"], reverse=True)
+            model["children"] = children
+        return model
+
+    # updating
+
+    def _add(self, node: _Dir, size: int, allocated: int, files: int, directories: int) -> None:
+        while node is not None:
+            node.size += size
+            node.allocated += allocated
+            node.files += files
+            node.directories += directories
+            node = node.parent
+
+    def _attach(self, parent: _Dir, name: str) -> _Dir:
+        node = parent.children[name] = _Dir(parent)
+        self._add(parent, 0, 0, 0, 1)
+        return node
+
+    def _detach(self, parent: _Dir, name: str) -> None:
+        node = parent.children.pop(name)
+        self._add(parent, -node.size, -node.allocated, -node.files, -node.directories - 1)
+        node.parent = None
+
+    def _update(self, node: _Dir, scanned: Tuple[int, int, int, Set[str]]) -> List[str]:
+        """Apply the scan of ``node``'s directory; returns the names of the
+        subdirectories that appeared."""
+        size, allocated, files, subdirs = scanned
+        with self._lock:
+            self._add(
+                node,
+                size - node.own_size,
+                allocated - node.own_allocated,
+                files - node.own_files,
+                0,
+            )
+            node.own_size, node.own_allocated, node.own_files = size, allocated, files
+            for name in set(node.children) - subdirs:
+                self._detach(node, name)
+            new = [name for name in subdirs if name not in node.children]
+            for name in new:
+                self._attach(node, name)
+        return new
+
+    def _scan_watched(self, os_dir: str) -> Tuple[int, int, int, Set[str]]:
+        # watch before listing, so changes made meanwhile are not missed
+        parts = self._relparts(os_dir) or []
+        if (
+            self.watcher is not None
+            and not any(part.startswith(".") for part in parts)
+            and self.watcher.add_watch(os_dir, self._on_events)
+        ):
+            with self._dirty_lock:
+                self._unwatched.discard(os_dir)
+        else:
+            with self._dirty_lock:
+                self._unwatched.add(os_dir)
+        return _scan(os_dir)
+
+    def _walk(self, os_dir: str, node: _Dir, recursive: bool = True) -> None:
+        """List ``os_dir`` on the pool and, in parallel, the subdirectories
+        that appeared (all of them when ``recursive``), down to the bottom."""
+        pending = {self._pool.submit(self._scan_watched, os_dir): (os_dir, node)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                os_dir, node = pending.pop(future)
+                try:
+                    scanned = future.result()
+                except OSError:
+                    # gone, or unreadable: its parent listing decides
+                    continue
+                if node.parent is None and node is not self._root:
+                    # detached by a concurrent update
+                    continue
+                new = self._update(node, scanned)
+                names = list(node.children) if recursive else new
+                for name in names:
+                    child = node.children.get(name)
+                    if child is None:
+                        continue
+                    child_dir = os.path.join(os_dir, name)
+                    pending[self._pool.submit(self._scan_watched, child_dir)] = (child_dir, child)
+
+    def _on_events(self, events) -> None:
+        for event in events:
+            if event.mask & IN_Q_OVERFLOW:
+                self._mark(self.root_dir, True)
+            else:
+                self._mark(event.os_dir, False)
+
+    def _rescan_unwatched(self) -> None:
+        """Mark the directories without a watch, that are still in the tree,
+        to be listed again."""
+        with self._lock, self._dirty_lock:
+            for os_dir in list(self._unwatched):
+                if self._find(os_dir) is None:
+                    self._unwatched.discard(os_dir)
+                elif os_dir not in self._dirty:
+                    self._dirty[os_dir] = False
+
+    def _run(self) -> None:
+        if self.watcher is not None:
+            self.watcher.subscribe(self._on_events)
+        start = time.monotonic()
+        try:
+            self._walk(self.root_dir, self._root)
+        except Exception:
+            logger.exception("Disk usage walk of %s failed", self.root_dir)
+        self.complete = True
+        logger.info(
+            "Disk usage of %s: %d bytes in %d files, walked in %.1fs",
+            self.root_dir, self._root.size, self._root.files, time.monotonic() - start,
+        )
+        last_rescan = time.monotonic()
+        while not self._stopped.is_set():
+            self._stopped.wait(POLL_INTERVAL)
+            if time.monotonic() - last_rescan > RESCAN_INTERVAL:
+                self._rescan_unwatched()
+                last_rescan = time.monotonic()
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, {}
+            recursive = [os_dir for os_dir, walk in dirty.items() if walk]
+            for os_dir in sorted(dirty):
+                if any(os_dir.startswith(parent + os.sep) for parent in recursive):
+                    # covered by the walk of a parent
+                    continue
+                try:
+                    self._refresh(os_dir, dirty[os_dir])
+                except Exception:
+                    logger.exception("Failed to update the disk usage of %s", os_dir)
+
+    def _refresh(self, os_dir: str, recursive: bool) -> None:
+        with self._lock:
+            node = self._find(os_dir)
+        if node is None:
+            # not in the tree: the listing of its parent adds it
+            return
+        self._walk(os_dir, node, recursive=recursive)
@@ -0,0 +1,75 @@
+"""Bounded thread pool running blocking contents operations off the IOLoop."""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List
+
+from zasper_py.services.metrics import metrics
+
+QUEUE_DEPTH = metrics.CONTENTS_EXECUTOR_QUEUE_DEPTH
+WAIT_SECONDS = metrics.CONTENTS_EXECUTOR_WAIT_SECONDS
+DURATION_SECONDS = metrics.CONTENTS_OPERATION_DURATION_SECONDS
+
+
+class ContentsExecutor:
+    """Run blocking functions on a bounded pool of worker threads.
+
+    Queue depth, time spent queued and time spent running (per operation)
+    are exported as metrics to size ``max_workers``.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="contents")
+        self._path_locks: Dict[str, List[Any]] = {}
+
+    async def run(self, operation: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run ``func(*args, **kwargs)`` on a worker thread and await its result."""
+        submitted = time.monotonic()
+        started = False
+
+        def call():
+            nonlocal started
+            started = True
+            begin = time.monotonic()
+            QUEUE_DEPTH.dec()
+            WAIT_SECONDS.observe(begin - submitted)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                DURATION_SECONDS.labels(operation).observe(time.monotonic() - begin)
+
+        QUEUE_DEPTH.inc()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        finally:
+            if not started:
+                # cancelled before a worker picked it up
+                QUEUE_DEPTH.dec()
+
+    @asynccontextmanager
+    async def serialize(self, *keys: str):
+        """Hold the locks of ``keys`` (API paths), so writes to one path run
+        one at a time. Locks are taken in sorted order to avoid deadlocks."""
+        keys = sorted({key.strip("/") for key in keys})
+        counted = []
+        held = []
+        try:
+            for key in keys:
+                entry = self._path_locks.setdefault(key, [asyncio.Lock(), 0])
+                entry[1] += 1
+                counted.append(entry)
+                await entry[0].acquire()
+                held.append(entry[0])
+            yield
+        finally:
+            for lock in reversed(held):
+                lock.release()
+            for key, entry in zip(keys, counted):
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._path_locks[key]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
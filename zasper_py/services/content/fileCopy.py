@@ -0,0 +1,197 @@
+"""Server-side copies of files, without moving their bytes through Python
+when the kernel can do it.
+
+Each file is copied by the first of these methods that works:
+
+- ``reflink``: a FICLONE ioctl, which shares the extents of the source on
+  copy-on-write filesystems (btrfs, XFS with reflink, bcachefs, ...): any
+  size copies in about the time of a metadata write;
+- ``copy_file_range``: an in-kernel copy, offloaded to the server on NFS
+  and SMB;
+- ``sendfile``: an in-kernel copy through the page cache;
+- ``read``: reads and writes of ``CHUNK_SIZE`` bytes.
+
+Copies report their progress as ``progress(copied, total)`` after each
+chunk, on the thread running them.
+"""
+import errno
+import logging
+import os
+import shutil
+from contextlib import suppress
+from typing import Callable, Optional
+
+from zasper_py.services.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COPY_BYTES_TOTAL = metrics.CONTENTS_COPY_BYTES_TOTAL
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# bytes copied between two progress reports
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# read fallback buffer
+READ_SIZE = 1024 * 1024
+
+# errors meaning the method is not supported for these two files, so the
+# next one is tried
+UNSUPPORTED = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSUP,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EPERM,
+    errno.EXDEV,
+}
+
+Progress = Optional[Callable[[int, int], None]]
+
+
+def _reflink(src_fd: int, dst_fd: int, size: int, progress: Progress) -> bool:
+    if fcntl is None or not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in UNSUPPORTED:
+            return False
+        raise
+    if progress is not None:
+        progress(size, size)
+    return True
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int, progress: Progress) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+    return _copy_loop(
+        lambda offset: os.copy_file_range(src_fd, dst_fd, CHUNK_SIZE, offset, offset),
+        size, progress,
+    )
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int, progress: Progress) -> bool:
+    if not hasattr(os, "sendfile"):
+        return False
+    # sendfile writes at the position of dst_fd
+    return _copy_loop(
+        lambda offset: os.sendfile(dst_fd, src_fd, offset, CHUNK_SIZE), size, progress
+    )
+
+
+def _copy_loop(copy_chunk: Callable[[int], int], size: int, progress: Progress) -> bool:
+    """Call ``copy_chunk(offset)`` until it copies nothing. Returns False
+    when the first call fails as unsupported, before anything is copied."""
+    copied = 0
+    while True:
+        try:
+            n = copy_chunk(copied)
+        except OSError as e:
+            if copied == 0 and e.errno in UNSUPPORTED:
+                return False
+            raise
+        if n == 0:
+            break
+        copied += n
+        if progress is not None:
+            progress(copied, max(size, copied))
+    if copied == 0 and size > 0:
+        # files of /proc and the like report a size but cannot be copied
+        # in the kernel
+        return False
+    return True
+
+
+def _read(src_fd: int, dst_fd: int, size: int, progress: Progress) -> bool:
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    copied = reported = 0
+    with open(src_fd, "rb", buffering=0, closefd=False) as src:
+        while True:
+            n = src.readinto(buffer)
+            if not n:
+                break
+            written = 0
+            while written < n:
+                written += os.write(dst_fd, view[written:n])
+            copied += n
+            if progress is not None and (copied - reported >= CHUNK_SIZE or copied >= size):
+                progress(copied, max(size, copied))
+                reported = copied
+    return True
+
+
+METHODS = (
+    ("reflink", _reflink),
+    ("copy_file_range", _copy_file_range),
+    ("sendfile", _sendfile),
+    ("read", _read),
+)
+
+
+def copy_file(src: str, dst: str, progress: Progress = None) -> str:
+    """Copy the file ``src`` to ``dst``, which must not exist, with its
+    mode and times. Returns the method used.
+
+    A partially copied ``dst`` is removed when the copy fails.
+    """
+    with open(src, "rb") as src_file:
+        src_fd = src_file.fileno()
+        size = os.fstat(src_fd).st_size
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            for method, copy in METHODS:
+                if copy(src_fd, dst_fd, size, progress):
+                    break
+                # nothing was written by the method that gave up
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                os.lseek(src_fd, 0, os.SEEK_SET)
+        except BaseException:
+            os.close(dst_fd)
+            os.unlink(dst)
+            raise
+        os.close(dst_fd)
+    try:
+        shutil.copystat(src, dst)
+    except OSError:
+        logger.debug("copystat on %s failed", dst, exc_info=True)
+    COPY_BYTES_TOTAL.labels(method).inc(size)
+    logger.debug("Copied %s to %s (%d bytes, %s)", src, dst, size, method)
+    return method
+
+
+def copy_tree(src: str, dst: str, progress: Progress = None) -> None:
+    """Copy the directory ``src`` to ``dst``, which must not exist, each file
+    with ``copy_file``. Progress is reported over the bytes of all files."""
+    total = 0
+    if progress is not None:
+        for dirpath, _, filenames in os.walk(src):
+            for name in filenames:
+                file_path = os.path.join(dirpath, name)
+                if not os.path.islink(file_path):
+                    # symlinks are copied as symlinks
+                    with suppress(OSError):
+                        total += os.lstat(file_path).st_size
+    done = 0
+
+    def copy_function(file_src, file_dst):
+        nonlocal done
+        file_progress = None
+        if progress is not None:
+            def file_progress(copied, size):
+                progress(done + copied, max(total, done + copied))
+        copy_file(file_src, file_dst, file_progress)
+        if progress is not None:
+            done += os.lstat(file_dst).st_size
+
+    shutil.copytree(src, dst, symlinks=True, copy_function=copy_function)
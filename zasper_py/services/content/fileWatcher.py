@@ -0,0 +1,297 @@
+"""Minimal Linux inotify binding used to invalidate cached contents models.
+
+Only the standard library is used (``ctypes``), so on platforms without
+inotify ``InotifyWatcher.available`` is False and callers are expected to
+fall back to comparing directory mtimes.
+
+``SharedWatcher`` is one such instance shared by the background services
+that watch the whole workspace (search index, disk usage), so that a
+directory costs one watch of ``max_user_watches`` however many of them
+watch it.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+class WatchEvent(NamedTuple):
+    """One inotify event, resolved to the watched directory it belongs to.
+
+    ``os_dir`` is None for queue overflows, after which every watched
+    directory must be considered changed.
+    """
+
+    os_dir: Optional[str]
+    name: str
+    mask: int
+    cookie: int
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1  # noqa: B018
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyWatcher:
+    """Non-blocking inotify instance watching a set of directories.
+
+    Events are not delivered by callback: callers drain them with
+    ``read_events``, either lazily (before trusting a cache entry) or by
+    registering ``fileno()`` with the IOLoop.
+    """
+
+    def __init__(self, mask: int = WATCH_MASK):
+        self.mask = mask
+        self._lock = threading.Lock()
+        self._wds: Dict[str, int] = {}
+        self._dirs: Dict[int, str] = {}
+        self._fd = -1
+        self._libc = _load_libc()
+        if self._libc is None:
+            return
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            logger.warning(
+                "inotify unavailable (%s), falling back to mtime checks",
+                os.strerror(ctypes.get_errno()),
+            )
+            return
+        self._fd = fd
+
+    @property
+    def available(self) -> bool:
+        return self._fd >= 0
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def is_watched(self, os_dir: str) -> bool:
+        return os_dir in self._wds
+
+    def add_watch(self, os_dir: str) -> bool:
+        """Start watching ``os_dir``. Returns False if it cannot be watched."""
+        if not self.available:
+            return False
+        with self._lock:
+            if os_dir in self._wds:
+                return True
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(os_dir), self.mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    logger.warning("inotify watch limit reached, not watching %s", os_dir)
+                return False
+            stale = self._dirs.get(wd)
+            if stale is not None:
+                # same inode under a new name: the directory was moved
+                self._wds.pop(stale, None)
+            self._wds[os_dir] = wd
+            self._dirs[wd] = os_dir
+        return True
+
+    def rm_watch(self, os_dir: str) -> None:
+        """Stop watching ``os_dir``."""
+        with self._lock:
+            wd = self._wds.pop(os_dir, None)
+            if wd is None:
+                return
+            self._dirs.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def read_events(self) -> List[WatchEvent]:
+        """Return every event queued since the last call, without blocking."""
+        if not self.available:
+            return []
+        events: List[WatchEvent] = []
+        while True:
+            try:
+                buf = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                logger.warning("Failed reading inotify events: %r", e)
+                break
+            if not buf:
+                break
+            events.extend(self._parse(buf))
+        return events
+
+    def _parse(self, buf: bytes) -> Iterator[WatchEvent]:
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(buf[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                yield WatchEvent(None, "", mask, cookie)
+                continue
+            with self._lock:
+                os_dir = self._dirs.get(wd)
+                if mask & IN_IGNORED and os_dir is not None:
+                    # the kernel dropped the watch (directory deleted or unmounted)
+                    self._dirs.pop(wd, None)
+                    self._wds.pop(os_dir, None)
+            if os_dir is not None:
+                yield WatchEvent(os_dir, name, mask, cookie)
+
+    def close(self) -> None:
+        if self.available:
+            os.close(self._fd)
+            self._fd = -1
+        self._wds.clear()
+        self._dirs.clear()
+
+
+# seconds the reader thread of a SharedWatcher waits for events before
+# checking whether it was stopped
+READ_TIMEOUT = 0.5
+
+
+class SharedWatcher:
+    """An InotifyWatcher shared by several consumers, read on its own thread.
+
+    A consumer is the callback it registers with ``subscribe``. Watches are
+    added and removed per consumer: a directory is watched once, until the
+    last consumer watching it removes it. Each batch of events read is
+    passed to the consumers watching the directories they belong to; queue
+    overflows are passed to every consumer.
+    """
+
+    def __init__(self, watcher: Optional[InotifyWatcher] = None):
+        self.watcher = watcher if watcher is not None else InotifyWatcher()
+        self._lock = threading.Lock()
+        self._consumers: List[Callable[[List[WatchEvent]], None]] = []
+        self._owners: Dict[str, Set[Callable]] = {}
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def available(self) -> bool:
+        return self.watcher.available
+
+    def subscribe(self, consumer: Callable[[List[WatchEvent]], None]) -> None:
+        """Pass the events of the directories ``consumer`` watches to it,
+        on the reader thread, started with the first consumer."""
+        with self._lock:
+            if consumer not in self._consumers:
+                self._consumers.append(consumer)
+            if self._thread is None and self.available:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="inotify", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, consumer: Callable[[List[WatchEvent]], None]) -> None:
+        """Remove ``consumer`` and every watch it added."""
+        with self._lock:
+            if consumer in self._consumers:
+                self._consumers.remove(consumer)
+            owned = [os_dir for os_dir, owners in self._owners.items() if consumer in owners]
+        for os_dir in owned:
+            self.rm_watch(os_dir, consumer)
+
+    def is_watched(self, os_dir: str, consumer: Callable) -> bool:
+        with self._lock:
+            return consumer in self._owners.get(os_dir, ()) and self.watcher.is_watched(os_dir)
+
+    def add_watch(self, os_dir: str, consumer: Callable) -> bool:
+        """Watch ``os_dir`` for ``consumer``. Returns False if it cannot be
+        watched."""
+        if not self.watcher.add_watch(os_dir):
+            return False
+        with self._lock:
+            self._owners.setdefault(os_dir, set()).add(consumer)
+        return True
+
+    def rm_watch(self, os_dir: str, consumer: Callable) -> None:
+        with self._lock:
+            owners = self._owners.get(os_dir)
+            if owners is None or consumer not in owners:
+                return
+            owners.discard(consumer)
+            if owners:
+                return
+            del self._owners[os_dir]
+        self.watcher.rm_watch(os_dir)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            select.select([self.watcher.fileno()], [], [], READ_TIMEOUT)
+            events = self.watcher.read_events()
+            if events:
+                self._dispatch(events)
+
+    def _dispatch(self, events: List[WatchEvent]) -> None:
+        with self._lock:
+            batches: Dict[Callable, List[WatchEvent]] = {consumer: [] for consumer in self._consumers}
+            for event in events:
+                if event.os_dir is None:
+                    owners = self._consumers
+                else:
+                    owners = self._owners.get(event.os_dir, ())
+                    if event.mask & IN_IGNORED:
+                        # the kernel dropped the watch
+                        self._owners.pop(event.os_dir, None)
+                for consumer in owners:
+                    if consumer in batches:
+                        batches[consumer].append(event)
+        for consumer, batch in batches.items():
+            if batch:
+                try:
+                    consumer(batch)
+                except Exception:
+                    logger.exception("Failed to handle inotify events")
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.watcher.close()
+        self._owners.clear()
+        self._consumers.clear()
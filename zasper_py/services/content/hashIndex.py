@@ -0,0 +1,116 @@
+"""Persistent index of file content hashes, keyed on the file's stat identity."""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# bytes read at a time while hashing
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# files modified more recently than this are hashed but not indexed: on
+# filesystems with coarse timestamps a second write within the same tick
+# would keep the same (inode, mtime, size) and the stale hash would stick
+RACY_WINDOW = 2.0
+
+
+class HashIndex:
+    """Content hashes stored in SQLite and reused until the file changes.
+
+    A row is only trusted while the file still has the inode, mtime and
+    size it had when it was hashed, so a lookup costs one ``stat`` and a
+    primary-key query instead of reading the whole file. Misses are hashed
+    in a single streaming pass, on the thread of the caller (the contents
+    executor for requests).
+    """
+
+    def __init__(self, database_filepath: str = ":memory:"):
+        self.database_filepath = database_filepath
+        self._lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        """Start a database connection and create the 'file_hash' table"""
+        if self._connection is None:
+            if self.database_filepath != ":memory:":
+                os.makedirs(os.path.dirname(self.database_filepath), exist_ok=True)
+            # Set isolation level to None to autocommit all changes to the database.
+            self._connection = sqlite3.connect(
+                self.database_filepath, isolation_level=None, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS file_hash
+                (path TEXT, algorithm TEXT, inode INTEGER, mtime_ns INTEGER,
+                size INTEGER, hash TEXT, PRIMARY KEY (path, algorithm))"""
+            )
+        return self._connection
+
+    def lookup(self, os_path: str, st: os.stat_result, algorithm: str) -> Optional[str]:
+        """Return the indexed hash of ``os_path`` if the file has not changed."""
+        try:
+            with self._lock:
+                row = self.connection.execute(
+                    "SELECT inode, mtime_ns, size, hash FROM file_hash WHERE path=? AND algorithm=?",
+                    (os_path, algorithm),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Hash index lookup failed for %s: %r", os_path, e)
+            return None
+        if row is None or tuple(row[:3]) != (st.st_ino, st.st_mtime_ns, st.st_size):
+            return None
+        return row[3]
+
+    def store(self, os_path: str, st: os.stat_result, algorithm: str, digest: str) -> None:
+        if time.time() - st.st_mtime < RACY_WINDOW:
+            return
+        try:
+            with self._lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO file_hash VALUES (?, ?, ?, ?, ?, ?)",
+                    (os_path, algorithm, st.st_ino, st.st_mtime_ns, st.st_size, digest),
+                )
+        except sqlite3.Error as e:
+            logger.warning("Hash index update failed for %s: %r", os_path, e)
+
+    def get_hash(self, os_path: str, algorithm: str = "sha256") -> str:
+        """Return the hash of ``os_path``, from the index or by reading it once."""
+        st = os.stat(os_path)
+        digest = self.lookup(os_path, st, algorithm)
+        if digest is not None:
+            return digest
+
+        h = hashlib.new(algorithm)
+        with open(os_path, "rb") as f:
+            st = os.fstat(f.fileno())
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        if os.stat(os_path).st_mtime_ns == st.st_mtime_ns:
+            # not modified while we were reading it
+            self.store(os_path, st, algorithm, digest)
+        return digest
+
+    def invalidate(self, os_path: str, recursive: bool = False) -> None:
+        """Forget ``os_path``, and with ``recursive`` every file below it."""
+        query = "DELETE FROM file_hash WHERE path=?"
+        args = [os_path]
+        if recursive:
+            prefix = os_path.rstrip(os.sep) + os.sep
+            query += " OR substr(path, 1, ?)=?"
+            args += [len(prefix), prefix]
+        try:
+            with self._lock:
+                self.connection.execute(query, args)
+        except sqlite3.Error as e:
+            logger.warning("Hash index update failed for %s: %r", os_path, e)
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,111 @@
+"""Notebooks with their outputs left out, to be fetched cell by cell.
+
+In a lazy notebook model, each output larger than the inline size is
+replaced by a stub::
+
+    {"output_type": "display_data", "lazy": true, "size": 183402,
+     "mimetypes": ["image/png", "text/plain"]}
+
+``size`` is the number of characters of the output's data, ``mimetypes``
+its representations (``text/plain`` for streams). Stubs of streams keep
+their ``name``, of execute results their ``execution_count``, of errors
+their ``ename`` and ``evalue``. The full outputs of a list of cells are then
+returned by ``cell_outputs``.
+"""
+from typing import Any, Dict, List, Optional
+
+import nbformat
+from tornado import web
+
+STUB_KEYS = {
+    "stream": ("name",),
+    "execute_result": ("execution_count",),
+    "error": ("ename", "evalue"),
+}
+
+
+def output_size(value: Any) -> int:
+    """Characters held by the strings of an output, its length in JSON
+    without the quoting and punctuation."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + output_size(item) for key, item in value.items())
+    if isinstance(value, list):
+        return sum(output_size(item) for item in value)
+    return 0
+
+
+def output_stub(output: Dict[str, Any], size: int) -> Dict[str, Any]:
+    output_type = output.get("output_type")
+    if output_type == "stream":
+        mimetypes = ["text/plain"]
+    else:
+        mimetypes = list(output.get("data", {}))
+    stub = {"output_type": output_type, "lazy": True, "size": size, "mimetypes": mimetypes}
+    for key in STUB_KEYS.get(output_type, ()):
+        if key in output:
+            stub[key] = output[key]
+    return stub
+
+
+def lazy_notebook(nb, inline_size: int = 1024):
+    """A copy of ``nb`` with the outputs over ``inline_size`` stubbed.
+
+    Only the cells and the outputs lists are copied: ``nb`` is not modified
+    but shares everything else with the copy.
+    """
+    lazy = nbformat.NotebookNode(nb)
+    cells = []
+    for cell in nb.cells:
+        if cell.get("cell_type") == "code" and cell.get("outputs"):
+            cell = nbformat.NotebookNode(cell)
+            outputs = []
+            for output in cell.outputs:
+                size = output_size(output)
+                outputs.append(output if size <= inline_size else output_stub(output, size))
+            cell["outputs"] = outputs
+        cells.append(cell)
+    lazy["cells"] = cells
+    return lazy
+
+
+def has_stubs(outputs: List[Dict[str, Any]]) -> bool:
+    return any(isinstance(output, dict) and output.get("lazy") is True for output in outputs)
+
+
+def check_no_stubs(nb) -> None:
+    """Refuse to write a notebook whose outputs were not all loaded."""
+    for cell in nb.get("cells", []):
+        if has_stubs(cell.get("outputs") or []):
+            raise web.HTTPError(
+                400, "Cell %s has outputs that were not loaded" % cell.get("id", "")
+            )
+
+
+def cell_outputs(
+        nb, ids: Optional[List[str]] = None, indices: Optional[List[int]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """The outputs and execution count of the code cells with ``ids`` (or,
+    for notebooks without cell ids, at ``indices``), keyed by id or index.
+
+    Raises 409 for cells that do not exist: the notebook changed since the
+    client read it.
+    """
+    by_id = {cell.get("id"): cell for cell in nb.cells} if ids else {}
+    found = {}
+    for key in ids or ():
+        if key not in by_id:
+            raise web.HTTPError(409, "No cell with id %r" % key)
+        found[key] = by_id[key]
+    for index in indices or ():
+        if not 0 <= index < len(nb.cells):
+            raise web.HTTPError(409, "No cell at index %d" % index)
+        found[str(index)] = nb.cells[index]
+    return {
+        key: {
+            "outputs": cell.get("outputs", []),
+            "execution_count": cell.get("execution_count"),
+        }
+        for key, cell in found.items()
+    }
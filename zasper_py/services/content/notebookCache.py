@@ -0,0 +1,84 @@
+"""LRU cache of parsed notebooks, keyed on the stat identity of the file."""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from zasper_py.services.metrics import metrics
+
+HITS_TOTAL = metrics.NOTEBOOK_CACHE_HITS_TOTAL
+MISSES_TOTAL = metrics.NOTEBOOK_CACHE_MISSES_TOTAL
+CACHED_BYTES = metrics.NOTEBOOK_CACHE_BYTES
+
+
+def stat_key(st: os.stat_result) -> tuple:
+    """Identity of a file version: a rewrite or replace changes one of these."""
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class CachedNotebook:
+    """A parsed notebook with its cells marked trusted or not, and the
+    validation message it produced (None if valid)."""
+
+    __slots__ = ("key", "nb", "message", "size")
+
+    def __init__(self, key, nb, message, size):
+        self.key = key
+        self.nb = nb
+        self.message = message
+        self.size = size
+
+
+class NotebookCache:
+    """Bounded LRU of parsed notebooks.
+
+    An entry is only returned while the file still has the inode, mtime and
+    size it had when it was read, so changes made outside the server are
+    picked up by the ``stat`` callers do anyway. The cache is bounded both
+    in entries and in the total on-disk size of the notebooks it holds.
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 512 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedNotebook]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, os_path: str, st: os.stat_result) -> Optional[CachedNotebook]:
+        with self._lock:
+            entry = self._entries.get(os_path)
+            if entry is None or entry.key != stat_key(st):
+                MISSES_TOTAL.inc()
+                return None
+            self._entries.move_to_end(os_path)
+        HITS_TOTAL.inc()
+        return entry
+
+    def put(self, os_path: str, st: os.stat_result, nb: Any, message: Optional[str]) -> CachedNotebook:
+        entry = CachedNotebook(stat_key(st), nb, message, st.st_size)
+        if entry.size > self.max_bytes:
+            return entry
+        with self._lock:
+            self._pop(os_path)
+            self._entries[os_path] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+            CACHED_BYTES.set(self._bytes)
+        return entry
+
+    def invalidate(self, os_path: str, recursive: bool = False) -> None:
+        """Drop ``os_path``, and with ``recursive`` every notebook below it."""
+        with self._lock:
+            self._pop(os_path)
+            if recursive:
+                prefix = os_path.rstrip(os.sep) + os.sep
+                for path in [p for p in self._entries if p.startswith(prefix)]:
+                    self._pop(path)
+            CACHED_BYTES.set(self._bytes)
+
+    def _pop(self, os_path: str) -> None:
+        entry = self._entries.pop(os_path, None)
+        if entry is not None:
+            self._bytes -= entry.size
@@ -0,0 +1,131 @@
+"""Large notebook outputs kept out of the notebook file, once per content.
+
+When a notebook is saved with output blobs enabled, every output
+representation (``data[mimetype]``) whose JSON is at least ``threshold``
+bytes is stored zlib compressed under ``<root>/<digest[:2]>/<digest[2:]>``,
+its digest being the sha256 of that JSON. In the notebook the value is left
+empty and the output's metadata points at the blob::
+
+    "data": {"image/png": ""},
+    "metadata": {"zasper.blobs": {"image/png": "<sha256>"}}
+
+so the file stays a valid notebook, and identical outputs, in one notebook
+or across notebooks and saves, are stored and written once. ``inline``
+puts the values back when a notebook is read or exported.
+
+Blobs are never removed: older versions and checkpoints of a notebook may
+still refer to them.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+
+import nbformat
+from tornado import web
+
+# key of the output metadata mapping mimetypes to blob digests
+BLOBS_KEY = "zasper.blobs"
+
+COMPRESSION_LEVEL = 6
+
+
+class OutputBlobStore:
+    """Content-addressed store of output values under ``root``."""
+
+    def __init__(self, root: str, threshold: int = 64 * 1024):
+        self.root = root
+        self.threshold = threshold
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` unless already stored, and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+        if os.path.exists(blob_path):
+            return digest
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(data, COMPRESSION_LEVEL))
+                f.flush()
+                # durable before a notebook refers to it
+                os.fsync(f.fileno())
+            os.replace(tmp_path, blob_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                return zlib.decompress(f.read())
+        except FileNotFoundError:
+            raise web.HTTPError(500, f"Output blob is missing: {digest}") from None
+
+    def externalize(self, nb):
+        """A copy of ``nb`` with its large output values stored as blobs.
+
+        ``nb`` is not modified; the copy shares everything but the cells and
+        outputs that changed.
+        """
+        cells = []
+        changed = False
+        for cell in nb.cells:
+            outputs = cell.get("outputs") if cell.get("cell_type") == "code" else None
+            if outputs:
+                new_outputs = [self._externalize_output(output) for output in outputs]
+                if any(new is not old for new, old in zip(new_outputs, outputs)):
+                    cell = nbformat.NotebookNode(cell)
+                    cell["outputs"] = new_outputs
+                    changed = True
+            cells.append(cell)
+        if not changed:
+            return nb
+        nb = nbformat.NotebookNode(nb)
+        nb["cells"] = cells
+        return nb
+
+    def _externalize_output(self, output):
+        data = output.get("data")
+        if not data:
+            return output
+        blobs = dict(output.get("metadata", {}).get(BLOBS_KEY, {}))
+        new_data = None
+        for mimetype, value in data.items():
+            if mimetype in blobs:
+                continue
+            if isinstance(value, str) and len(value) < self.threshold:
+                # not worth serializing to find out
+                continue
+            serialized = json.dumps(value, separators=(",", ":")).encode("utf8")
+            if len(serialized) < self.threshold:
+                continue
+            blobs[mimetype] = self.put(serialized)
+            if new_data is None:
+                new_data = dict(data)
+            new_data[mimetype] = ""
+        if new_data is None:
+            return output
+        output = nbformat.NotebookNode(output)
+        output["data"] = nbformat.from_dict(new_data)
+        metadata = dict(output.get("metadata", {}))
+        metadata[BLOBS_KEY] = blobs
+        output["metadata"] = nbformat.from_dict(metadata)
+        return output
+
+    def inline(self, nb):
+        """Put the values of the blobs ``nb`` refers to back, in place."""
+        for cell in nb.cells:
+            for output in cell.get("outputs") or ():
+                blobs = output.get("metadata", {}).pop(BLOBS_KEY, None)
+                if not blobs:
+                    continue
+                for mimetype, digest in blobs.items():
+                    output["data"][mimetype] = nbformat.from_dict(json.loads(self.get(digest)))
+        return nb
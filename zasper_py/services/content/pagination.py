@@ -0,0 +1,84 @@
+"""Sorting and cursor-based paging of directory listings."""
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from tornado import web
+
+SORT_FIELDS = ("name", "last_modified", "size", "type")
+
+
+def _sort_key(field: str):
+    # ties are broken on the name, which is unique within a directory, so
+    # every key identifies exactly one position in the listing
+    if field == "name":
+        return lambda model: (model["name"],)
+    if field == "size":
+        return lambda model: (model["size"] if model["size"] is not None else -1, model["name"])
+    if field == "last_modified":
+        # as a timestamp, so the key can be stored in a JSON cursor
+        return lambda model: (model["last_modified"].timestamp(), model["name"])
+    return lambda model: (model[field] or "", model["name"])
+
+
+def parse_sort(sort: Optional[str]) -> Tuple[str, bool]:
+    """Split a ``sort`` argument such as ``-size`` into (field, descending)."""
+    sort = sort or "name"
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    if field not in SORT_FIELDS:
+        raise web.HTTPError(400, f"Sort {sort!r} is invalid, expected one of {SORT_FIELDS}")
+    return field, descending
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise web.HTTPError(400, f"Cursor {cursor!r} is invalid") from e
+    if not isinstance(key, list):
+        raise web.HTTPError(400, f"Cursor {cursor!r} is invalid")
+    return tuple(key)
+
+
+def paginate(
+    entries: List[Dict[str, Any]],
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Return the page of ``entries`` following ``cursor`` and the next cursor.
+
+    The cursor is the sort key of the last entry returned, so pages stay
+    consistent when entries are added or removed between requests. The
+    next cursor is None on the last page.
+    """
+    field, descending = parse_sort(sort)
+    key = _sort_key(field)
+    ordered = sorted(entries, key=key)
+    keys = [key(model) for model in ordered]
+    after = decode_cursor(cursor) if cursor else None
+    if limit is None:
+        limit = len(ordered)
+
+    try:
+        if not descending:
+            start = bisect_right(keys, after) if after is not None else 0
+            page = ordered[start:start + limit]
+            more = start + limit < len(ordered)
+        else:
+            end = bisect_left(keys, after) if after is not None else len(ordered)
+            start = max(0, end - limit)
+            page = ordered[start:end][::-1]
+            more = start > 0
+    except TypeError as e:
+        # a cursor produced by a different sort
+        raise web.HTTPError(400, f"Cursor {cursor!r} does not match sort {sort!r}") from e
+
+    next_cursor = encode_cursor(key(page[-1])) if more and page else None
+    return page, next_cursor
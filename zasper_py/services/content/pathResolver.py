@@ -0,0 +1,149 @@
+"""Memoized resolution of API paths, and hidden checks, for ContentsManager.
+
+API paths are resolved to OS paths several times per request, and checked
+for being hidden once per request and once per entry of a listing. The
+resolution of a path only depends on the root, so it is kept in an LRU and
+never invalidated. Whether a directory is hidden depends on its flags and
+permissions: it is kept in a second LRU, invalidated by ContentsManager
+when a directory is renamed or deleted.
+"""
+import errno
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from tornado.web import HTTPError
+
+from zasper_py.core.paths import is_file_hidden
+from zasper_py.utils import ApiPath, to_os_path
+
+
+class PathResolver:
+    """Resolve API paths under ``root_dir`` and tell whether they are hidden.
+
+    A path is hidden if its name or the name of one of its parents (up to
+    the root) starts with a dot, or if it or one of its parents is hidden
+    as per ``is_file_hidden``: UF_HIDDEN flag, hidden attribute on Windows,
+    directory that cannot be listed.
+    """
+
+    def __init__(self, root_dir: str, max_size: int = 4096):
+        self.root_dir = root_dir
+        self.root = os.path.abspath(root_dir)
+        self._root_prefix = os.path.join(self.root, "")
+        self.max_size = max_size
+        self._os_paths: "OrderedDict[str, str]" = OrderedDict()
+        self._hidden_dirs: "OrderedDict[str, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def os_path(self, path: str) -> str:
+        """The native, absolute OS path of the API path ``path``.
+
+        Raises 404 if ``path`` is not a valid path inside the root.
+        """
+        with self._lock:
+            os_path = self._os_paths.get(path)
+            if os_path is not None:
+                self._os_paths.move_to_end(path)
+                return os_path
+        # to_os_path is not safe if path starts with a drive, since os.path.join discards first part
+        if os.path.splitdrive(path)[0]:
+            raise HTTPError(404, "%s is not a relative API path" % path)
+        os_path = to_os_path(ApiPath(path), self.root)
+        # e.g. "foo\0" would raise ValueError: embedded null byte in the os calls
+        try:
+            if "\0" in os_path:
+                raise ValueError("embedded null byte")
+            os.fsencode(os_path)
+        except ValueError:
+            raise HTTPError(404, f"{path} is not a valid path") from None
+        if not os.path.join(os_path, "").startswith(self._root_prefix):
+            raise HTTPError(404, "%s is outside root contents directory" % path)
+        with self._lock:
+            self._os_paths[path] = os_path
+            while len(self._os_paths) > self.max_size:
+                self._os_paths.popitem(last=False)
+        return os_path
+
+    def is_hidden(self, os_path: str) -> bool:
+        """Is ``os_path``, or one of its parents up to the root, hidden?"""
+        os_path = os.path.normpath(os_path)
+        if os_path == self.root:
+            return False
+        if not os_path.startswith(self._root_prefix):
+            return True
+        relpath = os_path[len(self._root_prefix):]
+        if any(part.startswith(".") for part in relpath.split(os.sep)):
+            return True
+        if self._is_self_hidden(os_path):
+            return True
+        parent = os.path.dirname(os_path)
+        while parent != self.root:
+            if self._is_dir_hidden(parent):
+                return True
+            parent = os.path.dirname(parent)
+        return False
+
+    def is_entry_hidden(self, os_path: str, st: os.stat_result) -> bool:
+        """Is the directory entry ``os_path``, whose ``lstat`` is ``st``,
+        hidden itself? Its parents are not checked."""
+        if os.path.basename(os_path).startswith("."):
+            return True
+        if stat.S_ISDIR(st.st_mode):
+            return self._is_dir_hidden(os_path, st)
+        return is_file_hidden(os_path, stat_res=st)
+
+    def _is_self_hidden(self, os_path: str) -> bool:
+        with self._lock:
+            hidden = self._hidden_dirs.get(os_path)
+        if hidden is not None:
+            return hidden
+        try:
+            st = os.lstat(os_path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        if stat.S_ISDIR(st.st_mode):
+            return self._is_dir_hidden(os_path, st)
+        return is_file_hidden(os_path, stat_res=st)
+
+    def _is_dir_hidden(self, os_dir: str, st: os.stat_result = None) -> bool:
+        with self._lock:
+            hidden = self._hidden_dirs.get(os_dir)
+            if hidden is not None:
+                self._hidden_dirs.move_to_end(os_dir)
+                return hidden
+        if st is None:
+            try:
+                # may fail on Windows junctions
+                st = os.lstat(os_dir)
+            except FileNotFoundError:
+                return False
+            except OSError:
+                return True
+        try:
+            hidden = is_file_hidden(os_dir, stat_res=st)
+        except OSError:
+            return True
+        with self._lock:
+            self._hidden_dirs[os_dir] = hidden
+            while len(self._hidden_dirs) > self.max_size:
+                self._hidden_dirs.popitem(last=False)
+        return hidden
+
+    def invalidate(self, os_path: str, recursive: bool = False) -> None:
+        """Forget whether ``os_path`` (and with ``recursive`` every directory
+        below it) is hidden."""
+        with self._lock:
+            self._hidden_dirs.pop(os_path, None)
+            if recursive:
+                prefix = os.path.join(os_path, "")
+                for os_dir in [d for d in self._hidden_dirs if d.startswith(prefix)]:
+                    del self._hidden_dirs[os_dir]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._os_paths.clear()
+            self._hidden_dirs.clear()
@@ -0,0 +1,100 @@
+"""Coalescing of concurrent saves into group commits."""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from zasper_py.services.metrics import metrics
+
+SAVES_COALESCED_TOTAL = metrics.CONTENTS_SAVES_COALESCED_TOTAL
+
+
+class _PendingSave:
+    __slots__ = ("model", "futures")
+
+    def __init__(self, model, future):
+        self.model = model
+        self.futures = [future]
+
+
+class SaveCoalescer:
+    """Collect saves for ``window`` seconds and write them as one batch.
+
+    A save of a path that is already waiting replaces its model if both
+    were made from the same version of the file (same base ``hash``, or
+    none), so a burst of autosaves writes the file once, with the latest
+    content. A save from another version is queued behind it instead, and
+    written in the next batch: its hash is then checked against what the
+    waiting save wrote. Every caller gets its own completion: the model (or
+    error) of the write that included its save. One batch is committed at a
+    time; saves arriving meanwhile wait for the next one.
+
+    ``commit`` is called with the list of ``(model, path)`` to write and
+    returns, in order, the saved model or the exception of each.
+    """
+
+    def __init__(
+            self,
+            commit: Callable[[List[tuple]], Awaitable[List[Any]]],
+            window: float = 0.05,
+            max_batch: int = 64,
+    ):
+        self.commit = commit
+        self.window = window
+        self.max_batch = max_batch
+        # saves waiting per path, in order; only the first goes in a batch
+        self._pending: Dict[str, List[_PendingSave]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._committing: Optional[asyncio.Task] = None
+
+    async def save(self, model, path: str):
+        path = path.strip("/")
+        future = asyncio.get_running_loop().create_future()
+        queue = self._pending.get(path)
+        if queue is None:
+            self._pending[path] = [_PendingSave(model, future)]
+        elif queue[-1].model.get("hash") == model.get("hash"):
+            SAVES_COALESCED_TOTAL.inc()
+            queue[-1].model = model
+            queue[-1].futures.append(future)
+        else:
+            queue.append(_PendingSave(model, future))
+        self._schedule()
+        return await asyncio.shield(future)
+
+    def _schedule(self) -> None:
+        if self._committing is not None or not self._pending:
+            return
+        loop = asyncio.get_running_loop()
+        if len(self._pending) >= self.max_batch:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._start()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._start)
+
+    def _start(self) -> None:
+        self._timer = None
+        batch = []
+        for path in list(self._pending)[: self.max_batch]:
+            queue = self._pending[path]
+            batch.append((path, queue.pop(0)))
+            if not queue:
+                del self._pending[path]
+        self._committing = asyncio.ensure_future(self._commit(batch))
+
+    async def _commit(self, batch: List[tuple]) -> None:
+        try:
+            try:
+                results = await self.commit([(pending.model, path) for path, pending in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for (path, pending), result in zip(batch, results):
+                for future in pending.futures:
+                    if future.done():
+                        continue
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._committing = None
+            self._schedule()
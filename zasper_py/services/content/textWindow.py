@@ -0,0 +1,241 @@
+"""Windows of lines or bytes of large text files, read through mmap.
+
+``_file_model`` reads and decodes a whole file, which a multi-GB CSV or log
+does not survive. A window is instead sliced out of a memory-mapped file,
+so reading one costs the size of the window whatever the size of the file.
+
+Line windows need the byte offset where a line starts. ``LineIndex`` keeps
+the number of newlines before every ``INDEX_STRIDE`` bytes of a file: it is
+built lazily, only as far as the windows read so far needed (to the end
+for windows counted from the end), and a line is then found by splitting
+the one stride it falls in. Indexes are cached per file by ``LineIndexCache``
+and extended, not rebuilt, when a file was only appended to (logs).
+"""
+import bisect
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from zasper_py.services.content.notebookCache import stat_key
+
+# bytes of file between two entries of a line index
+INDEX_STRIDE = 256 * 1024
+
+# bytes compared to tell an appended file from a rewritten one
+TAIL_SIZE = 4096
+
+# largest window returned, in bytes; longer windows are truncated
+MAX_WINDOW_BYTES = 4 * 1024 * 1024
+
+# largest line window, in lines
+MAX_WINDOW_LINES = 10000
+
+
+class LineIndex:
+    """Sparse index of the line starts of a file.
+
+    ``counts[k]`` is the number of newlines before byte ``k * INDEX_STRIDE``;
+    the file is indexed up to ``scanned`` bytes.
+    """
+
+    def __init__(self, key: tuple, size: int):
+        self.key = key
+        self.size = size
+        self.counts: List[int] = [0]
+        self.scanned = 0
+        self.tail = b""
+        self.lock = threading.Lock()
+
+    @property
+    def complete(self) -> bool:
+        return self.scanned >= self.size
+
+    def total_lines(self, mm: Optional[mmap.mmap]) -> int:
+        """Number of lines of the file, the last one may lack a newline."""
+        self.extend(mm)
+        newlines = self.counts[-1]
+        if self.size and mm[self.size - 1:self.size] != b"\n":
+            return newlines + 1
+        return newlines
+
+    def extend(self, mm: Optional[mmap.mmap], newlines: Optional[int] = None) -> None:
+        """Index the file until ``newlines`` newlines are indexed, or to the end."""
+        if self.scanned >= self.size or (newlines is not None and self.counts[-1] >= newlines):
+            return
+        while self.scanned < self.size and (newlines is None or self.counts[-1] < newlines):
+            end = min(self.scanned + INDEX_STRIDE, self.size)
+            self.counts.append(self.counts[-1] + mm[self.scanned:end].count(b"\n"))
+            self.scanned = end
+        self.tail = mm[max(0, self.scanned - TAIL_SIZE):self.scanned]
+
+    def grow(self, mm: mmap.mmap, key: tuple, size: int) -> bool:
+        """Follow a file that was appended to. Returns False if it was
+        rewritten instead, or shrank."""
+        if size < self.size or key[0] != self.key[0]:
+            return False
+        if mm[self.scanned - len(self.tail):self.scanned] != self.tail:
+            return False
+        if self.scanned % INDEX_STRIDE:
+            # the last stride was partial, it is counted again
+            self.counts.pop()
+            self.scanned -= self.scanned % INDEX_STRIDE
+            self.tail = b""
+        self.key, self.size = key, size
+        return True
+
+    def line_offset(self, mm: Optional[mmap.mmap], line: int) -> int:
+        """Byte offset where ``line`` (from 0) starts, the size of the file
+        for lines past its end."""
+        if line <= 0:
+            return 0
+        self.extend(mm, newlines=line)
+        if self.counts[-1] < line:
+            return self.size
+        # the stride holding the line-th newline
+        k = bisect.bisect_left(self.counts, line) - 1
+        start = k * INDEX_STRIDE
+        chunk = mm[start:min(start + INDEX_STRIDE, self.size)]
+        rest = chunk.split(b"\n", line - self.counts[k])[-1]
+        return start + len(chunk) - len(rest)
+
+
+class LineIndexCache:
+    """Bounded LRU of line indexes keyed on the OS path of the file."""
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, LineIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, os_path: str, st: os.stat_result, mm: Optional[mmap.mmap]) -> LineIndex:
+        """The index of ``os_path``, at its version ``st``."""
+        key = stat_key(st)
+        with self._lock:
+            index = self._entries.get(os_path)
+            if index is not None:
+                self._entries.move_to_end(os_path)
+        if index is not None and index.key != key:
+            with index.lock:
+                if index.key != key and not index.grow(mm, key, st.st_size):
+                    index = None
+        if index is None:
+            index = LineIndex(key, st.st_size)
+            with self._lock:
+                self._entries[os_path] = index
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return index
+
+    def invalidate(self, os_path: str, recursive: bool = False) -> None:
+        """Drop ``os_path``, and with ``recursive`` every index below it."""
+        with self._lock:
+            self._entries.pop(os_path, None)
+            if recursive:
+                prefix = os_path.rstrip(os.sep) + os.sep
+                for path in [p for p in self._entries if p.startswith(prefix)]:
+                    del self._entries[path]
+
+
+def _utf8_start(data: bytes) -> int:
+    """Bytes to skip at the start of ``data`` to start on a character."""
+    skip = 0
+    while skip < min(3, len(data)) and 0x80 <= data[skip] < 0xC0:
+        skip += 1
+    return skip
+
+
+def _utf8_end(data: bytes) -> int:
+    """Length of ``data`` without a character cut at its end."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte < 0x80:
+            return len(data)
+        if byte >= 0xC0:
+            # lead byte of a sequence of this many bytes
+            need = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return len(data) if back >= need else len(data) - back
+    return len(data)
+
+
+def read_window(
+        os_path: str,
+        index_cache: LineIndexCache,
+        offset: int = 0,
+        lines: Optional[int] = None,
+        length: Optional[int] = None,
+        from_end: bool = False,
+        max_bytes: int = MAX_WINDOW_BYTES,
+) -> Dict[str, Any]:
+    """A window of the text file at ``os_path``.
+
+    With ``lines``, the window is ``lines`` lines starting at line
+    ``offset``; otherwise it is ``length`` bytes (``max_bytes`` if not
+    given) starting at byte ``offset``. With ``from_end``, ``offset``
+    counts back from the end of the file: the window ends ``offset`` lines
+    (or bytes) before it. Windows are cut to whole UTF-8 characters and at
+    most ``max_bytes``; bytes that are not UTF-8 are replaced.
+    """
+    with open(os_path, "rb") as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        if size == 0:
+            mm = None
+        else:
+            mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            return _read_window(os_path, index_cache, st, mm, offset, lines, length, from_end, max_bytes)
+        finally:
+            if mm is not None:
+                mm.close()
+
+
+def _read_window(os_path, index_cache, st, mm, offset, lines, length, from_end, max_bytes):
+    size = st.st_size
+    model = {"size": size, "from_end": from_end}
+    if lines is not None:
+        index = index_cache.get(os_path, st, mm)
+        with index.lock:
+            if from_end:
+                total = index.total_lines(mm)
+                first = max(0, total - offset - lines)
+                lines = max(0, min(lines, total - offset - first))
+            else:
+                first = offset
+            start = index.line_offset(mm, first)
+            end = index.line_offset(mm, first + lines)
+            if index.complete:
+                model["total_lines"] = index.total_lines(mm)
+        model["start_line"] = first
+    else:
+        length = max_bytes if length is None else length
+        if from_end:
+            end = max(0, size - offset)
+            start = max(0, end - length)
+        else:
+            start = min(offset, size)
+            end = min(start + length, size)
+    truncated = end - start > max_bytes
+    if truncated:
+        end = start + max_bytes
+    data = mm[start:end] if mm is not None else b""
+    if lines is None:
+        # byte windows are cut at characters, line windows start on one
+        skip = _utf8_start(data)
+        data = data[skip:]
+        start += skip
+    if (truncated or lines is None) and end < size:
+        data = data[:_utf8_end(data)]
+    end = start + len(data)
+    content = data.decode("utf8", errors="replace")
+    model.update({
+        "offset": start,
+        "length": len(data),
+        "lines": content.count("\n") + (1 if content and not content.endswith("\n") else 0),
+        "truncated": truncated,
+        "eof": end >= size,
+        "format": "text",
+        "content": content,
+    })
+    return model
@@ -0,0 +1,83 @@
+"""Uploads written chunk by chunk to a temp file, then renamed into place."""
+import os
+from typing import BinaryIO, Optional
+
+from tornado import web
+
+
+def path_to_upload(path):
+    """Name of the temp file an upload is appended to until its last chunk.
+
+    The .~ prefix will make Dropbox ignore the temporary file."""
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, ".~" + basename + ".upload")
+
+
+class ChunkedUpload:
+    """An upload to ``os_path`` in progress.
+
+    Chunks are appended to a sibling temp file, so an interrupted upload
+    leaves the target untouched and can be resumed from ``offset``. The
+    temp file replaces the target atomically on ``commit``.
+    """
+
+    def __init__(self, os_path: str):
+        self.os_path = os_path
+        self.tmp_path = path_to_upload(os_path)
+        self._file: Optional[BinaryIO] = None
+
+    @property
+    def offset(self) -> int:
+        """Number of bytes received so far."""
+        if self._file is not None:
+            return self._file.tell()
+        try:
+            return os.path.getsize(self.tmp_path)
+        except OSError:
+            return 0
+
+    def open(self, offset: int = 0) -> "ChunkedUpload":
+        """Open the temp file to append from ``offset``.
+
+        Offset 0 (re)starts the upload. Any other offset must match the
+        number of bytes already received, otherwise 409 is raised with the
+        offset to resume from.
+        """
+        if offset == 0:
+            self._file = open(self.tmp_path, "wb")  # noqa: SIM115
+            return self
+        current = self.offset
+        if offset != current:
+            raise web.HTTPError(
+                409,
+                f"Upload offset mismatch for {os.path.basename(self.os_path)}: "
+                f"got {offset}, expected {current}",
+            )
+        self._file = open(self.tmp_path, "ab")  # noqa: SIM115
+        return self
+
+    def write(self, data: bytes) -> None:
+        assert self._file is not None
+        self._file.write(data)
+
+    def close(self) -> None:
+        """Close the temp file, keeping it so the upload can be resumed."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def commit(self) -> None:
+        """Flush the received bytes to disk and move them over the target."""
+        assert self._file is not None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.close()
+        os.replace(self.tmp_path, self.os_path)
+
+    def abort(self) -> None:
+        """Drop the upload and its temp file."""
+        self.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
@@ -17,6 +17,7 @@ import zmq
 import zmq.asyncio
 from zmq import Message
 
+from zasper_backend.utils import jsonCodec
 from zasper_backend.utils.adapter import adapt
 from zasper_backend.utils.jsonutil import json_clean, squash_dates, json_default, extract_dates
 from zasper_backend.utils.timeUtils import utcnow
@@ -63,12 +64,7 @@ MAX_BYTES = 1024
 def json_packer(obj: t.Any) -> bytes:
     """Convert a json object to a bytes."""
     try:
-        return json.dumps(
-            obj,
-            default=json_default,
-            ensure_ascii=False,
-            allow_nan=False,
-        ).encode("utf8", errors="surrogateescape")
+        return jsonCodec.encode(obj, allow_nan=False)
     except (TypeError, ValueError) as e:
         # Fallback to trying to clean the json before serializing
         packed = json.dumps(
@@ -90,9 +86,7 @@ def json_packer(obj: t.Any) -> bytes:
 
 def json_unpacker(s: str | bytes) -> t.Any:
     """Convert a json bytes or string to an object."""
-    if isinstance(s, bytes):
-        s = s.decode("utf8", "replace")
-    return json.loads(s)
+    return jsonCodec.decode(s)
 
 
 def pickle_packer(o: t.Any) -> bytes:
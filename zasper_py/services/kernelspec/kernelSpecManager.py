@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import os
@@ -5,6 +6,7 @@ import re
 import shutil
 import typing as t
 import warnings
+from datetime import datetime, timezone
 
 from zasper_py.core.paths import (SYSTEM_JUPYTER_PATH, jupyter_data_dir,
                                        jupyter_path)
@@ -177,6 +179,33 @@ class KernelSpecManager:
                 print("Error loading kernelspec %r", kname)
         return res
 
+    def get_specs_etag(self) -> tuple[str, datetime | None]:
+        """Validators of the ``get_all_specs`` result, from stat calls only.
+
+        Returns ``(etag, last_modified)``, ``last_modified`` is None if no
+        kernel directory exists. The kernel directories are stat'ed (their
+        mtime changes when a kernelspec is added or removed), then each
+        resource directory (logos, resources) and its ``kernel.json``.
+        """
+        h = hashlib.sha1()
+        last_modified = 0.0
+        paths = list(self.kernel_dirs)
+        for resource_dir in self.find_kernel_specs().values():
+            paths += [resource_dir, pjoin(resource_dir, "kernel.json")]
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                h.update(f"{path}\0-\0".encode("utf8", "surrogateescape"))
+                continue
+            h.update(
+                f"{path}\0{st.st_ino}:{st.st_size}:{st.st_mtime_ns}\0".encode("utf8", "surrogateescape")
+            )
+            last_modified = max(last_modified, st.st_mtime)
+        if not last_modified:
+            return '"%s"' % h.hexdigest(), None
+        return '"%s"' % h.hexdigest(), datetime.fromtimestamp(last_modified, tz=timezone.utc)
+
     def remove_kernel_spec(self, name: str) -> str:
         """Remove a kernel spec directory by name.
 
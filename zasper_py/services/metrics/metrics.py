@@ -1,4 +1,4 @@
-from prometheus_client import Gauge, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 HTTP_REQUEST_DURATION_SECONDS = Histogram(
     "http_request_duration_seconds",
@@ -16,3 +16,88 @@ KERNEL_CURRENTLY_RUNNING_TOTAL = Gauge(
     "counter for how many kernels are running labeled by type",
     ["type"],
 )
+
+NOTEBOOK_CACHE_HITS_TOTAL = Counter(
+    "notebook_cache_hits_total",
+    "counter for notebook reads served from the parsed-notebook cache",
+)
+
+NOTEBOOK_CACHE_MISSES_TOTAL = Counter(
+    "notebook_cache_misses_total",
+    "counter for notebook reads that had to parse the file",
+)
+
+NOTEBOOK_CACHE_BYTES = Gauge(
+    "notebook_cache_bytes",
+    "on-disk size of the notebooks held in the parsed-notebook cache",
+)
+
+CONTENTS_EXECUTOR_QUEUE_DEPTH = Gauge(
+    "contents_executor_queue_depth",
+    "number of contents operations waiting for a worker thread",
+)
+
+CONTENTS_EXECUTOR_WAIT_SECONDS = Histogram(
+    "contents_executor_wait_seconds",
+    "time contents operations spend queued before a worker thread picks them up",
+)
+
+CONTENTS_OPERATION_DURATION_SECONDS = Histogram(
+    "contents_operation_duration_seconds",
+    "duration in seconds of contents operations on the worker threads",
+    ["operation"],
+)
+
+CONTENTS_SAVES_COALESCED_TOTAL = Counter(
+    "contents_saves_coalesced_total",
+    "counter for saves superseded by a later save of the same path before being written",
+)
+
+CONTENTS_GROUP_COMMIT_SIZE = Histogram(
+    "contents_group_commit_size",
+    "number of files written by one group commit",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+CONTENTS_FSYNC_SECONDS = Histogram(
+    "contents_fsync_seconds",
+    "time in seconds spent syncing saved files to disk, per save or group commit",
+    ["mode"],
+)
+
+HTTP_COMPRESSION_RATIO = Histogram(
+    "http_compression_ratio",
+    "uncompressed over compressed size of compressed HTTP response bodies",
+    ["handler", "encoding"],
+    buckets=(1, 1.5, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+
+HTTP_COMPRESSION_CPU_SECONDS = Histogram(
+    "http_compression_cpu_seconds",
+    "CPU time in seconds spent compressing one HTTP response body",
+    ["handler", "encoding"],
+)
+
+HTTP_COMPRESSION_INPUT_BYTES_TOTAL = Counter(
+    "http_compression_input_bytes_total",
+    "counter for bytes of HTTP response bodies before compression",
+    ["handler", "encoding"],
+)
+
+HTTP_COMPRESSION_OUTPUT_BYTES_TOTAL = Counter(
+    "http_compression_output_bytes_total",
+    "counter for bytes of HTTP response bodies after compression",
+    ["handler", "encoding"],
+)
+
+CONTENTS_BATCH_OPERATIONS_TOTAL = Counter(
+    "contents_batch_operations_total",
+    "counter for operations of batches by operation and status (ok, error, skipped)",
+    ["op", "status"],
+)
+
+CONTENTS_COPY_BYTES_TOTAL = Counter(
+    "contents_copy_bytes_total",
+    "counter for bytes of files copied, by copy method (reflink, copy_file_range, sendfile, read)",
+    ["method"],
+)
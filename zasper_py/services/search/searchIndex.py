@@ -0,0 +1,475 @@
+"""Full-text search over the files served by ContentsManager.
+
+Documents are kept in a SQLite FTS5 table with the trigram tokenizer, so
+any substring of three characters or more is looked up in the index rather
+than by scanning files. A notebook is indexed as one document per cell
+source and one per cell's text outputs; any other text file is one
+document. The index lives on disk and is kept current by a background
+thread, from the paths ContentsManager reports as written, renamed or
+deleted and from an inotify watch on every indexed directory, through the
+SharedWatcher ContentsManager shares with its other services. Directories
+that could not be watched (no inotify, or ``max_user_watches`` reached) are
+listed again every ``RESCAN_INTERVAL`` seconds instead.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from tornado import web
+
+from zasper_py.services.content.fileWatcher import IN_Q_OVERFLOW, SharedWatcher
+
+logger = logging.getLogger(__name__)
+
+# files larger than this are not indexed
+MAX_FILE_SIZE = 2 * 1024 ** 2
+MAX_NOTEBOOK_SIZE = 20 * 1024 ** 2
+
+# directories never indexed, on top of hidden ones
+SKIP_DIRS = {"node_modules", "__pycache__"}
+
+# output mimetypes whose text is indexed
+OUTPUT_MIMETYPES = ("text/plain", "text/markdown", "text/latex")
+
+# seconds between two passes of the indexer over the changed paths
+POLL_INTERVAL = 0.25
+
+# seconds between two rescans of the directories without an inotify watch
+RESCAN_INTERVAL = 30.0
+
+# document rowids are file_id << ROWID_SHIFT | document number, so the
+# documents of a file are one rowid range
+ROWID_SHIFT = 20
+
+MIN_QUERY_LENGTH = 3
+MAX_MATCHES_PER_DOCUMENT = 20
+
+
+def _text(source: Any) -> str:
+    return "".join(source) if isinstance(source, list) else (source or "")
+
+
+def extract_documents(path: str, data: bytes) -> Iterator[Tuple[Optional[int], str, str]]:
+    """Yield the ``(cell, kind, text)`` documents of a file.
+
+    ``kind`` is "source" or "output" for notebook cells, "text" for other
+    files. Binary and undecodable files have no documents.
+    """
+    if path.endswith(".ipynb"):
+        try:
+            nb = json.loads(data)
+        except ValueError:
+            return
+        for i, cell in enumerate(nb.get("cells", [])):
+            source = _text(cell.get("source"))
+            if source:
+                yield i, "source", source
+            outputs = []
+            for output in cell.get("outputs", []):
+                if "text" in output:
+                    outputs.append(_text(output["text"]))
+                elif "traceback" in output:
+                    outputs.append("\n".join(output["traceback"]))
+                for mimetype in OUTPUT_MIMETYPES:
+                    if mimetype in output.get("data", {}):
+                        outputs.append(_text(output["data"][mimetype]))
+            if outputs:
+                yield i, "output", "\n".join(outputs)
+        return
+
+    if b"\0" in data[:8192]:
+        return
+    try:
+        yield None, "text", data.decode("utf-8")
+    except UnicodeDecodeError:
+        return
+
+
+def _matches(body: str, query: str) -> List[Dict[str, Any]]:
+    """Line and column (1-based) of each case-insensitive hit of ``query``."""
+    haystack, needle = body.lower(), query.lower()
+    matches = []
+    line, line_start = 1, 0
+    start = haystack.find(needle)
+    while start >= 0 and len(matches) < MAX_MATCHES_PER_DOCUMENT:
+        line += haystack.count("\n", line_start, start)
+        line_start = haystack.rfind("\n", 0, start) + 1
+        line_end = body.find("\n", start)
+        matches.append({
+            "line": line,
+            "column": start - line_start + 1,
+            "text": body[line_start:line_end if line_end >= 0 else len(body)][:200],
+        })
+        start = haystack.find(needle, start + len(needle))
+    return matches
+
+
+class SearchIndex:
+    """On-disk trigram index of the text files under ``root_dir``.
+
+    ``start`` runs the indexer thread: it first reconciles the index with
+    the disk (only files whose mtime or size changed are read), then
+    re-indexes whatever ``invalidate`` or the inotify watches report.
+    """
+
+    def __init__(
+            self,
+            root_dir: str,
+            database_filepath: str = ":memory:",
+            use_inotify: bool = True,
+            watcher: Optional[SharedWatcher] = None,
+    ):
+        self.root_dir = os.path.abspath(root_dir)
+        self.database_filepath = database_filepath
+        self.max_file_size = MAX_FILE_SIZE
+        self.max_notebook_size = MAX_NOTEBOOK_SIZE
+        self._lock = threading.Lock()
+        self._connection = None
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        # directories rescanned every RESCAN_INTERVAL, only used by the indexer thread
+        self._unwatched = set()
+        # the watcher may be shared with other services, it is only closed
+        # by close() if it was created here
+        self._owns_watcher = watcher is None
+        if watcher is None and use_inotify:
+            watcher = SharedWatcher()
+        self.watcher = watcher
+
+    @property
+    def connection(self):
+        """Start a database connection and create the index tables"""
+        if self._connection is None:
+            if self.database_filepath != ":memory:":
+                os.makedirs(os.path.dirname(self.database_filepath), exist_ok=True)
+            # Set isolation level to None to autocommit all changes to the database.
+            self._connection = sqlite3.connect(
+                self.database_filepath, isolation_level=None, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # the index can be rebuilt from the files: don't fsync every commit
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS files
+                (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime_ns INTEGER, size INTEGER)"""
+            )
+            self._connection.execute(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5
+                (cell UNINDEXED, kind UNINDEXED, body, tokenize='trigram')"""
+            )
+        return self._connection
+
+    # indexing
+
+    def start(self) -> None:
+        """Start indexing in the background."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="search-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.watcher is not None:
+            self.watcher.unsubscribe(self._on_events)
+        self._unwatched.clear()
+
+    def invalidate(self, os_path: str, recursive: bool = False) -> None:
+        """Re-index ``os_path`` (a file or a directory) soon."""
+        path = self._api_path(os_path)
+        if path is not None:
+            with self._dirty_lock:
+                self._dirty.add(path)
+
+    def _api_path(self, os_path: str) -> Optional[str]:
+        relpath = os.path.relpath(os_path, self.root_dir)
+        if relpath == os.curdir:
+            return ""
+        if relpath.startswith(os.pardir):
+            return None
+        return relpath.replace(os.sep, "/")
+
+    def _on_events(self, events) -> None:
+        for event in events:
+            if event.mask & IN_Q_OVERFLOW:
+                self.invalidate(self.root_dir)
+            else:
+                self.invalidate(os.path.join(event.os_dir, event.name))
+
+    def _run(self) -> None:
+        if self.watcher is not None:
+            self.watcher.subscribe(self._on_events)
+        try:
+            self._crawl("")
+        except Exception:
+            logger.exception("Search index crawl failed")
+        next_rescan = time.monotonic() + RESCAN_INTERVAL
+        while not self._stopped.is_set():
+            self._stopped.wait(POLL_INTERVAL)
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, set()
+            if "" in dirty:
+                dirty = {""}
+            # a directory crawl covers every path below it
+            for path in sorted(dirty):
+                if any(path.startswith(parent + "/") for parent in dirty if parent and parent != path):
+                    continue
+                try:
+                    self._refresh(path)
+                except Exception:
+                    logger.exception("Failed to index %s", path)
+            if self._unwatched and time.monotonic() >= next_rescan:
+                self._rescan_unwatched()
+                next_rescan = time.monotonic() + RESCAN_INTERVAL
+
+    def _rescan_unwatched(self) -> None:
+        """Index what changed in the directories without a watch."""
+        for path in sorted(self._unwatched):
+            if self._stopped.is_set():
+                return
+            if path not in self._unwatched:
+                # removed with a parent
+                continue
+            if not os.path.isdir(self._os_path(path)):
+                self._unwatched.difference_update(
+                    [p for p in self._unwatched if p == path or p.startswith(path + "/")]
+                )
+                self.invalidate(self._os_path(path))
+                continue
+            try:
+                self._crawl(path, recursive=False)
+            except Exception:
+                logger.exception("Failed to rescan %s", path)
+
+    def _os_path(self, path: str) -> str:
+        return os.path.join(self.root_dir, *path.split("/")) if path else self.root_dir
+
+    def _refresh(self, path: str) -> None:
+        try:
+            st = os.stat(self._os_path(path))
+        except OSError:
+            self._remove(path)
+            return
+        if os.path.isdir(self._os_path(path)):
+            self._crawl(path)
+        elif not self._skipped(path):
+            self._index_file(path, st)
+
+    @staticmethod
+    def _skipped(path: str) -> bool:
+        return any(name.startswith(".") or name in SKIP_DIRS for name in path.split("/"))
+
+    def _tracked(self, path: str) -> bool:
+        """Is the directory ``path`` watched, or rescanned?"""
+        if path in self._unwatched:
+            return True
+        return self.watcher is not None and self.watcher.is_watched(self._os_path(path), self._on_events)
+
+    def _crawl(self, path: str, recursive: bool = True) -> None:
+        """Bring the index of the directory ``path`` in line with the disk.
+
+        Without ``recursive``, only the entries of ``path`` are checked:
+        its subdirectories are left to their own watch or rescan, unless
+        they are new.
+        """
+        if path and self._skipped(path):
+            return
+        indexed = {
+            row[0]: (row[1], row[2])
+            for row in self._select_below(path, "SELECT path, mtime_ns, size FROM files")
+        }
+        seen = set()
+        # subdirectories not rescanned, whose files are not gone
+        kept = set()
+        stack = [path]
+        while stack:
+            dir_path = stack.pop()
+            os_dir = self._os_path(dir_path)
+            if recursive or dir_path != path:
+                if self.watcher is not None and self.watcher.add_watch(os_dir, self._on_events):
+                    self._unwatched.discard(dir_path)
+                else:
+                    self._unwatched.add(dir_path)
+            try:
+                entries = list(os.scandir(os_dir))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith(".") or entry.name in SKIP_DIRS:
+                    continue
+                entry_path = f"{dir_path}/{entry.name}" if dir_path else entry.name
+                try:
+                    if entry.is_dir():
+                        if not recursive and dir_path == path and self._tracked(entry_path):
+                            kept.add(entry_path)
+                        else:
+                            stack.append(entry_path)
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                seen.add(entry_path)
+                if indexed.get(entry_path) != (st.st_mtime_ns, st.st_size):
+                    self._index_file(entry_path, st)
+        prefix = path + "/" if path else ""
+        for gone in set(indexed) - seen:
+            if kept and prefix + gone[len(prefix):].split("/", 1)[0] in kept:
+                continue
+            self._remove(gone)
+
+    def _select_below(self, path: str, query: str) -> List[tuple]:
+        with self._lock:
+            return self._below(self.connection, path, query)
+
+    @staticmethod
+    def _below(db, path: str, query: str) -> List[tuple]:
+        """Run ``query`` on the rows of ``files`` at or below ``path``."""
+        if not path:
+            return db.execute(query).fetchall()
+        # the paths below "a/b" sort between "a/b/" and "a/b0"
+        return db.execute(
+            query + " WHERE path=? OR (path>=? AND path<?)", (path, path + "/", path + "0")
+        ).fetchall()
+
+    def _index_file(self, path: str, st: os.stat_result) -> None:
+        limit = self.max_notebook_size if path.endswith(".ipynb") else self.max_file_size
+        documents = []
+        if st.st_size <= limit:
+            try:
+                with open(self._os_path(path), "rb") as f:
+                    data = f.read()
+            except OSError:
+                return
+            documents = list(extract_documents(path, data))
+        with self._lock:
+            db = self.connection
+            db.execute("BEGIN")
+            try:
+                db.execute(
+                    """INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET mtime_ns=excluded.mtime_ns, size=excluded.size""",
+                    (path, st.st_mtime_ns, st.st_size),
+                )
+                (file_id,) = db.execute("SELECT id FROM files WHERE path=?", (path,)).fetchone()
+                self._delete_documents(db, file_id)
+                db.executemany(
+                    "INSERT INTO docs (rowid, cell, kind, body) VALUES (?, ?, ?, ?)",
+                    [
+                        ((file_id << ROWID_SHIFT) + n, cell, kind, body)
+                        for n, (cell, kind, body) in enumerate(documents[: 1 << ROWID_SHIFT])
+                    ],
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _delete_documents(db, file_id: int) -> None:
+        db.execute(
+            "DELETE FROM docs WHERE rowid>=? AND rowid<?",
+            (file_id << ROWID_SHIFT, (file_id + 1) << ROWID_SHIFT),
+        )
+
+    def _remove(self, path: str) -> None:
+        """Drop the file ``path``, or every file below the directory ``path``."""
+        with self._lock:
+            db = self.connection
+            db.execute("BEGIN")
+            try:
+                self._remove_below(db, path)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _remove_below(self, db, path: str) -> None:
+        for (file_id,) in self._below(db, path, "SELECT id FROM files"):
+            self._delete_documents(db, file_id)
+            db.execute("DELETE FROM files WHERE id=?", (file_id,))
+
+    def rename(self, old_os_path: str, new_os_path: str) -> None:
+        """Move the entries of ``old_os_path`` (and below it) to
+        ``new_os_path`` without reading the files again."""
+        old_path, new_path = self._api_path(old_os_path), self._api_path(new_os_path)
+        if not old_path or not new_path:
+            return
+        with self._lock:
+            db = self.connection
+            db.execute("BEGIN")
+            try:
+                moved = self._below(db, old_path, "SELECT id, path FROM files")
+                if moved:
+                    # unless the indexer got to it first, in which case
+                    # there is nothing left under the old path
+                    self._remove_below(db, new_path)
+                db.executemany(
+                    "UPDATE files SET path=? WHERE id=?",
+                    [(new_path + path[len(old_path):], file_id) for file_id, path in moved],
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    # querying
+
+    def search(
+            self,
+            query: str,
+            path: str = "",
+            kinds: Optional[List[str]] = None,
+            limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """Best matching documents for the substring ``query``.
+
+        Each hit has the ``path`` of the file, the ``cell`` index for
+        notebooks, the ``kind`` of document and the line, column and text
+        of the ``matches`` in it. ``path`` restricts the search to a
+        directory, ``kinds`` to some kinds of document.
+        """
+        if len(query) < MIN_QUERY_LENGTH:
+            raise web.HTTPError(
+                400, f"Search query must be at least {MIN_QUERY_LENGTH} characters"
+            )
+        sql = (
+            "SELECT files.path, docs.cell, docs.kind, docs.body FROM docs"
+            " JOIN files ON files.id = docs.rowid >> %d WHERE docs MATCH ?" % ROWID_SHIFT
+        )
+        args: List[Any] = ['"%s"' % query.replace('"', '""')]
+        path = path.strip("/")
+        if path:
+            sql += " AND (files.path=? OR substr(files.path, 1, ?)=?)"
+            args += [path, len(path) + 1, path + "/"]
+        if kinds:
+            sql += " AND docs.kind IN (%s)" % ",".join("?" * len(kinds))
+            args += kinds
+        sql += " ORDER BY rank LIMIT ?"
+        args.append(limit)
+
+        start = time.monotonic()
+        with self._lock:
+            rows = self.connection.execute(sql, args).fetchall()
+        logger.debug("Search for %r: %d hits in %.1fms", query, len(rows), (time.monotonic() - start) * 1000)
+        return [
+            {"path": doc_path, "cell": cell, "kind": kind, "matches": _matches(body, query)}
+            for doc_path, cell, kind, body in rows
+        ]
+
+    def close(self) -> None:
+        self.stop()
+        if self.watcher is not None and self._owns_watcher:
+            self.watcher.close()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -1,9 +1,9 @@
-import json
 import struct
 from typing import List, Any
 
 from zasper_backend.services.kernels.session import Session
-from zasper_backend.utils.jsonutil import json_default, extract_dates
+from zasper_backend.utils import jsonCodec
+from zasper_backend.utils.jsonutil import extract_dates
 
 
 def serialize_binary_message(msg):
@@ -24,7 +24,7 @@ def serialize_binary_message(msg):
     # don't modify msg or buffer list in-place
     msg = msg.copy()
     buffers = list(msg.pop("buffers"))
-    bmsg = json.dumps(msg, default=json_default).encode("utf8")
+    bmsg = jsonCodec.encode(msg)
     buffers.insert(0, bmsg)
     nbufs = len(buffers)
     offsets = [4 * (nbufs + 1)]
@@ -55,7 +55,7 @@ def deserialize_binary_message(bmsg):
     bufs = []
     for start, stop in zip(offsets[:-1], offsets[1:]):
         bufs.append(bmsg[start:stop])
-    msg = json.loads(bufs[0].decode("utf8"))
+    msg = jsonCodec.decode(bufs[0])
     msg["header"] = extract_dates(msg["header"])
     msg["parent_header"] = extract_dates(msg["parent_header"])
     msg["buffers"] = bufs[1:]
@@ -1,5 +1,4 @@
 import asyncio
-import json
 import logging
 import time
 import weakref
@@ -14,8 +13,7 @@ from zasper_backend.services.websocketHandler.connection.base import BaseKernelW
     serialize_binary_message, serialize_msg_to_ws_v1
 import typing as t
 
-from zasper_backend.utils import ensure_async
-from zasper_backend.utils.jsonutil import json_default
+from zasper_backend.utils import ensure_async, jsonCodec
 
 logger = logging.getLogger(__name__)
 
@@ -436,7 +434,7 @@ class ZMQChannelsWebsocketConnection(BaseKernelWebsocketConnection):
             if isinstance(ws_msg, bytes):  # type:ignore[unreachable]
                 msg = deserialize_binary_message(ws_msg)  # type:ignore[unreachable]
             else:
-                msg = json.loads(ws_msg)
+                msg = jsonCodec.decode(ws_msg)
             msg_list = []
             channel = msg.pop("channel", None)
 
@@ -524,7 +522,7 @@ class ZMQChannelsWebsocketConnection(BaseKernelWebsocketConnection):
             buf = serialize_binary_message(msg)
             return buf
         else:
-            return json.dumps(msg, default=json_default)
+            return jsonCodec.encode_str(msg)
 
     def _on_zmq_reply(self, stream, msg_list):
         """Handle a zmq reply."""
@@ -624,7 +622,7 @@ class ZMQChannelsWebsocketConnection(BaseKernelWebsocketConnection):
             self.write_message(bin_msg, binary=True)
         else:
             err_msg["channel"] = "iopub"
-            self.write_message(json.dumps(err_msg, default=json_default))
+            self.write_message(jsonCodec.encode_str(err_msg))
 
     def _limit_rate(self, channel, msg, msg_list):
         """Limit the message rate on a channel."""
@@ -755,7 +753,7 @@ class ZMQChannelsWebsocketConnection(BaseKernelWebsocketConnection):
             self.write_message(bin_msg, binary=True)
         else:
             msg["channel"] = "iopub"
-            self.write_message(json.dumps(msg, default=json_default))
+            self.write_message(jsonCodec.encode_str(msg))
 
     def on_kernel_restarted(self):
         """Handle a kernel restart."""
@@ -25,6 +25,19 @@ def to_os_path(path: ApiPath, root: str = "") -> str:
     return os.path.normpath(path_)
 
 
+def to_api_path(os_path: str, root: str = "") -> ApiPath:
+    """Convert a filesystem path to an API path
+
+    If given, root will be removed from the path.
+    root must be a filesystem path already.
+    """
+    if os_path.startswith(root):
+        os_path = os_path[len(root) :]
+    parts = os_path.strip(os.path.sep).split(os.path.sep)
+    parts = [p for p in parts if p != ""]  # remove duplicate splits
+    return ApiPath("/".join(parts))
+
+
 def url_path_join(*pieces: str) -> str:
     """Join components of url into a relative url
 
@@ -0,0 +1,113 @@
+"""The JSON encoder and decoder of the API handlers and kernel sessions.
+
+orjson is used when it is installed, the stdlib ``json`` module otherwise.
+Either way objects JSON does not know are converted by ``codec_default``:
+datetimes and bytes as ``json_default`` does (ISO 8601 with a ``Z``,
+base64), pydantic models through ``.dict()``, and UUIDs, paths and enums
+to their string or value.
+
+Differences between the backends, for input the stdlib accepts:
+
+- NaN and infinities are encoded as ``null`` by orjson, unless
+  ``allow_nan`` is False: ``encode`` then raises ValueError like the stdlib;
+- integers over 64 bits and strings with lone surrogates make orjson fail,
+  and such objects are encoded by the stdlib instead.
+"""
+import enum
+import json
+import math
+import uuid
+from pathlib import PurePath
+from typing import Any, Union
+
+from zasper_py.utils.jsonutil import json_default
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+if orjson is not None:
+    # datetimes go through codec_default, to be formatted like json_default
+    ORJSON_OPTIONS = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY
+    )
+
+
+def codec_default(obj: Any) -> Any:
+    """default function for objects the encoder does not know."""
+    if hasattr(obj, "dict") and hasattr(obj, "__fields__"):
+        # pydantic model
+        return obj.dict()
+    if isinstance(obj, (uuid.UUID, PurePath)):
+        return str(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    return json_default(obj)
+
+
+def _stdlib_encode(obj: Any, allow_nan: bool = True) -> bytes:
+    return json.dumps(
+        obj, default=codec_default, ensure_ascii=False, allow_nan=allow_nan
+    ).encode("utf8", errors="surrogateescape")
+
+
+def _check_finite(obj: Any) -> None:
+    """Raise ValueError if ``obj`` holds a NaN or an infinity."""
+    if isinstance(obj, float):
+        if not math.isfinite(obj):
+            raise ValueError("Out of range float values are not JSON compliant: %r" % obj)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _check_finite(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            _check_finite(value)
+
+
+def encode(obj: Any, allow_nan: bool = True) -> bytes:
+    """Encode ``obj`` to UTF-8 JSON.
+
+    With ``allow_nan`` False, NaN and infinities raise ValueError instead
+    of being encoded (as ``NaN``/``Infinity`` by the stdlib, as ``null`` by
+    orjson).
+    """
+    if orjson is None:
+        return _stdlib_encode(obj, allow_nan)
+    try:
+        data = orjson.dumps(obj, default=codec_default, option=ORJSON_OPTIONS)
+    except TypeError:
+        # orjson.JSONEncodeError: see the module docstring
+        return _stdlib_encode(obj, allow_nan)
+    if not allow_nan and b"null" in data:
+        # orjson writes non-finite floats as null, only then look for them
+        _check_finite(obj)
+    return data
+
+
+def encode_str(obj: Any) -> str:
+    """Encode ``obj`` to a JSON string, e.g. for a websocket text frame."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=codec_default, option=ORJSON_OPTIONS).decode("utf8")
+        except TypeError:
+            pass
+    # ASCII only, so lone surrogates are escaped rather than unencodable
+    return json.dumps(obj, default=codec_default)
+
+
+def decode(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Decode JSON from bytes (UTF-8) or a string."""
+    if orjson is None:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf8", "replace")
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        if isinstance(data, str):
+            raise
+        # invalid UTF-8: decode what can be, as the stdlib path does
+        return json.loads(bytes(data).decode("utf8", "replace"))